@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field, conint
+from fastapi import APIRouter, Depends, HTTPException, File, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, confloat, conint
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import uuid
-from typing import List
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Optional
 
 from app.core.database import get_db
 from app.core.authz import require_role
+from app.core.chat_export import ExportFilter, InvalidImport, chat_exporter
+from app.core.retention import retention_engine
+from app.core.scheduler import fair_scheduler
 from app.models.config import GatewayConfig
 from app.models.user import User, Department
 
@@ -23,6 +28,7 @@ class ConfigUpdate(BaseModel):
     costAlertThresholdCents: conint(ge=0) | None = None
     featureDemoMode: bool | None = None
     enableAnalytics: bool | None = None
+    departmentWeights: Dict[str, confloat(gt=0, le=100)] | None = None
 
 
 class UserCreate(BaseModel):
@@ -49,6 +55,7 @@ def _to_dict(cfg: GatewayConfig) -> dict:
         "costAlertThresholdCents": cfg.cost_alert_threshold_cents,
         "featureDemoMode": cfg.feature_demo_mode,
         "enableAnalytics": cfg.enable_analytics,
+        "departmentWeights": cfg.department_weights or {},
     }
 
 
@@ -105,6 +112,8 @@ async def update_config(
         cfg.feature_demo_mode = payload.featureDemoMode
     if payload.enableAnalytics is not None:
         cfg.enable_analytics = payload.enableAnalytics
+    if payload.departmentWeights is not None:
+        cfg.department_weights = payload.departmentWeights
 
     # Provider keys (optional; avoid echoing back)
     # NOTE: At-Rest Encryption: replace assignment with envelope
@@ -116,6 +125,8 @@ async def update_config(
 
     await db.commit()
     await db.refresh(cfg)
+    # Other workers pick the weights up within SCHEDULER_WEIGHTS_TTL
+    fair_scheduler.invalidate_weights()
     return _to_dict(cfg)
 
 
@@ -268,3 +279,91 @@ async def delete_user(
     return {"message": "User deleted successfully"}
 
 
+# Retention
+@router.post("/retention/run", status_code=202)
+async def run_retention(
+    user=Depends(require_role("admin", "dpo")),
+):
+    """Purge data past the configured retention in the background"""
+    retention_engine.schedule_run()
+    return {"message": "Retention run started"}
+
+
+@router.get("/retention/runs")
+async def get_retention_runs(
+    db: AsyncSession = Depends(get_db),
+    user=Depends(require_role("admin", "dpo")),
+):
+    """Recent retention runs with rows deleted per table"""
+    runs = await retention_engine.recent_runs(db)
+    return [
+        {
+            "id": str(run.id),
+            "trigger": run.trigger,
+            "status": run.status,
+            "cutoff": run.cutoff.isoformat() if run.cutoff else None,
+            "deleted": run.deleted or {},
+            "error": run.error,
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        }
+        for run in runs
+    ]
+
+
+# Chat history export / import
+@router.get("/export/threads")
+async def export_threads(
+    user_id: Optional[str] = Query(None),
+    department: Optional[str] = Query(None, description="Department key or id"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD), inclusive"),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(require_role("admin", "dpo")),
+):
+    """Stream threads and messages as gzip-compressed NDJSON"""
+    filters = ExportFilter()
+    try:
+        if user_id:
+            filters.user_id = uuid.UUID(user_id)
+        if start_date:
+            filters.start = datetime.combine(
+                datetime.strptime(start_date, "%Y-%m-%d").date(), time.min, tzinfo=timezone.utc
+            )
+        if end_date:
+            filters.end = datetime.combine(
+                datetime.strptime(end_date, "%Y-%m-%d").date() + timedelta(days=1), time.min, tzinfo=timezone.utc
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user ID or date (YYYY-MM-DD)")
+    if department:
+        try:
+            condition = Department.id == uuid.UUID(department)
+        except ValueError:
+            condition = Department.key == department
+        dept = (await db.execute(select(Department).where(condition))).scalar_one_or_none()
+        if not dept:
+            raise HTTPException(status_code=404, detail="Department not found")
+        filters.department_id = dept.id
+
+    filename = f"chat-export-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.ndjson.gz"
+    return StreamingResponse(
+        chat_exporter.export(filters),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/import/threads")
+async def import_threads(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(require_role("admin")),
+):
+    """Load a chat export (gzip NDJSON) in one transaction"""
+    try:
+        return await chat_exporter.import_threads(db, file)
+    except InvalidImport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import threads: {str(e)}")
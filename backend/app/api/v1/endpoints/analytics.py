@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, join
+from sqlalchemy import select, func, and_, join, literal_column
 
 from app.core.database import get_db
 from app.models.chat import Thread, Message
@@ -24,52 +24,73 @@ async def get_analytics(
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get comprehensive analytics data"""
+    """Get comprehensive analytics data
+    
+    `overview.totalMessages` is the all-time count, as before. Daily,
+    per-assistant and token figures and `overview.windowMessages` cover the
+    window [start_date, end_date] (default: the last 7 days); bounding
+    created_at lets Postgres prune to the monthly partitions of the window.
+    """
     try:
-        # Parse date range (currently not used but kept for future use)
-        # if start_date:
-        #     start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        # else:
-        #     start_dt = datetime.now() - timedelta(days=30)
-        # if end_date:
-        #     end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-        # else:
-        #     end_dt = datetime.now()
-
-        # Totals
-        total_messages_result = await db.execute(
-            select(func.count(Message.id))
-        )
-        total_messages = total_messages_result.scalar_one() or 0
+        try:
+            today = datetime.now(timezone.utc).date()
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+            start_day = (
+                datetime.strptime(start_date, "%Y-%m-%d").date()
+                if start_date
+                else end_day - timedelta(days=6)
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Dates must be YYYY-MM-DD",
+            )
+        if start_day > end_day:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="start_date must not be after end_date",
+            )
+        start_dt = datetime.combine(start_day, time.min, tzinfo=timezone.utc)
+        end_dt = datetime.combine(end_day + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        in_window = and_(Message.created_at >= start_dt, Message.created_at < end_dt)
 
         total_threads_result = await db.execute(
             select(func.count(Thread.id))
         )
         total_threads = total_threads_result.scalar_one() or 0
 
+        # All-time count from the per-thread counters, no scan of messages
+        total_messages = await db.scalar(
+            select(func.coalesce(func.sum(Thread.message_count), 0))
+        ) or 0
+
         total_assistants_result = await db.execute(
             select(func.count(Assistant.id))
         )
         total_assistants = total_assistants_result.scalar_one() or 0
 
-        # Daily usage (last 7 days)
-        daily_usage: list[DailyUsage] = []
-        for i in range(6, -1, -1):  # oldest first
-            day = (datetime.now() - timedelta(days=i)).date()
-            start_of_day = datetime.combine(day, datetime.min.time())
-            end_of_day = datetime.combine(day, datetime.max.time())
-
-            day_count_result = await db.execute(
-                select(func.count(Message.id)).where(
-                    and_(
-                        Message.created_at >= start_of_day,
-                        Message.created_at <= end_of_day,
-                    )
-                )
+        # Daily usage: one grouped query over the window's partitions
+        # Literals instead of bind parameters, so GROUP BY matches the select expression
+        day_column = func.date_trunc(
+            literal_column("'day'"), func.timezone(literal_column("'UTC'"), Message.created_at)
+        ).label("day")
+        day_rows = (await db.execute(
+            select(
+                day_column,
+                func.count().label("messages"),
+                func.coalesce(func.sum(Message.tokens_in + Message.tokens_out), 0).label("tokens"),
             )
-            day_messages = day_count_result.scalar_one() or 0
-            # Simplified token/cost calc (until we compute from columns)
-            day_tokens = day_messages * 150
+            .where(in_window)
+            .group_by(day_column)
+        )).all()
+        per_day = {row.day.date(): row for row in day_rows}
+
+        daily_usage: list[DailyUsage] = []
+        day = start_day
+        while day <= end_day:  # oldest first
+            row = per_day.get(day)
+            day_messages = row.messages if row else 0
+            day_tokens = int(row.tokens) if row else 0
             day_cost = round((day_tokens / 1000.0) * 0.002, 2)
             daily_usage.append(
                 DailyUsage(
@@ -79,6 +100,8 @@ async def get_analytics(
                     cost=day_cost,
                 )
             )
+            day += timedelta(days=1)
+        window_messages = sum(d.messages for d in daily_usage)
 
         # Usage by department (placeholder until departments are implemented)
         department_usage = [
@@ -114,17 +137,18 @@ async def get_analytics(
             ),
         ]
 
-        # Usage by assistant (join messages->threads by assistant_id)
+        # Usage by assistant: messages in the window grouped by their thread's assistant
+        per_assistant = dict((await db.execute(
+            select(Thread.assistant_id, func.count(Message.id))
+            .select_from(join(Message, Thread, Message.thread_id == Thread.id))
+            .where(in_window)
+            .group_by(Thread.assistant_id)
+        )).all())
         assistant_usage: list[AssistantUsage] = []
         assistants_rows = (await db.execute(select(Assistant.id, Assistant.name))).all()
         for asst_id, asst_name in assistants_rows:
-            msg_count_result = await db.execute(
-                select(func.count(Message.id)).select_from(
-                    join(Message, Thread, Message.thread_id == Thread.id)
-                ).where(Thread.assistant_id == asst_id)
-            )
-            msg_count = msg_count_result.scalar_one() or 0
-            percentage = round((msg_count / total_messages) * 100) if total_messages > 0 else 0
+            msg_count = per_assistant.get(asst_id, 0)
+            percentage = round((msg_count / window_messages) * 100) if window_messages > 0 else 0
             assistant_usage.append(
                 AssistantUsage(name=asst_name, messages=msg_count, percentage=percentage)
             )
@@ -166,6 +190,7 @@ async def get_analytics(
         return AnalyticsResponse(
             overview={
                 "totalMessages": total_messages,
+                "windowMessages": window_messages,
                 "totalTokens": total_tokens,
                 "totalCost": total_cost,
                 "avgLatency": 1250,
@@ -193,6 +218,8 @@ async def get_analytics(
             costs={"monthly": monthly_costs, "byModel": costs_by_model},
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Fallback: preserve prior behavior if DB fails
         raise HTTPException(
@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from datetime import datetime, timedelta
 
+from app.core.assistant_registry import assistant_registry
 from app.core.database import get_db
 from app.models.assistant import Assistant
 from app.models.chat import Thread
@@ -216,11 +217,16 @@ async def update_assistant(
             assistant.model = assistant_data.model
         if assistant_data.status is not None:
             assistant.status = assistant_data.status
+        if assistant_data.retrieval_config is not None:
+            assistant.retrieval_config = assistant_data.retrieval_config.model_dump()
         
         assistant.updated_at = datetime.now()
         
         await db.commit()
         await db.refresh(assistant)
+        # Also makes every worker rebuild its vector index in the background
+        # if the quantization changed
+        await assistant_registry.invalidate(db, assistant.id)
         
         # Get updated usage stats
         thread_count_result = await db.execute(
@@ -245,6 +251,7 @@ async def update_assistant(
             status=assistant.status,
             created_at=assistant.created_at,
             updated_at=assistant.updated_at,
+            retrieval_config=assistant.retrieval_config,
             usage_stats={
                 "total_threads": thread_count,
                 "active_users": active_users,
@@ -282,6 +289,7 @@ async def delete_assistant(
         
         await db.delete(assistant)
         await db.commit()
+        await assistant_registry.invalidate(db, assistant_id)
         
         return {"message": "Assistant deleted successfully"}
         
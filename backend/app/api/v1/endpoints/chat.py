@@ -1,14 +1,30 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Response
+from typing import List, Optional
+from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from hashlib import sha256
+from sqlalchemy import select
+import asyncio
 import logging
+import uuid
 
-from app.core.database import get_db
-from app.models.chat import Thread, Message
-from app.models.assistant import Assistant
+from app.core.assistant_registry import assistant_registry
+from app.core.authz import get_current_user
+from app.core.chat_persistence import (
+    count_round_trips,
+    load_thread_and_assistant,
+    record_turn,
+    turn_round_trips,
+    usage_from_result,
+)
+from app.core.chat_search import chat_search
+from app.core.config import settings
+from app.core.conversation_memory import conversation_memory
+from app.core.database import get_db, AsyncSessionLocal
+from app.core.message_codec import message_aad, message_codec, thread_field_aad
+from app.core.message_keys import key_ring
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset_after
+from app.core.scheduler import QueueTimeout, fair_scheduler
+from app.models.chat import Thread, Message, MessageSearch
 from app.models.user import User
 from app.schemas.chat import (
     ThreadCreate,
@@ -16,47 +32,42 @@ from app.schemas.chat import (
     MessageCreate,
     MessageResponse,
     ThreadListResponse,
+    SearchResultResponse,
 )
 from app.core.openai_client import openai_client
-# from app.core.training.context_manager import ContextManager  # Temporarily disabled
+from app.core.timing import StageTimer, chat_stage_stats
+from app.core.training.context_manager import context_manager
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Token budget for knowledge-base context in the instructions
+CHAT_CONTEXT_TOKENS = getattr(settings, "CHAT_CONTEXT_TOKENS", 1500)
+
 
 @router.post("/threads", response_model=ThreadResponse)
 async def create_thread(
     thread_data: ThreadCreate,
     db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
     """Create a new chat thread with optional OpenAI conversation"""
     try:
         # Verify assistant exists
-        asst_row = await db.execute(
-            select(Assistant).where(Assistant.id == thread_data.assistant_id)
-        )
-        assistant = asst_row.scalar_one_or_none()
+        assistant = await assistant_registry.get(db, thread_data.assistant_id)
         if not assistant:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
                 detail="Assistant not found"
             )
 
-        # Pick a user (local test): first user in DB
-        urow = await db.execute(select(User).order_by(User.created_at.asc()))
-        user = urow.scalars().first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, 
-                detail="No user available"
-            )
+        title = thread_data.title or f"Chat mit {assistant.name}"
 
         # Create OpenAI conversation if enabled
         conversation_id = None
         if assistant.model and assistant.model.startswith("gpt"):
             try:
                 # Create conversation with title
-                title = thread_data.title or f"Chat mit {assistant.name}"
                 conv_result = await openai_client.create_conversation(
                     title=title
                 )
@@ -68,11 +79,16 @@ async def create_thread(
                 )
                 # Continue without conversation (fallback to thread-only)
 
-        # Create thread (DB schema has no title/updated_at)
+        # Create thread with its own (wrapped) data key
+        thread_id = uuid.uuid4()
         thread = Thread(
+            id=thread_id,
+            data_key=key_ring.new_wrapped_key(thread_id),
             assistant_id=thread_data.assistant_id,
-            user_id=user.id,
+            user_id=current_user.id,
             status="open",
+            title=title,
+            message_count=0,
         )
         db.add(thread)
         await db.commit()
@@ -85,7 +101,6 @@ async def create_thread(
             pass
 
         # Compute derived fields
-        title = thread_data.title or f"Chat mit {assistant.name}"
         created_at = (
             thread.created_at.isoformat()
             if thread.created_at
@@ -110,60 +125,89 @@ async def create_thread(
         )
 
 
+async def _get_owned_thread(db: AsyncSession, thread_id: str, user: User) -> Thread:
+    """Thread of the current user, 404 otherwise"""
+    thread = await db.scalar(
+        select(Thread).where(Thread.id == thread_id, Thread.user_id == user.id)
+    )
+    if not thread:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found"
+        )
+    return thread
+
+
+def _invalid_cursor(e: ValueError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.get("/threads", response_model=List[ThreadListResponse])
 async def get_threads(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    """Get all chat threads from DB with message counts and derived title/updated_at"""
+    """Current user's chat threads, newest first
+    
+    Keyset-paginated on (created_at, id); the next page's cursor is returned
+    in the `X-Next-Cursor` header.
+    """
     try:
-        # Join threads with messages for counts and updated_at
-        result = await db.execute(
+        # Summary columns only: served from the covering index, no join or aggregate
+        query = (
             select(
                 Thread.id,
                 Thread.assistant_id,
-                func.max(Message.created_at).label("updated_at"),
-                func.count(Message.id).label("message_count"),
+                Thread.title,
                 Thread.created_at,
+                Thread.message_count,
+                Thread.last_message_at,
+                Thread.last_message_preview,
+                Thread.data_key,
             )
-            .select_from(Thread)
-            .outerjoin(Message, Thread.id == Message.thread_id)
-            .group_by(Thread.id)
-            .order_by(func.max(Message.created_at).desc())
+            .where(Thread.user_id == current_user.id)
+            .order_by(Thread.created_at.desc(), Thread.id.desc())
+            .limit(limit + 1)
         )
-        rows = result.all()
-
-        # Fetch assistant names to build titles
-        asst_ids = [r.assistant_id for r in rows]
-        names_map = {}
-        if asst_ids:
-            asst_rows = await db.execute(
-                select(Assistant.id, Assistant.name).where(
-                    Assistant.id.in_(asst_ids)
-                )
-            )
-            names_map = {row.id: row.name for row in asst_rows}
+        try:
+            after = keyset_after(Thread.created_at, Thread.id, cursor, descending=True)
+        except ValueError as e:
+            raise _invalid_cursor(e)
+        if after is not None:
+            query = query.where(after)
+        rows = (await db.execute(query)).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].created_at, rows[-1].id)
 
         threads: List[ThreadListResponse] = []
         for r in rows:
-            asst_name = names_map.get(r.assistant_id, "Assistant")
-            title = f"Chat mit {asst_name}"
             created = (
                 r.created_at.isoformat()
                 if r.created_at
                 else datetime.now().isoformat()
             )
-            updated = r.updated_at.isoformat() if r.updated_at else created
+            updated = r.last_message_at.isoformat() if r.last_message_at else created
             threads.append(
                 ThreadListResponse(
                     id=str(r.id),
-                    title=title,
+                    title=r.title or "Chat",
                     assistant_id=str(r.assistant_id),
                     created_at=created,
                     updated_at=updated,
-                    message_count=int(r.message_count or 0),
+                    message_count=r.message_count or 0,
+                    last_message_preview=message_codec.decode(
+                        r.last_message_preview,
+                        key_ring.cipher(r.id, r.data_key),
+                        thread_field_aad(r.id, "last_message_preview"),
+                    ) if r.last_message_preview is not None else None,
                 )
             )
         return threads
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -174,27 +218,47 @@ async def get_threads(
 @router.get("/threads/{thread_id}/messages", response_model=List[MessageResponse])
 async def get_thread_messages(
     thread_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    """Get all messages in a thread"""
+    """Messages in a thread, oldest first
+    
+    Keyset-paginated on (created_at, id); the next page's cursor is returned
+    in the `X-Next-Cursor` header.
+    """
     try:
-        thr_row = await db.execute(select(Thread).where(Thread.id == thread_id))
-        thread = thr_row.scalar_one_or_none()
-        if not thread:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found"
-            )
+        thread = await _get_owned_thread(db, thread_id, current_user)
 
-        result = await db.execute(
+        query = (
             select(Message)
-            .where(Message.thread_id == thread_id)
-            .order_by(Message.created_at.asc())
+            .where(Message.thread_id == thread.id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+            .limit(limit + 1)
+        )
+        try:
+            after = keyset_after(Message.created_at, Message.id, cursor)
+        except ValueError as e:
+            raise _invalid_cursor(e)
+        if after is not None:
+            query = query.where(after)
+        rows = list((await db.execute(query)).scalars())
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        # Decrypt and decompress the whole page with the thread's cached data key
+        contents = await message_codec.decode_all(
+            db,
+            [row.content_ciphertext for row in rows],
+            key_ring.cipher(thread.id, thread.data_key),
+            [message_aad(row.id) for row in rows],
         )
+
         messages: List[MessageResponse] = []
-        for row in result.scalars():
-            # Decode plaintext from stored bytes; if None, show empty
-            content_bytes = row.content_ciphertext or b""
-            content_text = content_bytes.decode("utf-8", errors="replace")
+        for row, content_text in zip(rows, contents):
             messages.append(
                 MessageResponse(
                     id=str(row.id),
@@ -210,6 +274,8 @@ async def get_thread_messages(
                 )
             )
         return messages
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -217,101 +283,193 @@ async def get_thread_messages(
         )
 
 
-@router.post("/threads/{thread_id}/messages", response_model=MessageResponse)
-async def send_message(
-    thread_id: str,
-    message_data: MessageCreate,
+@router.get("/search", response_model=List[SearchResultResponse])
+async def search_messages(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
     db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    """Persist user message, call OpenAI for a real response, persist and return it"""
+    """Full-text search over the current user's messages, best matches first
+    
+    Accepts web-search syntax ("quoted phrases", -exclusions, or). Keyset-
+    paginated on (rank, created_at, id); the next page's cursor is returned
+    in the `X-Next-Cursor` header.
+    """
     try:
-        thr_row = await db.execute(select(Thread).where(Thread.id == thread_id))
-        thread = thr_row.scalar_one_or_none()
-        if not thread:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found"
+        try:
+            hits, next_cursor = await chat_search.search(db, current_user.id, q, cursor, limit)
+        except ValueError as e:
+            raise _invalid_cursor(e)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return [
+            SearchResultResponse(
+                message_id=str(hit.message_id),
+                thread_id=str(hit.thread_id),
+                thread_title=hit.thread_title or "Chat",
+                role=hit.role,
+                snippet=hit.snippet,
+                rank=hit.rank,
+                timestamp=hit.created_at.isoformat(),
             )
-
-        asst_row = await db.execute(
-            select(Assistant).where(Assistant.id == message_data.assistant_id)
+            for hit in hits
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search messages: {str(e)}",
         )
-        assistant = asst_row.scalar_one_or_none()
-        if not assistant:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Assistant not found"
-            )
 
-        # Save user message
-        user_bytes = (message_data.content or "").encode("utf-8")
-        user_msg = Message(
-            role="user",
-            content_ciphertext=user_bytes,
-            content_sha256=sha256(user_bytes).hexdigest(),
-            thread_id=thread.id,
-            tokens_in=0,
-            tokens_out=0,
-            cost_in_cents=0,
-            cost_out_cents=0,
-            latency_ms=None,
-            redaction_map={},
-        )
-        db.add(user_msg)
-        await db.commit()
-        await db.refresh(user_msg)
 
-        # Build chat history for OpenAI (kept for future use)
-        history_rows = await db.execute(
-            select(Message)
-            .where(Message.thread_id == thread.id)
-            .order_by(Message.created_at.asc())
+async def _resolve_thread_and_assistant(thread_id: str):
+    async with AsyncSessionLocal() as db:
+        return await load_thread_and_assistant(db, thread_id)
+
+
+async def _retrieve_context(assistant_id: str, query: str) -> str:
+    async with AsyncSessionLocal() as db:
+        return await context_manager.get_relevant_context(
+            db, assistant_id, query, max_tokens=CHAT_CONTEXT_TOKENS
         )
-        if assistant.system_prompt:
-            _ = [m for m in history_rows.scalars()]
-            # We send only the latest user input to Responses, see below.
 
-        # OpenAI Responses API (with fallback in client)
-        try:
-            instruction_text = assistant.system_prompt or None
+
+async def _timed(timer: StageTimer, name: str, coro):
+    with timer.stage(name):
+        return await coro
+
+
+def _compose_instructions(system_prompt: Optional[str], context: str) -> Optional[str]:
+    if not context:
+        return system_prompt or None
+    parts = [system_prompt] if system_prompt else []
+    parts.append(
+        "Nutze den folgenden Kontext aus der Wissensbasis, wenn er für die Antwort relevant ist:\n\n"
+        + context
+    )
+    return "\n\n".join(parts)
+
+
+@router.post("/threads/{thread_id}/messages", response_model=MessageResponse)
+async def send_message(
+    thread_id: str,
+    message_data: MessageCreate,
+    response: Response,
+    x_request_priority: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Call OpenAI with knowledge-base context and history, persist the turn and return the reply
+    
+    The thread is resolved and its ownership checked first; conversation
+    memory and retrieval then run concurrently, each on its own session,
+    keyed on the thread's assistant. Nothing is written before the
+    provider call; both messages and the thread summary are stored in one
+    statement afterwards. The provider call is admitted by the fair-share
+    scheduler; scripts send `X-Request-Priority: batch`. Stage timings are
+    returned in `Server-Timing`, database round trips of the turn in
+    `X-DB-Round-Trips`.
+    """
+    timer = StageTimer(aggregate=chat_stage_stats)
+    user_at = datetime.now(timezone.utc)
+    try:
+        with count_round_trips(turn_round_trips) as round_trips:
             user_input = (message_data.content or "").strip()
-            result = await openai_client.responses_create(
-                input_text=user_input,
-                model=assistant.model or "gpt-4o-mini",
-                conversation_id=None,
-                instructions=instruction_text,
-            )
-            ai_text = result.get("text", "")
-        except Exception as e:
-            raise HTTPException(
-                status_code=502, detail=f"OpenAI request failed: {str(e)}"
-            )
+            with timer.stage("prepare"):
+                with timer.stage("resolve"):
+                    thread, assistant = await _resolve_thread_and_assistant(thread_id)
+                if not thread or thread.user_id != current_user.id:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found"
+                    )
+                if str(thread.assistant_id) != str(message_data.assistant_id):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="assistant_id does not match the thread's assistant",
+                    )
+                if not assistant:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND, detail="Assistant not found"
+                    )
+                # Everything below is keyed on the verified thread and its assistant
+                history, context = await asyncio.gather(
+                    _timed(timer, "history", conversation_memory.load(thread_id, str(thread.assistant_id))),
+                    _timed(timer, "retrieval", _retrieve_context(str(thread.assistant_id), user_input)),
+                )
 
-        # Save assistant message
-        ai_bytes = ai_text.encode("utf-8")
-        ai_msg = Message(
-            role="assistant",
-            content_ciphertext=ai_bytes,
-            content_sha256=sha256(ai_bytes).hexdigest(),
-            thread_id=thread.id,
-            tokens_in=0,
-            tokens_out=0,
-            cost_in_cents=0,
-            cost_out_cents=0,
-            latency_ms=None,
-            redaction_map={},
+            # Hand the request's connection (held since authentication) back to
+            # the pool while waiting on the provider; loaded objects stay usable
+            await db.commit()
+
+            # OpenAI Responses API (with fallback in client)
+            await fair_scheduler.refresh_weights()
+            priority = fair_scheduler.priority_of(x_request_priority)
+            try:
+                with timer.stage("queue"):
+                    ticket = await fair_scheduler.acquire(current_user.id, current_user.dept_id, priority)
+            except QueueTimeout as e:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=str(e),
+                    headers={"Retry-After": "5"},
+                )
+            try:
+                try:
+                    with timer.stage("provider"):
+                        result = await openai_client.responses_create(
+                            input_text=user_input,
+                            model=assistant.model or "gpt-4o-mini",
+                            conversation_id=None,
+                            instructions=_compose_instructions(assistant.system_prompt, context),
+                            history=history,
+                        )
+                finally:
+                    fair_scheduler.release(ticket)
+                ai_text = result.get("text", "")
+            except Exception as e:
+                # Keep the user's message even though there is no reply; a failed
+                # write must not mask the provider error
+                try:
+                    await record_turn(db, thread, message_data.content or "", user_at)
+                except Exception as record_error:
+                    logger.error(f"Failed to store message after provider error: {record_error}")
+                    await db.rollback()
+                raise HTTPException(
+                    status_code=502, detail=f"OpenAI request failed: {str(e)}"
+                )
+
+            tokens_in, tokens_out = usage_from_result(result)
+            with timer.stage("persist"):
+                stored = await record_turn(
+                    db,
+                    thread,
+                    message_data.content or "",
+                    user_at,
+                    assistant_text=ai_text,
+                    assistant_at=datetime.now(timezone.utc),
+                    tokens_in=tokens_in,
+                    tokens_out=tokens_out,
+                    latency_ms=int(timer.timings["provider"]),
+                )
+        ai_msg = stored[-1]
+        conversation_memory.schedule_update(thread.id, thread.assistant_id)
+
+        response.headers["Server-Timing"] = timer.server_timing()
+        response.headers["X-DB-Round-Trips"] = str(round_trips.total)
+        logger.debug(
+            f"send_message {thread_id}: {timer.server_timing()}, "
+            f"{round_trips.total} round trips"
         )
-        db.add(ai_msg)
-        await db.commit()
-        await db.refresh(ai_msg)
 
         return MessageResponse(
             id=str(ai_msg.id),
             role=ai_msg.role,
             content=ai_text,
-            timestamp=(
-                ai_msg.created_at.isoformat()
-                if ai_msg.created_at
-                else datetime.now().isoformat()
-            ),
+            timestamp=ai_msg.created_at.isoformat(),
             assistant_id=str(thread.assistant_id) if thread.assistant_id else None,
             thread_id=str(thread.id),
         )
@@ -329,17 +487,18 @@ async def send_message(
 async def delete_thread(
     thread_id: str,
     db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
     """Delete a chat thread and all its messages"""
     try:
-        thr_row = await db.execute(select(Thread).where(Thread.id == thread_id))
-        thread = thr_row.scalar_one_or_none()
-        if not thread:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found"
-            )
+        await _get_owned_thread(db, thread_id, current_user)
 
-        await db.execute(select(Message).where(Message.thread_id == thread_id))
+        # Search rows first; scoped to the user to stay on their index
+        await db.execute(
+            MessageSearch.__table__.delete().where(
+                MessageSearch.user_id == current_user.id, MessageSearch.thread_id == thread_id
+            )
+        )
         # Delete messages
         await db.execute(
             Message.__table__.delete().where(Message.thread_id == thread_id)
@@ -347,7 +506,10 @@ async def delete_thread(
         # Delete thread
         await db.execute(Thread.__table__.delete().where(Thread.id == thread_id))
         await db.commit()
+        key_ring.forget(thread_id)
         return {"message": "Thread deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
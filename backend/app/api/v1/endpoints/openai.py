@@ -4,6 +4,7 @@ from typing import List, Optional
 from sqlalchemy import select
 import logging
 
+from app.core.assistant_registry import assistant_registry
 from app.core.database import get_db
 from app.models.assistant import Assistant
 from app.schemas.assistant import (
@@ -182,6 +183,7 @@ async def update_assistant(
         
         await db.commit()
         await db.refresh(assistant)
+        await assistant_registry.invalidate(db, assistant.id)
         
         return AssistantResponse(
             id=str(assistant.id),
@@ -227,6 +229,7 @@ async def delete_assistant(
         # Delete from database only (no remote OpenAI calls)
         await db.delete(assistant)
         await db.commit()
+        await assistant_registry.invalidate(db, assistant_id)
         
         return {"message": "Assistant deleted successfully"}
         
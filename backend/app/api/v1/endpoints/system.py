@@ -5,7 +5,15 @@ from sqlalchemy import select, func
 from datetime import datetime, timedelta
 import random
 
-from app.core.database import get_db
+from app.core.database import get_db, pool_stats
+from app.core.chat_persistence import turn_round_trips
+from app.core.assistant_registry import assistant_registry
+from app.core.idempotency import idempotency_store
+from app.core.message_keys import key_ring
+from app.core.retention import retention_engine
+from app.core.scheduler import fair_scheduler
+from app.core.timing import chat_stage_stats
+from app.core.training.context_manager import context_manager
 from app.models.user import User
 from app.models.chat import Thread, Message
 from app.models.ticket import Ticket
@@ -191,6 +199,27 @@ async def get_system_logs_slash(
     return await get_system_logs(lines=lines, level=level)
 
 
+@router.get("/metrics")
+async def get_system_metrics():
+    """Get in-process cache and pipeline metrics"""
+    return {
+        "retrieval": context_manager.metrics(),
+        "chat_stages": chat_stage_stats.stats(),
+        "chat_round_trips": turn_round_trips.stats(),
+        "message_keys": key_ring.stats(),
+        "retention": retention_engine.stats(),
+        "assistants": assistant_registry.stats(),
+        "idempotency": idempotency_store.stats(),
+        "scheduler": fair_scheduler.stats(),
+        "database_pool": pool_stats.stats(),
+    }
+
+
+@router.get("/metrics/")
+async def get_system_metrics_slash():
+    return await get_system_metrics()
+
+
 def get_system_uptime() -> str:
     """Get system uptime (mock)"""
     try:
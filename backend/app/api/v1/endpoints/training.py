@@ -10,11 +10,14 @@ import shutil
 from app.core.database import get_db
 from app.core.authz import require_role
 from app.core.openai_client import openai_client
-from app.models.training import TrainingJob, TrainingDataset
+from app.core.training.context_manager import context_manager
+from app.core.training.document_store import UploadTooLarge
+from app.models.assistant import Assistant
+from app.models.training import TrainingJob, TrainingDataset, KnowledgeBaseVersion
 from app.schemas.training import (
     TrainingJobCreate, TrainingJobUpdate, TrainingJobResponse,
     TrainingDatasetCreate, TrainingDatasetResponse,
-    TrainingMetrics
+    TrainingMetrics, KnowledgeBaseVersionResponse
 )
 
 logger = logging.getLogger(__name__)
@@ -402,6 +405,127 @@ async def list_training_datasets(
         )
 
 
+# Knowledge-base versions
+@router.post("/assistants/{assistant_id}/reindex", status_code=status.HTTP_202_ACCEPTED)
+async def reindex_assistant(
+    assistant_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Build a new knowledge-base version in the background and activate it when complete"""
+    try:
+        assistant = await db.get(Assistant, assistant_id)
+        if not assistant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Assistant not found"
+            )
+        
+        context_manager.schedule_reindex(assistant_id)
+        
+        logger.info(f"Scheduled re-index of assistant {assistant_id}")
+        return {
+            "message": "Re-index scheduled",
+            "active_version": assistant.kb_version
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to schedule re-index for assistant {assistant_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to schedule re-index: {str(e)}"
+        )
+
+
+@router.post("/assistants/{assistant_id}/documents", status_code=status.HTTP_202_ACCEPTED)
+async def upload_assistant_documents(
+    assistant_id: str,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Upload knowledge-base documents; they are streamed to disk and indexed in the background"""
+    try:
+        assistant = await db.get(Assistant, assistant_id)
+        if not assistant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Assistant not found"
+            )
+        
+        documents = []
+        for file in files:
+            doc = await context_manager.add_document(db, assistant_id, file)
+            documents.append({
+                "id": str(doc.id),
+                "filename": doc.filename,
+                "size": doc.size,
+                "content_sha256": doc.content_sha256,
+                "status": doc.status,
+            })
+        
+        logger.info(f"Uploaded {len(documents)} documents for assistant {assistant_id}")
+        return {"documents": documents}
+        
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to upload documents for assistant {assistant_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload documents: {str(e)}"
+        )
+
+
+@router.get("/assistants/{assistant_id}/versions", response_model=List[KnowledgeBaseVersionResponse])
+async def list_knowledge_base_versions(
+    assistant_id: str,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """List knowledge-base versions of an assistant, newest first"""
+    try:
+        active_version = await db.scalar(
+            select(Assistant.kb_version).where(Assistant.id == assistant_id)
+        )
+        if active_version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Assistant not found"
+            )
+        
+        result = await db.execute(
+            select(KnowledgeBaseVersion)
+            .where(KnowledgeBaseVersion.assistant_id == assistant_id)
+            .order_by(KnowledgeBaseVersion.version.desc())
+            .limit(limit)
+        )
+        return [
+            KnowledgeBaseVersionResponse.model_validate(version).model_copy(
+                update={"is_active": version.version == active_version}
+            )
+            for version in result.scalars()
+        ]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to list knowledge-base versions for assistant {assistant_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to list knowledge-base versions: {str(e)}"
+        )
+
+
 @router.get("/metrics", response_model=TrainingMetrics)
 async def get_training_metrics(
     db: AsyncSession = Depends(get_db),
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import engine
+from app.models.assistant import Assistant
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel; the payload is the changed assistant's id
+ASSISTANT_CHANNEL = "assistant_changed"
+
+
+@dataclass(frozen=True)
+class AssistantSnapshot:
+    """Read-only copy of the assistant fields the request path needs"""
+    id: uuid.UUID
+    name: str
+    provider: str
+    model: str
+    system_prompt: Optional[str]
+    status: str
+    retrieval_config: Dict[str, Any] = field(default_factory=dict)
+    kb_version: int = 0
+
+    @classmethod
+    def from_model(cls, assistant: Assistant) -> "AssistantSnapshot":
+        return cls(
+            id=assistant.id,
+            name=assistant.name,
+            provider=assistant.provider,
+            model=assistant.model,
+            system_prompt=assistant.system_prompt,
+            status=assistant.status,
+            retrieval_config=dict(assistant.retrieval_config or {}),
+            kb_version=assistant.kb_version or 0,
+        )
+
+
+class AssistantRegistry:
+    """Read-through cache of assistant definitions
+
+    Chat turns, thread creation and retrieval read an assistant's model,
+    prompt and retrieval settings from here instead of the database.
+    Writers call `invalidate` after committing: that drops the local entry
+    and sends a NOTIFY, which every worker's listener turns into a local
+    invalidation. The TTL bounds staleness if a notification is missed,
+    e.g. while a listener reconnects.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_entries=getattr(settings, "ASSISTANT_CACHE_SIZE", 1024),
+            ttl_seconds=getattr(settings, "ASSISTANT_CACHE_TTL", 300),
+        )
+        self.reconnect_seconds = getattr(settings, "ASSISTANT_LISTENER_RECONNECT_SECONDS", 5)
+        self._listener_task: Optional[asyncio.Task] = None
+        self.notifications = 0
+
+    async def get(self, db: AsyncSession, assistant_id) -> Optional[AssistantSnapshot]:
+        """Snapshot of the assistant, loading it on a miss; None if it doesn't exist"""
+        if assistant_id is None:
+            return None
+        key = str(assistant_id)
+        snapshot = self.cache.get(key)
+        if snapshot is None:
+            assistant = await db.scalar(select(Assistant).where(Assistant.id == assistant_id))
+            if assistant is None:
+                return None
+            snapshot = AssistantSnapshot.from_model(assistant)
+            self.cache.set(key, snapshot)
+        return snapshot
+
+    async def invalidate(self, db: AsyncSession, assistant_id) -> None:
+        """Drop the assistant here and, via NOTIFY, in every other worker
+
+        Call after the change is committed; the notification is sent in its
+        own short transaction.
+        """
+        self.cache.invalidate(str(assistant_id))
+        await db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": ASSISTANT_CHANNEL, "payload": str(assistant_id)},
+        )
+        await db.commit()
+
+    # -- cross-worker invalidation -----------------------------------------
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self.notifications += 1
+        self.cache.invalidate(payload)
+
+    def start_listener(self) -> None:
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            await asyncio.gather(self._listener_task, return_exceptions=True)
+            self._listener_task = None
+
+    async def _listen(self) -> None:
+        """Keep a LISTEN connection open, reconnecting after failures"""
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    await self._listen_on(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Assistant change listener lost its connection: {e}")
+            await asyncio.sleep(self.reconnect_seconds)
+
+    async def _listen_on(self, conn: AsyncConnection) -> None:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        await driver.add_listener(ASSISTANT_CHANNEL, self._on_notify)
+        # Changes made while no listener was connected were missed
+        self.cache.clear()
+        logger.info(f"Listening for assistant changes on '{ASSISTANT_CHANNEL}'")
+        try:
+            while not driver.is_closed():
+                await asyncio.sleep(self.reconnect_seconds)
+        finally:
+            if not driver.is_closed():
+                await driver.remove_listener(ASSISTANT_CHANNEL, self._on_notify)
+
+    def stats(self) -> Dict:
+        return {
+            **self.cache.stats(),
+            "listening": self._listener_task is not None and not self._listener_task.done(),
+            "notifications": self.notifications,
+        }
+
+
+# Create global instance
+assistant_registry = AssistantRegistry()
@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded in-process LRU cache with per-entry TTL and hit-rate stats.
+
+    Entries are evicted least-recently-used first once either `max_entries`
+    or `max_bytes` (measured with `sizeof`) is exceeded. Meant to be used
+    from the event loop only; it does no locking.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 300.0,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, size = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        if key in self._data:
+            self._remove(key)
+        size = self._sizeof(value)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (value, time.monotonic() + ttl, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        if key in self._data:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
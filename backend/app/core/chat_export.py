@@ -0,0 +1,335 @@
+import json
+import logging
+import uuid
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from hashlib import sha256
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.chat_persistence import THREAD_PREVIEW_CHARS
+from app.core.chat_search import chat_search
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, copy_records
+from app.core.message_codec import message_aad, message_codec, thread_field_aad, unseal
+from app.core.message_keys import key_ring
+from app.core.partitions import partition_manager
+from app.models.chat import Message, Thread
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# One JSON object per line, gzip-compressed:
+#   {"type": "thread", "id": ..., "assistant_id": ..., "user_id": ..., "title": ..., "status": ..., "created_at": ...}
+#   {"type": "message", "id": ..., "thread_id": ..., "role": ..., "content": ..., "tokens_in": ..., ...}
+# A thread line precedes its messages; message content is plain text.
+EXPORT_FORMAT_VERSION = 1
+
+THREAD_COLUMNS = (
+    "id", "assistant_id", "user_id", "status", "created_at", "data_key", "title",
+    "message_count", "last_message_at", "last_message_preview", "summary_message_count",
+)
+MESSAGE_COLUMNS = (
+    "id", "thread_id", "role", "content_ciphertext", "content_sha256", "tokens_in", "tokens_out",
+    "cost_in_cents", "cost_out_cents", "latency_ms", "redaction_map", "created_at",
+)
+
+
+class InvalidImport(ValueError):
+    """Upload is not a readable chat export"""
+
+
+@dataclass
+class ExportFilter:
+    user_id: Optional[uuid.UUID] = None
+    department_id: Optional[uuid.UUID] = None
+    start: Optional[datetime] = None  # messages created at or after
+    end: Optional[datetime] = None  # messages created before
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+class ChatExporter:
+    """Streaming export and bulk import of chat history as gzip NDJSON
+
+    Export reads through a server-side cursor in fixed-size partitions and
+    compresses incrementally, so memory stays flat regardless of the amount
+    exported. Import decompresses the upload incrementally and writes with
+    COPY in batches, re-encoding content with the target's thread keys and
+    dictionaries, all in one transaction.
+    """
+
+    def __init__(self):
+        self.fetch_size = getattr(settings, "EXPORT_FETCH_SIZE", 500)
+        self.flush_bytes = getattr(settings, "EXPORT_FLUSH_BYTES", 64 * 1024)
+        self.import_batch = getattr(settings, "IMPORT_BATCH_SIZE", 2000)
+        self.read_chunk = 256 * 1024
+        # One message per line; a longer line is rejected instead of buffered
+        self.max_line_bytes = getattr(settings, "IMPORT_MAX_LINE_BYTES", 16 * 1024 * 1024)
+
+    # -- export ------------------------------------------------------------
+
+    def _query(self, filters: ExportFilter):
+        query = (
+            select(
+                Message.id,
+                Message.thread_id,
+                Message.role,
+                Message.content_ciphertext,
+                Message.tokens_in,
+                Message.tokens_out,
+                Message.latency_ms,
+                Message.created_at,
+                Thread.assistant_id,
+                Thread.user_id,
+                Thread.title,
+                Thread.status,
+                Thread.created_at.label("thread_created_at"),
+                Thread.data_key,
+            )
+            .join(Thread, Thread.id == Message.thread_id)
+            .order_by(Message.thread_id, Message.created_at, Message.id)
+        )
+        if filters.user_id is not None:
+            query = query.where(Thread.user_id == filters.user_id)
+        if filters.department_id is not None:
+            query = query.where(
+                Thread.user_id.in_(select(User.id).where(User.dept_id == filters.department_id))
+            )
+        # Bounds on created_at prune partitions
+        if filters.start is not None:
+            query = query.where(Message.created_at >= filters.start)
+        if filters.end is not None:
+            query = query.where(Message.created_at < filters.end)
+        return query
+
+    async def export(self, filters: ExportFilter) -> AsyncIterator[bytes]:
+        """gzip NDJSON of the filtered messages, grouped by thread
+
+        Opens its own session: the generator outlives the request handler.
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+        buffer: List[bytes] = []
+        buffered = 0
+        threads = messages = 0
+
+        def line(obj: Dict[str, Any]) -> None:
+            nonlocal buffered
+            data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            buffer.append(data)
+            buffered += len(data)
+
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(self._query(filters).execution_options(yield_per=self.fetch_size))
+            current_thread = None
+            async for rows in result.partitions():
+                # Decrypt the partition, then load its dictionaries in one query
+                payloads = [
+                    unseal(key_ring.cipher(row.thread_id, row.data_key), row.content_ciphertext, message_aad(row.id))
+                    for row in rows
+                ]
+                contents = await message_codec.decompress_all(db, payloads)
+                for row, content in zip(rows, contents):
+                    if row.thread_id != current_thread:
+                        current_thread = row.thread_id
+                        threads += 1
+                        line({
+                            "type": "thread",
+                            "version": EXPORT_FORMAT_VERSION,
+                            "id": str(row.thread_id),
+                            "assistant_id": str(row.assistant_id) if row.assistant_id else None,
+                            "user_id": str(row.user_id) if row.user_id else None,
+                            "title": row.title,
+                            "status": row.status,
+                            "created_at": _iso(row.thread_created_at),
+                        })
+                    messages += 1
+                    line({
+                        "type": "message",
+                        "id": str(row.id),
+                        "thread_id": str(row.thread_id),
+                        "role": row.role,
+                        "content": content,
+                        "tokens_in": row.tokens_in or 0,
+                        "tokens_out": row.tokens_out or 0,
+                        "latency_ms": row.latency_ms,
+                        "created_at": _iso(row.created_at),
+                    })
+                if buffered >= self.flush_bytes:
+                    chunk = compressor.compress(b"".join(buffer))
+                    buffer.clear()
+                    buffered = 0
+                    if chunk:
+                        yield chunk
+
+        chunk = compressor.compress(b"".join(buffer)) + compressor.flush()
+        if chunk:
+            yield chunk
+        logger.info(f"Exported {threads} threads, {messages} messages")
+
+    # -- import ------------------------------------------------------------
+
+    async def _data(self, upload) -> AsyncIterator[bytes]:
+        """Upload content, gunzipped if needed, in pieces of at most `read_chunk` bytes"""
+        decompressor = zlib.decompressobj(47)  # gzip or zlib, auto-detected
+        chunk = await upload.read(self.read_chunk)
+        gzipped = chunk[:2] == b"\x1f\x8b"
+        while chunk:
+            if not gzipped:
+                yield chunk
+            else:
+                # Bounded output per call, so a small member cannot inflate at once
+                data = decompressor.decompress(chunk, self.read_chunk)
+                while data:
+                    yield data
+                    data = decompressor.decompress(decompressor.unconsumed_tail, self.read_chunk)
+            chunk = await upload.read(self.read_chunk)
+        if gzipped:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+    async def _lines(self, upload) -> AsyncIterator[Dict[str, Any]]:
+        """Parsed NDJSON objects from a (gzip or plain) upload, read incrementally"""
+        pending = b""
+        number = 0
+        try:
+            async for data in self._data(upload):
+                pending += data
+                *complete, pending = pending.split(b"\n")
+                for raw in complete:
+                    number += 1
+                    if len(raw) > self.max_line_bytes:
+                        raise InvalidImport(f"Line {number}: longer than {self.max_line_bytes} bytes")
+                    if raw.strip():
+                        try:
+                            yield json.loads(raw)
+                        except ValueError as e:
+                            raise InvalidImport(f"Line {number}: {e}") from e
+                if len(pending) > self.max_line_bytes:
+                    raise InvalidImport(f"Line {number + 1}: longer than {self.max_line_bytes} bytes")
+        except zlib.error as e:
+            raise InvalidImport(f"Corrupt gzip data: {e}") from e
+        if pending.strip():
+            try:
+                yield json.loads(pending)
+            except ValueError as e:
+                raise InvalidImport(f"Line {number + 1}: {e}") from e
+
+    async def import_threads(self, db: AsyncSession, upload) -> Dict[str, int]:
+        """Load an export into this gateway; ids are preserved, nothing is committed on error
+
+        Referenced users and assistants must exist here. Threads or messages
+        that already exist make the whole import fail.
+        """
+        partitioned = await partition_manager.is_partitioned(db, "messages")
+        months: Set[date] = set()
+        thread_rows: List[tuple] = []
+        message_rows: List[tuple] = []
+        search_rows: List[tuple] = []
+        counts = {"threads": 0, "messages": 0}
+        current: Optional[Dict[str, Any]] = None
+        pending: List[Dict[str, Any]] = []
+
+        async def flush() -> None:
+            # Threads first: messages reference them
+            if thread_rows:
+                await copy_records(db, Thread.__table__, THREAD_COLUMNS, thread_rows, self.import_batch)
+                thread_rows.clear()
+            if message_rows:
+                if partitioned:
+                    for month in sorted(months):
+                        await partition_manager.create_partition(db, "messages", month)
+                        await partition_manager.create_partition(db, "message_search", month)
+                months.clear()
+                await copy_records(db, Message.__table__, MESSAGE_COLUMNS, message_rows, self.import_batch)
+                message_rows.clear()
+                await chat_search.index_messages(db, search_rows)
+                search_rows.clear()
+
+        async def close_thread() -> None:
+            if current is None:
+                return
+            thread_id = uuid.UUID(current["id"])
+            user_id = uuid.UUID(current["user_id"]) if current.get("user_id") else None
+            wrapped = key_ring.new_wrapped_key(thread_id)
+            cipher = key_ring.cipher(thread_id, wrapped)
+            dictionary_id = await message_codec.active_dictionary(db, current.get("assistant_id"))
+            last_at = None
+            preview = None
+            for message in pending:
+                message_id = uuid.UUID(message["id"])
+                created_at = datetime.fromisoformat(message["created_at"])
+                content = message.get("content") or ""
+                message_rows.append((
+                    message_id,
+                    thread_id,
+                    message["role"],
+                    message_codec.encode(content, dictionary_id, cipher, message_aad(message_id)),
+                    sha256(content.encode("utf-8")).hexdigest(),
+                    message.get("tokens_in") or 0,
+                    message.get("tokens_out") or 0,
+                    0,
+                    0,
+                    message.get("latency_ms"),
+                    "{}",
+                    created_at,
+                ))
+                search_rows.append((message_id, thread_id, user_id, created_at, content))
+                months.add(date(created_at.year, created_at.month, 1))
+                last_at = created_at
+                preview = " ".join(content.split())[:THREAD_PREVIEW_CHARS]
+            thread_rows.append((
+                thread_id,
+                uuid.UUID(current["assistant_id"]) if current.get("assistant_id") else None,
+                user_id,
+                current.get("status") or "open",
+                datetime.fromisoformat(current["created_at"]) if current.get("created_at") else last_at,
+                wrapped,
+                current.get("title"),
+                len(pending),
+                last_at,
+                message_codec.encode(preview, cipher=cipher, aad=thread_field_aad(thread_id, "last_message_preview"))
+                if preview is not None else None,
+                0,
+            ))
+            counts["threads"] += 1
+            counts["messages"] += len(pending)
+            pending.clear()
+            if len(message_rows) >= self.import_batch:
+                await flush()
+
+        try:
+            async for obj in self._lines(upload):
+                kind = obj.get("type")
+                if kind == "thread":
+                    await close_thread()
+                    current = obj
+                elif kind == "message":
+                    if current is None or obj.get("thread_id") != current["id"]:
+                        raise InvalidImport(f"Message {obj.get('id')} is not preceded by its thread")
+                    pending.append(obj)
+                else:
+                    raise InvalidImport(f"Unknown record type {kind!r}")
+            await close_thread()
+            await flush()
+        except (KeyError, TypeError, ValueError) as e:
+            await db.rollback()
+            if isinstance(e, InvalidImport):
+                raise
+            raise InvalidImport(f"Malformed record: {e}") from e
+        except Exception:
+            await db.rollback()
+            raise
+        await db.commit()
+        logger.info(f"Imported {counts['threads']} threads, {counts['messages']} messages")
+        return counts
+
+
+# Create global instance
+chat_exporter = ChatExporter()
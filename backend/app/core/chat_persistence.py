@@ -0,0 +1,227 @@
+import logging
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.assistant_registry import AssistantSnapshot, assistant_registry
+from app.core.chat_search import chat_search
+from app.core.database import engine
+from app.core.message_codec import message_aad, message_codec, thread_field_aad
+from app.core.message_keys import key_ring
+from app.models.chat import Thread, Message, MessageSearch
+
+logger = logging.getLogger(__name__)
+
+# Characters of the last message kept on the thread for listings
+THREAD_PREVIEW_CHARS = 200
+
+
+# ---------------------------------------------------------------------------
+# Round-trip accounting
+# ---------------------------------------------------------------------------
+
+class RoundTripCounter:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+
+    @property
+    def total(self) -> int:
+        return self.statements + self.commits
+
+
+# Shared (not copied) by tasks spawned inside `count_round_trips`, e.g. asyncio.gather
+_round_trips: ContextVar[Optional[RoundTripCounter]] = ContextVar("db_round_trips", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter.statements += 1
+
+
+@event.listens_for(engine.sync_engine, "commit")
+def _count_commit(conn):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter.commits += 1
+
+
+class RoundTripStats:
+    """Process-wide database round trips per chat turn"""
+
+    def __init__(self):
+        self.turns = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, round_trips: int) -> None:
+        self.turns += 1
+        self.total += round_trips
+        self.max = max(self.max, round_trips)
+
+    def stats(self) -> Dict:
+        return {
+            "turns": self.turns,
+            "avg_round_trips": round(self.total / self.turns, 2) if self.turns else None,
+            "max_round_trips": self.max,
+        }
+
+
+@contextmanager
+def count_round_trips(stats: Optional[RoundTripStats] = None):
+    """Count statements and commits issued in this context (and tasks started in it)"""
+    counter = RoundTripCounter()
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+        if stats is not None:
+            stats.record(counter.total)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+async def load_thread_and_assistant(
+    db: AsyncSession,
+    thread_id: str,
+) -> Tuple[Optional[Thread], Optional[AssistantSnapshot]]:
+    """Thread plus its cached assistant; (None, None) if the thread is missing
+
+    One query for the thread, plus one for the assistant on a registry miss.
+    """
+    thread = await db.scalar(select(Thread).where(Thread.id == thread_id))
+    if thread is None:
+        return None, None
+    return thread, await assistant_registry.get(db, thread.assistant_id)
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+@dataclass
+class StoredMessage:
+    id: uuid.UUID
+    role: str
+    created_at: datetime
+
+
+def usage_from_result(result: Dict[str, Any]) -> Tuple[int, int]:
+    """(input, output) tokens from a Responses API or Chat Completions result"""
+    raw = result.get("raw") or {}
+    usage = raw.get("usage") or {}
+    tokens_in = usage.get("input_tokens", usage.get("prompt_tokens")) or 0
+    tokens_out = usage.get("output_tokens", usage.get("completion_tokens")) or 0
+    return int(tokens_in), int(tokens_out)
+
+
+def _message_values(
+    thread_id,
+    role: str,
+    text: str,
+    created_at: datetime,
+    cipher,
+    dictionary_id: int = 0,
+    tokens_in: int = 0,
+    tokens_out: int = 0,
+    latency_ms: Optional[int] = None,
+) -> Dict[str, Any]:
+    message_id = uuid.uuid4()
+    return {
+        "id": message_id,
+        "thread_id": thread_id,
+        "role": role,
+        "content_ciphertext": message_codec.encode(text, dictionary_id, cipher, message_aad(message_id)),
+        "content_sha256": sha256(text.encode("utf-8")).hexdigest(),  # of the plain text
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "cost_in_cents": 0,
+        "cost_out_cents": 0,
+        "latency_ms": latency_ms,
+        "redaction_map": {},
+        "created_at": created_at,
+    }
+
+
+async def record_turn(
+    db: AsyncSession,
+    thread: Thread,
+    user_text: str,
+    user_at: datetime,
+    assistant_text: Optional[str] = None,
+    assistant_at: Optional[datetime] = None,
+    tokens_in: int = 0,
+    tokens_out: int = 0,
+    latency_ms: Optional[int] = None,
+) -> List[StoredMessage]:
+    """Write one chat turn and commit: messages plus thread summary in one statement
+
+    Both messages and the usage ledger (token counts on the assistant row)
+    are inserted with RETURNING; the thread summary update and the search
+    index rows ride along as CTEs. Without `assistant_text` only the user
+    message is stored (failed provider call). Timestamps come from the caller so the user message
+    always sorts before the reply. Content is compressed with the thread
+    assistant's dictionary and encrypted with the thread's data key; only
+    threads created before encryption cost an extra statement, once.
+    """
+    thread_id = thread.id
+    cipher = await key_ring.thread_cipher(db, thread_id, thread.data_key)
+    dictionary_id = await message_codec.active_dictionary(db, thread.assistant_id)
+    rows = [_message_values(thread_id, "user", user_text, user_at, cipher, dictionary_id)]
+    texts = [user_text]
+    if assistant_text is not None:
+        rows.append(_message_values(
+            thread_id, "assistant", assistant_text, assistant_at, cipher, dictionary_id,
+            tokens_in=tokens_in, tokens_out=tokens_out, latency_ms=latency_ms,
+        ))
+        texts.append(assistant_text)
+
+    last = rows[-1]
+    preview = " ".join((user_text if assistant_text is None else assistant_text).split())
+    touch_thread = (
+        update(Thread)
+        .where(Thread.id == thread_id)
+        .values(
+            message_count=Thread.message_count + len(rows),
+            last_message_at=last["created_at"],
+            last_message_preview=message_codec.encode(
+                preview[:THREAD_PREVIEW_CHARS],
+                cipher=cipher,
+                aad=thread_field_aad(thread_id, "last_message_preview"),
+            ),
+        )
+        .cte("touch_thread")
+    )
+    indexed = (
+        insert(MessageSearch)
+        .values([chat_search.index_row(row, thread.user_id, content) for row, content in zip(rows, texts)])
+        .cte("indexed")
+    )
+    inserted = (
+        insert(Message)
+        .values(rows)
+        .returning(Message.id, Message.role, Message.created_at)
+        .cte("inserted")
+    )
+    result = await db.execute(
+        select(inserted.c.id, inserted.c.role, inserted.c.created_at).add_cte(touch_thread, indexed)
+    )
+    stored = [StoredMessage(row.id, row.role, row.created_at) for row in result]
+    await db.commit()
+    return sorted(stored, key=lambda message: message.created_at)
+
+
+# Create global instance
+turn_round_trips = RoundTripStats()
@@ -0,0 +1,243 @@
+import asyncio
+import html
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, cast, exists, func, literal, select, text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.message_codec import message_aad, message_codec, unseal
+from app.core.message_keys import key_ring
+from app.core.pagination import encode_cursor, encode_rank_cursor, keyset_after, ranked_keyset_after
+from app.models.chat import Message, MessageSearch, Thread
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration for indexing and queries; changing it requires a rebuild
+SEARCH_CONFIG = getattr(settings, "SEARCH_TEXT_CONFIG", "german")
+
+# Snippets are built from HTML-escaped content, so <mark> is the only markup
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+
+# Bulk variant of the per-turn insert, for imports and the backfill
+INDEX_MESSAGES_SQL = """
+INSERT INTO message_search (message_id, thread_id, user_id, created_at, document)
+SELECT m.id, m.thread_id, m.user_id, m.created_at, to_tsvector(CAST(:config AS regconfig), m.content)
+FROM unnest(
+    CAST(:ids AS uuid[]), CAST(:thread_ids AS uuid[]), CAST(:user_ids AS uuid[]),
+    CAST(:created_at AS timestamptz[]), CAST(:contents AS text[])
+) AS m(id, thread_id, user_id, created_at, content)
+ON CONFLICT DO NOTHING
+"""
+
+# One statement for the whole page, order preserved
+HEADLINE_SQL = """
+SELECT ts_headline(
+    CAST(:config AS regconfig), d.content,
+    websearch_to_tsquery(CAST(:config AS regconfig), :query), :options
+)
+FROM unnest(CAST(:contents AS text[])) WITH ORDINALITY AS d(content, n)
+ORDER BY d.n
+"""
+
+
+@dataclass
+class SearchHit:
+    message_id: uuid.UUID
+    thread_id: uuid.UUID
+    thread_title: Optional[str]
+    role: str
+    created_at: datetime
+    rank: float
+    snippet: str
+
+
+def _config():
+    return cast(literal(SEARCH_CONFIG), REGCONFIG)
+
+
+class ChatSearch:
+    """Full-text search over a user's chat history
+
+    Message content is encrypted, so the database cannot search it directly.
+    Instead every message gets a row in `message_search` holding only its
+    tsvector, written in the same statement as the message itself. Queries
+    hit the (user_id, document) GIN index, rank in SQL, and only the page
+    being returned is decrypted to build highlighted snippets.
+    """
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id,
+        query: str,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> Tuple[List[SearchHit], Optional[str]]:
+        """Best matches first, with the cursor of the next page (None on the last)
+
+        Keyset-paginated on (rank, created_at, id); raises ValueError for a
+        malformed cursor.
+        """
+        tsquery = func.websearch_to_tsquery(_config(), query)
+        rank = func.ts_rank(MessageSearch.document, tsquery)
+        page = (
+            select(
+                MessageSearch.message_id,
+                MessageSearch.thread_id,
+                MessageSearch.created_at,
+                rank.label("rank"),
+            )
+            .where(MessageSearch.user_id == user_id, MessageSearch.document.op("@@")(tsquery))
+            .order_by(rank.desc(), MessageSearch.created_at.desc(), MessageSearch.message_id.desc())
+            .limit(limit + 1)
+        )
+        after = ranked_keyset_after(rank, MessageSearch.created_at, MessageSearch.message_id, cursor)
+        if after is not None:
+            page = page.where(after)
+        page = page.subquery()
+
+        rows = (await db.execute(
+            select(
+                page.c.message_id,
+                page.c.thread_id,
+                page.c.created_at,
+                page.c.rank,
+                Message.role,
+                Message.content_ciphertext,
+                Thread.title,
+                Thread.data_key,
+            )
+            .join(Message, and_(Message.id == page.c.message_id, Message.created_at == page.c.created_at))
+            .join(Thread, Thread.id == page.c.thread_id)
+            .order_by(page.c.rank.desc(), page.c.created_at.desc(), page.c.message_id.desc())
+        )).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].created_at, rows[-1].message_id)
+
+        payloads = [
+            unseal(key_ring.cipher(row.thread_id, row.data_key), row.content_ciphertext, message_aad(row.message_id))
+            for row in rows
+        ]
+        contents = await message_codec.decompress_all(db, payloads)
+        snippets = await self.highlight(db, query, contents)
+        hits = [
+            SearchHit(
+                message_id=row.message_id,
+                thread_id=row.thread_id,
+                thread_title=row.title,
+                role=row.role,
+                created_at=row.created_at,
+                rank=row.rank,
+                snippet=snippet,
+            )
+            for row, snippet in zip(rows, snippets)
+        ]
+        return hits, next_cursor
+
+    async def highlight(self, db: AsyncSession, query: str, contents: Sequence[str]) -> List[str]:
+        """Snippets of `contents` with the matched terms in <mark>, stemming included"""
+        if not contents:
+            return []
+        return list((await db.execute(
+            text(HEADLINE_SQL),
+            {
+                "config": SEARCH_CONFIG,
+                "query": query,
+                "options": HEADLINE_OPTIONS,
+                "contents": [html.escape(content, quote=False) for content in contents],
+            },
+        )).scalars())
+
+    # -- indexing ----------------------------------------------------------
+
+    def index_row(self, message: Dict[str, Any], user_id, content: str) -> Dict[str, Any]:
+        """`message_search` values for a message row about to be inserted"""
+        return {
+            "message_id": message["id"],
+            "thread_id": message["thread_id"],
+            "user_id": user_id,
+            "created_at": message["created_at"],
+            "document": func.to_tsvector(_config(), content),
+        }
+
+    async def index_messages(
+        self,
+        db: AsyncSession,
+        rows: Sequence[Tuple[uuid.UUID, uuid.UUID, Optional[uuid.UUID], datetime, str]],
+    ) -> None:
+        """Index (id, thread_id, user_id, created_at, content) rows in one statement; no commit"""
+        if not rows:
+            return
+        ids, thread_ids, user_ids, created_at, contents = (list(column) for column in zip(*rows))
+        await db.execute(
+            text(INDEX_MESSAGES_SQL),
+            {
+                "config": SEARCH_CONFIG,
+                "ids": ids,
+                "thread_ids": thread_ids,
+                "user_ids": user_ids,
+                "created_at": created_at,
+                "contents": contents,
+            },
+        )
+
+    async def backfill(self, batch_size: int = 500, pause_seconds: float = 0.05) -> int:
+        """Index messages that have no search row yet; safe to interrupt and re-run"""
+        indexed = 0
+        cursor = None
+        while True:
+            async with AsyncSessionLocal() as db:
+                query = (
+                    select(
+                        Message.id,
+                        Message.thread_id,
+                        Message.created_at,
+                        Message.content_ciphertext,
+                        Thread.user_id,
+                        Thread.data_key,
+                    )
+                    .join(Thread, Thread.id == Message.thread_id)
+                    .where(~exists().where(
+                        MessageSearch.message_id == Message.id,
+                        MessageSearch.created_at == Message.created_at,
+                    ))
+                    .order_by(Message.created_at, Message.id)
+                    .limit(batch_size)
+                )
+                after = keyset_after(Message.created_at, Message.id, cursor)
+                if after is not None:
+                    query = query.where(after)
+                rows = (await db.execute(query)).all()
+                if not rows:
+                    break
+
+                payloads = [
+                    unseal(key_ring.cipher(row.thread_id, row.data_key), row.content_ciphertext, message_aad(row.id))
+                    for row in rows
+                ]
+                contents = await message_codec.decompress_all(db, payloads)
+                await self.index_messages(db, [
+                    (row.id, row.thread_id, row.user_id, row.created_at, content)
+                    for row, content in zip(rows, contents)
+                ])
+                await db.commit()
+
+            indexed += len(rows)
+            cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+            await asyncio.sleep(pause_seconds)
+        logger.info(f"Indexed {indexed} messages for search")
+        return indexed
+
+
+# Create global instance
+chat_search = ChatSearch()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select, update
+
+from app.core.assistant_registry import assistant_registry
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.message_codec import message_aad, message_codec, thread_field_aad
+from app.core.message_keys import key_ring
+from app.core.openai_client import openai_client
+from app.core.scheduler import BATCH, fair_scheduler
+from app.core.training.context_packer import ContextPacker
+from app.models.chat import Thread, Message
+
+logger = logging.getLogger(__name__)
+
+# Per-assistant overrides live in Assistant.retrieval_config
+DEFAULT_MEMORY_CONFIG = {
+    "history_messages": 12,  # most recent messages sent verbatim
+    "history_tokens": 3000,  # budget for summary + verbatim history
+}
+
+SUMMARY_INSTRUCTIONS = (
+    "Du fasst Gespräche zwischen einem Nutzer und einem KI-Assistenten zusammen. "
+    "Aktualisiere die bisherige Zusammenfassung um die neuen Nachrichten. Behalte "
+    "Fakten, Entscheidungen, offene Fragen und Vorlieben des Nutzers; lass Floskeln weg. "
+    "Antworte nur mit der Zusammenfassung, höchstens {max_words} Wörter."
+)
+
+
+class ConversationMemory:
+    """Bounded prompt history: rolling summary of old turns plus recent ones verbatim
+
+    The summary lives on the thread and covers its first
+    `summary_message_count` messages. After each turn, once enough messages
+    have fallen out of the verbatim window, a cheap model folds them into the
+    summary in the background; requests never wait for it.
+    """
+
+    def __init__(self):
+        self.summary_model = getattr(settings, "SUMMARY_MODEL", "gpt-4o-mini")
+        self.summary_max_words = getattr(settings, "SUMMARY_MAX_WORDS", 250)
+        # Messages that must fall out of the window before re-summarizing
+        self.summarize_every = getattr(settings, "SUMMARY_BATCH_MESSAGES", 6)
+        # Bounds one summarization prompt; long backlogs take several passes
+        self.summarize_max = getattr(settings, "SUMMARY_MAX_MESSAGES", 40)
+        self.packer = ContextPacker()
+        self._updating: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def config(self, retrieval_config: Optional[Dict]) -> Dict:
+        overrides = {
+            key: value for key, value in (retrieval_config or {}).items()
+            if key in DEFAULT_MEMORY_CONFIG
+        }
+        return {**DEFAULT_MEMORY_CONFIG, **overrides}
+
+    async def _load_state(self, db, thread_id, assistant_id):
+        """(thread summary state, memory config); state is None if the thread is missing"""
+        state = (await db.execute(
+            select(
+                Thread.data_key,
+                Thread.summary,
+                Thread.summary_message_count,
+                Thread.message_count,
+            )
+            .where(Thread.id == thread_id)
+        )).first()
+        if state is None:
+            return None, None
+        assistant = await assistant_registry.get(db, assistant_id)
+        return state, self.config(assistant.retrieval_config if assistant else None)
+
+    @staticmethod
+    def _summary_text(thread_id, state, cipher) -> Optional[str]:
+        if state.summary is None:
+            return None
+        return message_codec.decode(state.summary, cipher, thread_field_aad(thread_id, "summary"))
+
+    async def load(self, thread_id: str, assistant_id: str) -> List[Dict[str, str]]:
+        """History for the next provider call, oldest first, within the assistant's token budget"""
+        async with AsyncSessionLocal() as db:
+            state, config = await self._load_state(db, thread_id, assistant_id)
+            if state is None:
+                return []
+
+            # Unsummarized messages, at most one pending batch beyond the window
+            unsummarized = (state.message_count or 0) - state.summary_message_count
+            limit = min(max(unsummarized, 0), config["history_messages"] + self.summarize_every)
+            rows = []
+            if limit:
+                rows = (await db.execute(
+                    select(Message.id, Message.role, Message.content_ciphertext)
+                    .where(Message.thread_id == thread_id)
+                    .order_by(Message.created_at.desc(), Message.id.desc())
+                    .limit(limit)
+                )).all()
+            cipher = key_ring.cipher(thread_id, state.data_key)
+            contents = await message_codec.decode_all(
+                db, [row.content_ciphertext for row in rows], cipher, [message_aad(row.id) for row in rows]
+            )
+
+        budget = config["history_tokens"]
+        history: List[Dict[str, str]] = []
+        previous = self._summary_text(thread_id, state, cipher)
+        if previous:
+            summary = f"Zusammenfassung des bisherigen Gesprächs:\n{previous}"
+            budget -= self.packer.count_tokens(summary)
+            history.append({"role": "system", "content": summary})
+
+        # Newest first until the budget is spent
+        recent: List[Dict[str, str]] = []
+        for row, content in zip(rows, contents):
+            budget -= self.packer.count_tokens(content)
+            if budget < 0:
+                break
+            recent.append({"role": row.role, "content": content})
+        return history + recent[::-1]
+
+    def schedule_update(self, thread_id, assistant_id) -> None:
+        """Fold messages that left the verbatim window into the summary, in the background"""
+        key = str(thread_id)
+        if key in self._updating:
+            return
+        self._updating.add(key)
+        task = asyncio.create_task(self._update(thread_id, assistant_id))
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            self._tasks.discard(t)
+            self._updating.discard(key)
+
+        task.add_done_callback(_done)
+
+    async def _update(self, thread_id, assistant_id) -> None:
+        try:
+            while await self._summarize_next(thread_id, assistant_id):
+                pass
+        except Exception as e:
+            logger.warning(f"Failed to update summary of thread {thread_id}: {e}")
+
+    async def _summarize_next(self, thread_id, assistant_id) -> bool:
+        """Fold the next batch into the summary; False once caught up"""
+        async with AsyncSessionLocal() as db:
+            state, config = await self._load_state(db, thread_id, assistant_id)
+            if state is None:
+                return False
+            covered = state.summary_message_count
+            target = (state.message_count or 0) - config["history_messages"]
+            if target - covered < self.summarize_every:
+                return False
+
+            rows = (await db.execute(
+                select(Message.id, Message.role, Message.content_ciphertext)
+                .where(Message.thread_id == thread_id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+                .offset(covered)
+                .limit(min(target - covered, self.summarize_max))
+            )).all()
+            cipher = key_ring.cipher(thread_id, state.data_key)
+            contents = await message_codec.decode_all(
+                db, [row.content_ciphertext for row in rows], cipher, [message_aad(row.id) for row in rows]
+            )
+            previous = self._summary_text(thread_id, state, cipher)
+        if not rows:
+            return False
+
+        # No connection is held during the model call
+        transcript = "\n".join(
+            f"{'Nutzer' if row.role == 'user' else 'Assistent'}: {content}"
+            for row, content in zip(rows, contents)
+        )
+        prompt = (
+            f"Bisherige Zusammenfassung:\n{previous or '(keine)'}\n\n"
+            f"Neue Nachrichten:\n{transcript}"
+        )
+        # Background work: batch class in the shared system bucket
+        async with fair_scheduler.slot(None, None, BATCH):
+            result = await openai_client.responses_create(
+                input_text=prompt,
+                model=self.summary_model,
+                instructions=SUMMARY_INSTRUCTIONS.format(max_words=self.summary_max_words),
+            )
+        summary = (result.get("text") or "").strip()
+        if not summary:
+            return False
+
+        async with AsyncSessionLocal() as db:
+            cipher = await key_ring.thread_cipher(db, thread_id, state.data_key)
+            # Guarded so a concurrent update of the same range is not applied twice
+            updated = await db.execute(
+                update(Thread)
+                .where(Thread.id == thread_id, Thread.summary_message_count == covered)
+                .values(
+                    summary=message_codec.encode(summary, cipher=cipher, aad=thread_field_aad(thread_id, "summary")),
+                    summary_message_count=covered + len(rows),
+                )
+            )
+            await db.commit()
+        logger.info(f"Summarized {len(rows)} messages of thread {thread_id}")
+        return updated.rowcount == 1
+
+
+# Create global instance
+conversation_memory = ConversationMemory()
@@ -1,7 +1,15 @@
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, Iterable, Sequence
+
+from sqlalchemy import Table, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from app.core.config import settings
 
@@ -10,13 +18,116 @@ async_database_url = settings.DATABASE_URL.replace(
     "postgresql://", "postgresql+asyncpg://"
 )
 
+# Connection pool; DB_POOL_SIZE=0 opens a new connection per checkout
+DB_POOL_SIZE = getattr(settings, "DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = getattr(settings, "DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = getattr(settings, "DB_POOL_TIMEOUT", 10)  # seconds to wait for a connection
+DB_POOL_RECYCLE = getattr(settings, "DB_POOL_RECYCLE", 1800)  # below server/proxy idle timeouts
+DB_POOL_PRE_PING = getattr(settings, "DB_POOL_PRE_PING", True)
+# Behind PgBouncer in transaction mode: no server-side prepared statement reuse.
+# LISTEN (assistant registry) and session advisory locks (retention) still need
+# a session-mode pool or a direct connection.
+DB_PGBOUNCER = getattr(settings, "DB_PGBOUNCER", False)
+
+
+class PoolStats:
+    """Checkout waits and connection churn of the engine's pool"""
+
+    def __init__(self, window: int = 1000):
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=window)
+
+    def record_wait(self, seconds: float) -> None:
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.recent_waits.append(seconds)
+
+    def stats(self) -> Dict:
+        pool = engine.sync_engine.pool
+        ordered = sorted(self.recent_waits)
+        waits = len(ordered)
+        result = {
+            "pool": type(pool).__name__,
+            "pgbouncer": DB_PGBOUNCER,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "checkout_wait": {
+                "avg_ms": round(sum(ordered) / waits * 1000, 3) if waits else None,
+                "p95_ms": round(ordered[min(int(waits * 0.95), waits - 1)] * 1000, 3) if waits else None,
+                "max_ms": round(self.wait_max * 1000, 3),
+            },
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            result.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return result
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that times how long checkouts wait for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+def _engine_options() -> Dict:
+    options: Dict = {"echo": settings.DEBUG, "future": True}
+    if DB_POOL_SIZE > 0:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    else:
+        options["poolclass"] = NullPool
+    if DB_PGBOUNCER:
+        options["connect_args"] = {
+            "statement_cache_size": 0,  # asyncpg
+            "prepared_statement_cache_size": 0,  # SQLAlchemy's adapter
+            # Unique names, so statements that still get prepared never collide across server connections
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+
 # Create async engine
-engine = create_async_engine(
-    async_database_url,
-    echo=settings.DEBUG,
-    poolclass=NullPool,  # For development
-    future=True
-)
+engine = create_async_engine(async_database_url, **_engine_options())
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.connects += 1
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.checkouts += 1
+
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.invalidations += 1
 
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
@@ -28,6 +139,9 @@ AsyncSessionLocal = sessionmaker(
 # Base class for models
 Base = declarative_base()
 
+# Create global instance
+pool_stats = PoolStats()
+
 
 async def get_db():
     """Dependency to get database session"""
@@ -37,6 +151,41 @@ async def get_db():
         finally:
             await session.close()
 
+async def copy_records(
+    db: AsyncSession,
+    table: Table,
+    columns: Sequence[str],
+    records: Iterable[tuple],
+    batch_size: int = 5000,
+) -> int:
+    """Bulk insert rows inside the session's transaction
+    
+    Uses asyncpg's binary COPY protocol in bounded batches. Records hold
+    driver-level values (e.g. JSON as str), and column defaults are not
+    applied by COPY, so callers pass every column without a server default.
+    """
+    conn = await db.connection()
+    # Make the driver adapter open its transaction so COPY becomes part of it
+    await conn.execute(text("SELECT 1"))
+    raw = await conn.get_raw_connection()
+    driver = raw.driver_connection
+    
+    total = 0
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        await driver.copy_records_to_table(
+            table.name,
+            records=batch,
+            columns=list(columns),
+            schema_name=table.schema,
+        )
+        total += len(batch)
+    return total
+
+
 def get_db_sync():
     """Synchronous database session for testing"""
     from sqlalchemy.orm import sessionmaker
@@ -58,6 +207,13 @@ async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         # Import models here to ensure they are registered
-        from app.models import user, assistant, chat, audit, ticket, config
+        from app.models import user, assistant, chat, audit, ticket, config, training
         
+        # The message_search GIN index combines a uuid and a tsvector column
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
         await conn.run_sync(Base.metadata.create_all)
+    
+    # Partitioned tables accept rows only once their partitions exist
+    from app.core.partitions import partition_manager
+    async with AsyncSessionLocal() as session:
+        await partition_manager.ensure_partitions(session)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.audit import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "idempotent-replayed"
+
+# Outcomes of `begin`
+CLAIMED = "claimed"  # caller runs the request and must call `finish` or `release`
+REPLAY = "replay"  # a stored response is returned
+MISMATCH = "mismatch"  # key was used for a different request
+BUSY = "busy"  # the original is still running after the wait timeout
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    headers: List[List[str]]
+    body: bytes
+
+
+class IdempotencyStore:
+    """Exactly-once execution of requests that carry an Idempotency-Key
+
+    The first request with a key claims it with a single INSERT and runs;
+    its final response is stored on the same row. Retries of a completed
+    request get that response back without running the handler again (and
+    without a provider call). Retries arriving while the original still
+    runs wait for it: on an in-process future when it runs in this worker,
+    by polling the row otherwise. Completed responses are also kept in
+    memory, so replays in the same worker need no query.
+
+    Keys are scoped to the caller's credentials. Failed (5xx) requests release
+    their key, so they can be retried. A claim whose worker died is taken
+    over once `lease_seconds` have passed.
+    """
+
+    def __init__(self):
+        self.ttl = timedelta(hours=getattr(settings, "IDEMPOTENCY_TTL_HOURS", 24))
+        self.wait_seconds = getattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 60.0)
+        self.poll_seconds = getattr(settings, "IDEMPOTENCY_POLL_SECONDS", 0.2)
+        self.lease_seconds = getattr(settings, "IDEMPOTENCY_LEASE_SECONDS", 300)
+        self.max_body_bytes = getattr(settings, "IDEMPOTENCY_MAX_BODY_BYTES", 1024 * 1024)
+        self.cache = TTLCache(
+            max_entries=getattr(settings, "IDEMPOTENCY_CACHE_SIZE", 2048),
+            ttl_seconds=self.ttl.total_seconds(),
+            max_bytes=getattr(settings, "IDEMPOTENCY_CACHE_BYTES", 32 * 1024 * 1024),
+            sizeof=lambda stored: len(stored.body),
+        )
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counts = {"claimed": 0, "replayed": 0, "waited": 0, "mismatched": 0, "busy": 0, "released": 0}
+
+    @staticmethod
+    def scope_key(principal: str, key: str) -> str:
+        return sha256(f"{principal}\n{key}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+        digest = sha256(f"{method} {path}?".encode("utf-8"))
+        digest.update(query)
+        digest.update(b"\n")
+        digest.update(body)
+        return digest.hexdigest()
+
+    def cutoff(self) -> datetime:
+        """Keys created before this may be purged"""
+        return datetime.now(timezone.utc) - self.ttl
+
+    async def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """Claim `key`, or wait for its original and return the stored response"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_seconds
+        waited = False
+        while True:
+            local = self._inflight.get(key)
+            if local is not None:
+                waited = True
+                try:
+                    await asyncio.wait_for(asyncio.shield(local), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    self.counts["busy"] += 1
+                    return BUSY, None
+                continue
+
+            stored = self.cache.get(key)
+            if stored is not None:
+                outcome = self._outcome(stored, fingerprint, waited)
+                return outcome, stored if outcome == REPLAY else None
+
+            outcome, stored = await self._claim(key, fingerprint)
+            if outcome == CLAIMED:
+                # Local duplicates wait on this from now on
+                self._inflight[key] = loop.create_future()
+                self.counts["claimed"] += 1
+                return CLAIMED, None
+            if outcome in (REPLAY, MISMATCH):
+                if outcome == REPLAY:
+                    self.cache.set(key, stored)
+                return self._outcome(stored, fingerprint, waited), stored if outcome == REPLAY else None
+
+            # Running in another worker (or released a moment ago): poll
+            waited = True
+            if loop.time() >= deadline:
+                self.counts["busy"] += 1
+                return BUSY, None
+            await asyncio.sleep(self.poll_seconds)
+
+    def _outcome(self, stored: StoredResponse, fingerprint: str, waited: bool) -> str:
+        if stored.fingerprint != fingerprint:
+            self.counts["mismatched"] += 1
+            return MISMATCH
+        self.counts["replayed"] += 1
+        if waited:
+            self.counts["waited"] += 1
+        return REPLAY
+
+    async def _claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        async with AsyncSessionLocal() as db:
+            claimed = await db.scalar(
+                insert(IdempotencyKey)
+                .values(key=key, fingerprint=fingerprint, status="in_progress")
+                .on_conflict_do_nothing(index_elements=[IdempotencyKey.key])
+                .returning(IdempotencyKey.key)
+            )
+            if claimed is not None:
+                await db.commit()
+                return CLAIMED, None
+
+            row = await db.scalar(select(IdempotencyKey).where(IdempotencyKey.key == key))
+            if row is None:
+                return BUSY, None  # released just now; claim again
+            stored = StoredResponse(
+                fingerprint=row.fingerprint,
+                status=row.response_status or 0,
+                headers=row.response_headers or [],
+                body=row.response_body or b"",
+            )
+            if row.fingerprint != fingerprint:
+                return MISMATCH, stored
+            if row.status == "completed":
+                return REPLAY, stored
+
+            # The claiming worker may have died; take over an expired lease
+            taken = await db.scalar(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.status == "in_progress",
+                    IdempotencyKey.created_at < func.now() - timedelta(seconds=self.lease_seconds),
+                )
+                .values(created_at=func.now())
+                .returning(IdempotencyKey.key)
+            )
+            await db.commit()
+            if taken is not None:
+                logger.warning(f"Took over stale idempotency key {key[:12]}")
+                return CLAIMED, None
+            return BUSY, None
+
+    async def finish(self, key: str, fingerprint: str, status: int, headers: List[List[str]], body: bytes) -> None:
+        """Store the final response of a claimed request and wake up local waiters"""
+        stored = StoredResponse(fingerprint, status, headers, body)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key)
+                    .values(
+                        status="completed",
+                        response_status=status,
+                        response_headers=headers,
+                        response_body=body,
+                        completed_at=func.now(),
+                    )
+                )
+                await db.commit()
+            self.cache.set(key, stored)
+        finally:
+            self._resolve(key)
+
+    async def release(self, key: str) -> None:
+        """Forget a claimed key without a response, so the request can be retried"""
+        self.counts["released"] += 1
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+                await db.commit()
+        except Exception as e:
+            # The claim then lapses after `lease_seconds`
+            logger.warning(f"Could not release idempotency key {key[:12]}: {e}")
+        finally:
+            self._resolve(key)
+
+    def _resolve(self, key: str) -> None:
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            "in_flight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
+
+
+# Create global instance
+idempotency_store = IdempotencyStore()
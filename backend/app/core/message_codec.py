@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.message_keys import NONCE_BYTES, as_uuid, key_ring
+from app.models.assistant import Assistant
+from app.models.chat import CompressionDictionary, Message, Thread
+
+try:
+    import zstandard as zstd
+except ImportError:  # stored content stays plain UTF-8
+    zstd = None
+
+logger = logging.getLogger(__name__)
+
+# Stored content starts with a format byte. Legacy rows are plain UTF-8,
+# whose first byte is never 0xF5-0xFF, so those values mark encoded payloads.
+FORMAT_ZSTD = 0xF5  # FORMAT_ZSTD + zstd frame
+FORMAT_ZSTD_DICT = 0xF6  # FORMAT_ZSTD_DICT + 4-byte dictionary id (big endian) + zstd frame
+FORMAT_AES_GCM = 0xFA  # FORMAT_AES_GCM + 12-byte nonce + AES-GCM(plain or zstd payload)
+FIRST_FORMAT_BYTE = 0xF5
+
+
+def is_plain(data: bytes) -> bool:
+    return not data or data[0] < FIRST_FORMAT_BYTE
+
+
+def is_encrypted(data: Optional[bytes]) -> bool:
+    return bool(data) and data[0] == FORMAT_AES_GCM
+
+
+def seal(cipher, payload: bytes, aad: bytes) -> bytes:
+    nonce = os.urandom(NONCE_BYTES)
+    return bytes([FORMAT_AES_GCM]) + nonce + cipher.encrypt(nonce, payload, aad)
+
+
+def unseal(cipher, data: Optional[bytes], aad: bytes) -> bytes:
+    """Compressed or plain payload of stored content, decrypting sealed values"""
+    if not is_encrypted(data):
+        return data or b""
+    if cipher is None:
+        raise ValueError("Encrypted content needs the thread key")
+    return cipher.decrypt(data[1:1 + NONCE_BYTES], data[1 + NONCE_BYTES:], aad)
+
+
+def message_aad(message_id) -> bytes:
+    """Associated data binding message content to its row"""
+    return as_uuid(message_id).bytes
+
+
+def thread_field_aad(thread_id, field: str) -> bytes:
+    """Associated data binding a thread column (preview, summary) to its thread"""
+    return as_uuid(thread_id).bytes + field.encode()
+
+
+def header_dictionary_id(data: bytes) -> Optional[int]:
+    if data and data[0] == FORMAT_ZSTD_DICT:
+        return int.from_bytes(data[1:5], "big")
+    return None
+
+
+class MessageCodec:
+    """Storage codec for message content: zstd, then AES-GCM
+
+    Short chat messages compress poorly on their own; a dictionary trained on
+    an assistant's past messages supplies the shared vocabulary. Dictionaries
+    are immutable once stored, so decoding only needs the id in the header;
+    retraining adds a new one that new writes pick up. The compressed payload
+    is encrypted with the thread's data key (see KeyRing), authenticated
+    with the row id, so ciphertext can't be moved between rows.
+    """
+
+    def __init__(self):
+        self.level = getattr(settings, "MESSAGE_COMPRESSION_LEVEL", 6)
+        self.min_bytes = getattr(settings, "MESSAGE_COMPRESSION_MIN_BYTES", 64)  # smaller stays plain
+        self.dictionary_size = getattr(settings, "MESSAGE_DICTIONARY_SIZE", 112 * 1024)
+        self.dictionary_samples = getattr(settings, "MESSAGE_DICTIONARY_SAMPLES", 5000)
+        self.dictionary_min_samples = getattr(settings, "MESSAGE_DICTIONARY_MIN_SAMPLES", 200)
+        self._dictionaries: Dict[int, "zstd.ZstdCompressionDict"] = {}
+        self._compressors: Dict[int, "zstd.ZstdCompressor"] = {}
+        self._decompressors: Dict[int, "zstd.ZstdDecompressor"] = {}
+        # assistant id -> active dictionary id (0: none)
+        self._active = TTLCache(max_entries=4096, ttl_seconds=300)
+        if zstd is None:
+            logger.warning("zstandard not installed, message content is stored uncompressed")
+
+    # -- encoding ----------------------------------------------------------
+
+    def _compressor(self, dictionary_id: int):
+        compressor = self._compressors.get(dictionary_id)
+        if compressor is None:
+            dictionary = self._dictionaries.get(dictionary_id) if dictionary_id else None
+            compressor = zstd.ZstdCompressor(level=self.level, dict_data=dictionary)
+            self._compressors[dictionary_id] = compressor
+        return compressor
+
+    def compress(self, text: str, dictionary_id: int = 0) -> bytes:
+        """Compressed form of `text`; plain UTF-8 when compression doesn't pay off"""
+        plain = text.encode("utf-8")
+        if zstd is None or len(plain) < self.min_bytes:
+            return plain
+        frame = self._compressor(dictionary_id).compress(plain)
+        if dictionary_id:
+            encoded = bytes([FORMAT_ZSTD_DICT]) + dictionary_id.to_bytes(4, "big") + frame
+        else:
+            encoded = bytes([FORMAT_ZSTD]) + frame
+        return encoded if len(encoded) < len(plain) else plain
+
+    def encode(self, text: str, dictionary_id: int = 0, cipher=None, aad: bytes = b"") -> bytes:
+        """Stored form of `text`: compressed, then sealed when a thread `cipher` is given"""
+        payload = self.compress(text, dictionary_id)
+        return seal(cipher, payload, aad) if cipher is not None else payload
+
+    async def active_dictionary(self, db: AsyncSession, assistant_id) -> int:
+        if zstd is None or assistant_id is None:
+            return 0
+        key = str(assistant_id)
+        dictionary_id = self._active.get(key)
+        if dictionary_id is None:
+            row = (await db.execute(
+                select(CompressionDictionary.id, CompressionDictionary.dict_data)
+                .where(CompressionDictionary.assistant_id == assistant_id)
+                .order_by(CompressionDictionary.id.desc())
+                .limit(1)
+            )).first()
+            dictionary_id = 0
+            if row is not None:
+                dictionary_id = row.id
+                self._register(row.id, row.dict_data)
+            self._active.set(key, dictionary_id)
+        return dictionary_id
+
+    # -- decoding ----------------------------------------------------------
+
+    def _register(self, dictionary_id: int, data: bytes) -> None:
+        if dictionary_id not in self._dictionaries:
+            self._dictionaries[dictionary_id] = zstd.ZstdCompressionDict(data)
+
+    def decompress(self, data: Optional[bytes]) -> str:
+        """Plain text of unencrypted content; dictionaries must be loaded (see `decode_all`)"""
+        data = data or b""
+        if is_plain(data):
+            return data.decode("utf-8", errors="replace")
+        if zstd is None:
+            raise RuntimeError("zstandard is required to read compressed messages")
+        if data[0] == FORMAT_ZSTD:
+            dictionary_id, frame = 0, data[1:]
+        elif data[0] == FORMAT_ZSTD_DICT:
+            dictionary_id, frame = header_dictionary_id(data), data[5:]
+        else:
+            raise ValueError(f"Unknown message content format 0x{data[0]:02x}")
+        decompressor = self._decompressors.get(dictionary_id)
+        if decompressor is None:
+            dictionary = self._dictionaries[dictionary_id] if dictionary_id else None
+            decompressor = zstd.ZstdDecompressor(dict_data=dictionary)
+            self._decompressors[dictionary_id] = decompressor
+        return decompressor.decompress(frame).decode("utf-8", errors="replace")
+
+    async def load_dictionaries(self, db: AsyncSession, blobs: Iterable[bytes]) -> None:
+        """Load dictionaries referenced by `blobs` that this worker hasn't seen"""
+        missing = {
+            dictionary_id
+            for dictionary_id in map(header_dictionary_id, blobs)
+            if dictionary_id is not None and dictionary_id not in self._dictionaries
+        }
+        if not missing:
+            return
+        rows = await db.execute(
+            select(CompressionDictionary.id, CompressionDictionary.dict_data)
+            .where(CompressionDictionary.id.in_(missing))
+        )
+        for row in rows:
+            self._register(row.id, row.dict_data)
+
+    def decode(self, data: Optional[bytes], cipher=None, aad: bytes = b"") -> str:
+        """Plain text of a single value stored without dictionary (thread preview, summary)"""
+        return self.decompress(unseal(cipher, data, aad))
+
+    async def decode_all(
+        self,
+        db: AsyncSession,
+        blobs: Sequence[bytes],
+        cipher=None,
+        aads: Optional[Sequence[bytes]] = None,
+    ) -> List[str]:
+        """Decode a page of one thread's content in one pass: decrypt, load dictionaries, decompress
+
+        `aads` are the per-row associated data (see `message_aad`).
+        """
+        payloads = [unseal(cipher, blob, aads[i] if aads else b"") for i, blob in enumerate(blobs)]
+        return await self.decompress_all(db, payloads)
+
+    async def decompress_all(self, db: AsyncSession, payloads: Sequence[bytes]) -> List[str]:
+        await self.load_dictionaries(db, payloads)
+        return [self.decompress(payload) for payload in payloads]
+
+    # -- dictionaries ------------------------------------------------------
+
+    async def train_dictionary(self, db: AsyncSession, assistant_id) -> Optional[int]:
+        """Train and store a dictionary from the assistant's recent messages"""
+        if zstd is None:
+            return None
+        rows = (await db.execute(
+            select(Message.id, Message.thread_id, Message.content_ciphertext, Thread.data_key)
+            .join(Thread, Thread.id == Message.thread_id)
+            .where(
+                Thread.assistant_id == assistant_id,
+                func.length(Message.content_ciphertext) >= self.min_bytes,
+            )
+            .order_by(Message.created_at.desc())
+            .limit(self.dictionary_samples)
+        )).all()
+        if len(rows) < self.dictionary_min_samples:
+            return None
+        payloads = [
+            unseal(key_ring.cipher(row.thread_id, row.data_key), row.content_ciphertext, message_aad(row.id))
+            for row in rows
+        ]
+        samples = [text.encode("utf-8") for text in await self.decompress_all(db, payloads)]
+        trained = await asyncio.to_thread(zstd.train_dictionary, self.dictionary_size, samples)
+
+        dictionary = CompressionDictionary(
+            assistant_id=assistant_id,
+            dict_data=trained.as_bytes(),
+            sample_count=len(samples),
+        )
+        db.add(dictionary)
+        await db.commit()
+        self._register(dictionary.id, dictionary.dict_data)
+        self._active.set(str(assistant_id), dictionary.id)
+        logger.info(
+            f"Trained message dictionary {dictionary.id} for assistant {assistant_id} "
+            f"from {len(samples)} samples"
+        )
+        return dictionary.id
+
+    async def recompress_messages(
+        self,
+        batch_size: int = 500,
+        pause_seconds: float = 0.05,
+        retrain: bool = False,
+    ) -> Dict[str, int]:
+        """Rewrite unsealed (legacy) message content compressed and encrypted
+
+        Runs online per assistant: trains a dictionary if there is none (or
+        `retrain`), then walks that assistant's unsealed rows in primary-key
+        order in short transactions, creating thread keys as needed. Thread
+        previews and summaries are sealed the same way. Safe to interrupt
+        and re-run.
+        """
+        if zstd is None:
+            raise RuntimeError("zstandard is required to recompress messages")
+        async with AsyncSessionLocal() as db:
+            assistant_ids = (await db.execute(select(Assistant.id))).scalars().all()
+
+        totals = {"rows": 0, "threads": 0, "bytes_before": 0, "bytes_after": 0}
+        for assistant_id in assistant_ids:
+            async with AsyncSessionLocal() as db:
+                dictionary_id = await self.active_dictionary(db, assistant_id)
+                if retrain or not dictionary_id:
+                    dictionary_id = await self.train_dictionary(db, assistant_id) or dictionary_id
+
+            last_id = None
+            while True:
+                async with AsyncSessionLocal() as db:
+                    query = (
+                        select(
+                            Message.id, Message.created_at, Message.thread_id, Message.content_ciphertext,
+                            Thread.data_key,
+                        )
+                        .join(Thread, Thread.id == Message.thread_id)
+                        .where(
+                            Thread.assistant_id == assistant_id,
+                            func.substring(Message.content_ciphertext, 1, 1) != bytes([FORMAT_AES_GCM]),
+                        )
+                        .order_by(Message.id)
+                        .limit(batch_size)
+                    )
+                    if last_id is not None:
+                        query = query.where(Message.id > last_id)
+                    rows = (await db.execute(query)).all()
+                    if not rows:
+                        break
+
+                    await self.load_dictionaries(db, [row.content_ciphertext for row in rows])
+                    changes = []
+                    for row in rows:
+                        cipher = await key_ring.thread_cipher(db, row.thread_id, row.data_key)
+                        encoded = self.encode(
+                            self.decompress(row.content_ciphertext), dictionary_id, cipher, message_aad(row.id)
+                        )
+                        totals["bytes_before"] += len(row.content_ciphertext)
+                        totals["bytes_after"] += len(encoded)
+                        # Full primary key: messages is partitioned on created_at
+                        changes.append({"id": row.id, "created_at": row.created_at, "content_ciphertext": encoded})
+                    await db.execute(update(Message), changes)
+                    await db.commit()
+
+                totals["rows"] += len(rows)
+                last_id = rows[-1].id
+                await asyncio.sleep(pause_seconds)
+
+            totals["threads"] += await self._seal_thread_fields(assistant_id, batch_size, pause_seconds)
+            logger.info(f"Recompressed messages of assistant {assistant_id}: {totals}")
+        return totals
+
+    async def _seal_thread_fields(self, assistant_id, batch_size: int, pause_seconds: float) -> int:
+        """Encrypt plain previews and summaries of the assistant's threads"""
+        sealed = bytes([FORMAT_AES_GCM])
+        count = 0
+        last_id = None
+        while True:
+            async with AsyncSessionLocal() as db:
+                query = (
+                    select(Thread.id, Thread.data_key, Thread.last_message_preview, Thread.summary)
+                    .where(
+                        Thread.assistant_id == assistant_id,
+                        or_(
+                            func.substring(Thread.last_message_preview, 1, 1) != sealed,
+                            func.substring(Thread.summary, 1, 1) != sealed,
+                        ),
+                    )
+                    .order_by(Thread.id)
+                    .limit(batch_size)
+                )
+                if last_id is not None:
+                    query = query.where(Thread.id > last_id)
+                rows = (await db.execute(query)).all()
+                if not rows:
+                    return count
+
+                changes = []
+                for row in rows:
+                    cipher = await key_ring.thread_cipher(db, row.id, row.data_key)
+                    change = {"id": row.id}
+                    for field, value in (("last_message_preview", row.last_message_preview), ("summary", row.summary)):
+                        if value is not None and not is_encrypted(value):
+                            aad = thread_field_aad(row.id, field)
+                            change[field] = self.encode(self.decode(value), 0, cipher, aad)
+                    changes.append(change)
+                for change in changes:
+                    await db.execute(update(Thread).where(Thread.id == change.pop("id")).values(**change))
+                await db.commit()
+
+            count += len(rows)
+            last_id = rows[-1].id
+            await asyncio.sleep(pause_seconds)
+
+
+# Create global instance
+message_codec = MessageCodec()
@@ -0,0 +1,146 @@
+import base64
+import logging
+import os
+import uuid
+from typing import Dict, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.chat import Thread
+
+logger = logging.getLogger(__name__)
+
+NONCE_BYTES = 12
+
+
+def as_uuid(value) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+class KeyRing:
+    """Envelope keys for message content
+
+    Every thread has its own 256-bit data key, stored on the thread wrapped
+    (AES-GCM) by a master key and bound to the thread id. Unwrapped keys are
+    kept in a bounded TTL cache, so reads and writes normally do no key work
+    beyond one AES-GCM operation per message. Deleting a thread's key makes
+    its content unrecoverable.
+
+    Wrapped key layout: 1-byte master key id + 12-byte nonce + ciphertext.
+
+    The master key must be configured explicitly (MESSAGE_MASTER_KEY); only
+    development falls back to one derived from SECRET_KEY. To rotate, set
+    the new key and id and list the retired ones in
+    MESSAGE_PREVIOUS_MASTER_KEYS ("id:base64key,..."), so keys they wrapped
+    can still be unwrapped.
+    """
+
+    def __init__(self):
+        self.master_key_id = getattr(settings, "MESSAGE_MASTER_KEY_ID", 1)
+        self._master_keys: Dict[int, AESGCM] = {
+            key_id: AESGCM(key) for key_id, key in self._load_previous_master_keys().items()
+        }
+        self._master_keys[self.master_key_id] = AESGCM(self._load_master_key(self.master_key_id))
+        self._data_keys = TTLCache(
+            max_entries=getattr(settings, "MESSAGE_KEY_CACHE_SIZE", 10000),
+            ttl_seconds=getattr(settings, "MESSAGE_KEY_CACHE_TTL", 900),
+        )
+
+    @staticmethod
+    def _decode_master_key(value: str, name: str) -> bytes:
+        key = base64.b64decode(value)
+        if len(key) != 32:
+            raise ValueError(f"{name} must be 32 bytes, base64-encoded")
+        return key
+
+    @classmethod
+    def _load_master_key(cls, key_id: int) -> bytes:
+        configured = getattr(settings, "MESSAGE_MASTER_KEY", None)
+        if configured:
+            return cls._decode_master_key(configured, "MESSAGE_MASTER_KEY")
+        # Fail closed: a key derived from SECRET_KEY changes with it and cannot be rotated
+        if getattr(settings, "ENVIRONMENT", "production") != "development":
+            raise RuntimeError("MESSAGE_MASTER_KEY must be set outside development")
+        if key_id != 1 or getattr(settings, "MESSAGE_PREVIOUS_MASTER_KEYS", None):
+            raise RuntimeError("Rotating the message master key requires an explicit MESSAGE_MASTER_KEY")
+        logger.warning("MESSAGE_MASTER_KEY not set, deriving the message master key from SECRET_KEY (development only)")
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"ai-gateway message master key",
+        ).derive(settings.SECRET_KEY.encode("utf-8"))
+
+    @classmethod
+    def _load_previous_master_keys(cls) -> Dict[int, bytes]:
+        """Retired master keys by id, from "id:base64key,..."; never derived"""
+        keys: Dict[int, bytes] = {}
+        for entry in (getattr(settings, "MESSAGE_PREVIOUS_MASTER_KEYS", None) or "").split(","):
+            if not entry.strip():
+                continue
+            key_id, _, value = entry.partition(":")
+            if not value:
+                raise ValueError("MESSAGE_PREVIOUS_MASTER_KEYS entries must be id:base64key")
+            keys[int(key_id)] = cls._decode_master_key(value.strip(), "MESSAGE_PREVIOUS_MASTER_KEYS")
+        return keys
+
+    def wrap(self, data_key: bytes, thread_id) -> bytes:
+        nonce = os.urandom(NONCE_BYTES)
+        master = self._master_keys[self.master_key_id]
+        return bytes([self.master_key_id]) + nonce + master.encrypt(nonce, data_key, as_uuid(thread_id).bytes)
+
+    def unwrap(self, wrapped: bytes, thread_id) -> bytes:
+        master = self._master_keys.get(wrapped[0])
+        if master is None:
+            raise ValueError(f"Unknown master key id {wrapped[0]}")
+        nonce, ciphertext = wrapped[1:1 + NONCE_BYTES], wrapped[1 + NONCE_BYTES:]
+        return master.decrypt(nonce, ciphertext, as_uuid(thread_id).bytes)
+
+    def new_wrapped_key(self, thread_id) -> bytes:
+        """Fresh wrapped data key for a new thread"""
+        return self.wrap(AESGCM.generate_key(bit_length=256), thread_id)
+
+    def cipher(self, thread_id, wrapped: Optional[bytes]) -> Optional[AESGCM]:
+        """Thread's data key from cache, unwrapping it on a miss; None for threads without a key"""
+        if wrapped is None:
+            return None
+        key = str(thread_id)
+        cipher = self._data_keys.get(key)
+        if cipher is None:
+            cipher = AESGCM(self.unwrap(wrapped, thread_id))
+            self._data_keys.set(key, cipher)
+        return cipher
+
+    async def thread_cipher(self, db: AsyncSession, thread_id, wrapped: Optional[bytes]) -> AESGCM:
+        """Like `cipher`, creating the key for threads that predate encryption"""
+        if wrapped is None:
+            cached = self._data_keys.get(str(thread_id))
+            if cached is not None:
+                return cached
+            candidate = self.new_wrapped_key(thread_id)
+            # First writer wins; concurrent creators read the winner back
+            wrapped = await db.scalar(
+                update(Thread)
+                .where(Thread.id == thread_id)
+                .values(data_key=func.coalesce(Thread.data_key, candidate))
+                .returning(Thread.data_key)
+            )
+            if wrapped is None:
+                raise ValueError(f"Thread {thread_id} not found")
+        return self.cipher(thread_id, wrapped)
+
+    def forget(self, thread_id) -> None:
+        self._data_keys.invalidate(str(thread_id))
+
+    def stats(self) -> Dict:
+        return self._data_keys.stats()
+
+
+# Create global instance
+key_ring = KeyRing()
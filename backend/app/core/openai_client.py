@@ -120,16 +120,19 @@ class OpenAIClient:
         model: Optional[str] = None,
         conversation_id: Optional[str] = None,
         instructions: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
     ) -> Dict[str, Any]:
         """
         Create a response via Responses API.
         Returns short text and the raw payload.
 
+        `history` holds earlier turns as {"role", "content"} dicts, oldest first.
         Falls back to Chat Completions if /responses is unavailable.
         """
+        messages = list(history or []) + [{"role": "user", "content": input_text}]
         payload: Dict[str, Any] = {
             "model": model or self.default_model,
-            "input": input_text,
+            "input": messages if history else input_text,
         }
         if instructions:
             payload["instructions"] = instructions
@@ -164,8 +167,10 @@ class OpenAIClient:
                 e,
             )
             # Fallback to Chat Completions
+            if instructions:
+                messages.insert(0, {"role": "system", "content": instructions})
             result = await self.chat_completion(
-                messages=[{"role": "user", "content": input_text}],
+                messages=messages,
                 model=model or self.default_model,
             )
             return {"text": result.get("content", ""), "raw": result}
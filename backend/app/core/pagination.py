@@ -0,0 +1,57 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of a row"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of `encode_cursor`; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_after(created_at_column, id_column, cursor: Optional[str], descending: bool = False):
+    """WHERE clause for rows after `cursor` in (created_at, id) order, or None"""
+    if not cursor:
+        return None
+    position = tuple_(created_at_column, id_column)
+    key = tuple_(*decode_cursor(cursor))
+    return position < key if descending else position > key
+
+
+def encode_rank_cursor(rank: float, created_at: datetime, row_id) -> str:
+    """Keyset cursor for the (rank, created_at, id) position of a ranked result"""
+    raw = f"{rank!r}|{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, datetime, uuid.UUID]:
+    """Inverse of `encode_rank_cursor`; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 2)
+        return float(rank), datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def ranked_keyset_after(rank_expression, created_at_column, id_column, cursor: Optional[str]):
+    """WHERE clause for rows after `cursor` in descending (rank, created_at, id) order, or None"""
+    if not cursor:
+        return None
+    return tuple_(rank_expression, created_at_column, id_column) < tuple_(*decode_rank_cursor(cursor))
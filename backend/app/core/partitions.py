@@ -0,0 +1,126 @@
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Range-partitioned by month on created_at (migrations/014_time_partitioning.sql,
+# 015_message_search.sql)
+PARTITIONED_TABLES = ("messages", "audit_logs", "message_search")
+
+PARTITION_NAME = re.compile(r"^(?P<parent>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+@dataclass
+class Partition:
+    name: str
+    start: date  # inclusive
+    end: date  # exclusive
+
+
+class PartitionManager:
+    """Monthly partitions of the time-series tables
+
+    Partitions are created `months_ahead` in advance, so inserts never hit a
+    missing range; there is no default partition that could silently collect
+    rows. Expired partitions are detached and dropped whole by the retention
+    engine instead of being deleted row by row.
+    """
+
+    def __init__(self):
+        self.months_ahead = getattr(settings, "PARTITION_MONTHS_AHEAD", 3)
+        self.lock_timeout_ms = getattr(settings, "PARTITION_LOCK_TIMEOUT_MS", 2000)
+
+    async def is_partitioned(self, db: AsyncSession, table: str) -> bool:
+        return bool(await db.scalar(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)"
+            ),
+            {"table": table},
+        ))
+
+    async def partitions(self, db: AsyncSession, table: str) -> List[Partition]:
+        """Monthly partitions of `table`, oldest first"""
+        names = (await db.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table"
+            ),
+            {"table": table},
+        )).scalars().all()
+        result = []
+        for name in names:
+            match = PARTITION_NAME.match(name)
+            if match and match["parent"] == table:
+                start = date(int(match["year"]), int(match["month"]), 1)
+                result.append(Partition(name, start, add_months(start, 1)))
+        return sorted(result, key=lambda partition: partition.start)
+
+    async def ensure_partitions(self, db: AsyncSession, now: Optional[datetime] = None) -> int:
+        """Create this month's and the next `months_ahead` partitions; returns how many were new"""
+        now = now or datetime.now(timezone.utc)
+        this_month = date(now.year, now.month, 1)
+        created = 0
+        for table in PARTITIONED_TABLES:
+            if not await self.is_partitioned(db, table):
+                continue
+            existing = {partition.name for partition in await self.partitions(db, table)}
+            for offset in range(self.months_ahead + 1):
+                month = add_months(this_month, offset)
+                name = partition_name(table, month)
+                if name in existing:
+                    continue
+                await self.create_partition(db, table, month)
+                created += 1
+        await db.commit()
+        return created
+
+    async def create_partition(self, db: AsyncSession, table: str, month: date) -> None:
+        """Partition of `table` for `month`, in the caller's transaction; no-op if it exists"""
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+            f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+        ))
+        logger.info(f"Ensured partition {partition_name(table, month)}")
+
+    async def expired(self, db: AsyncSession, table: str, cutoff: datetime) -> List[Partition]:
+        """Partitions whose whole range lies before `cutoff`"""
+        if not await self.is_partitioned(db, table):
+            return []
+        cutoff_day = cutoff.astimezone(timezone.utc).date()
+        return [partition for partition in await self.partitions(db, table) if partition.end <= cutoff_day]
+
+    async def drop(self, db: AsyncSession, table: str, partition: Partition) -> None:
+        """Detach and drop `partition` in the caller's transaction
+
+        The brief parent lock is bounded by a lock timeout, so a long-running
+        query makes the drop fail (and retry next run) instead of queueing
+        every new request behind it.
+        """
+        await db.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+        await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition.name}"))
+        await db.execute(text(f"DROP TABLE {partition.name}"))
+
+
+# Create global instance
+partition_manager = PartitionManager()
@@ -0,0 +1,385 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.idempotency import idempotency_store
+from app.core.message_keys import key_ring
+from app.core.partitions import Partition, partition_manager
+from app.models.audit import RetentionRun
+from app.models.config import GatewayConfig
+
+logger = logging.getLogger(__name__)
+
+# Oldest messages first; counters stay consistent with ConversationMemory, whose
+# summary covers a thread's first `summary_message_count` messages.
+PURGE_MESSAGES_SQL = """
+WITH doomed AS (
+    SELECT id, created_at FROM messages
+    WHERE created_at < :cutoff
+    ORDER BY created_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+),
+unindexed AS (
+    DELETE FROM message_search s USING doomed d
+    WHERE s.message_id = d.id AND s.created_at = d.created_at
+),{feedback}
+deleted AS (
+    DELETE FROM messages m USING doomed d WHERE m.id = d.id AND m.created_at = d.created_at
+    RETURNING m.thread_id
+),
+counts AS (
+    SELECT thread_id, COUNT(*) AS n FROM deleted GROUP BY thread_id
+),
+touched AS (
+    UPDATE threads t
+    SET message_count = GREATEST(t.message_count - c.n, 0),
+        summary = CASE WHEN t.summary_message_count <= c.n THEN NULL ELSE t.summary END,
+        summary_message_count = GREATEST(t.summary_message_count - c.n, 0)
+    FROM counts c
+    WHERE t.id = c.thread_id
+)
+SELECT COUNT(*) FROM deleted
+"""
+
+PURGE_FEEDBACK_CTE = """
+feedback_deleted AS (
+    DELETE FROM feedback f USING doomed d WHERE f.message_id = d.id
+),"""
+
+# Runs after the message purge, so expired threads are empty by then
+PURGE_THREADS_SQL = """
+WITH doomed AS (
+    SELECT t.id FROM threads t
+    WHERE COALESCE(t.last_message_at, t.created_at) < :cutoff
+      AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.thread_id = t.id)
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+),
+detached AS (
+    UPDATE tickets SET thread_id = NULL FROM doomed d WHERE tickets.thread_id = d.id
+)
+DELETE FROM threads t USING doomed d WHERE t.id = d.id
+RETURNING t.id
+"""
+
+PURGE_AUDIT_LOGS_SQL = """
+DELETE FROM audit_logs WHERE id IN (
+    SELECT id FROM audit_logs
+    WHERE created_at < :cutoff
+    ORDER BY created_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+# Stored responses of Idempotency-Key requests, see app.core.idempotency
+PURGE_IDEMPOTENCY_KEYS_SQL = """
+DELETE FROM idempotency_keys WHERE key IN (
+    SELECT key FROM idempotency_keys
+    WHERE created_at < :cutoff
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+# Chunks retired before the previous knowledge-base version; normally removed
+# by ContextManager's GC after activation, this catches what a crash left behind
+PURGE_CHUNKS_SQL = """
+DELETE FROM document_chunks WHERE id IN (
+    SELECT c.id FROM document_chunks c
+    JOIN training_documents d ON d.id = c.document_id
+    JOIN assistants a ON a.id = d.assistant_id
+    WHERE c.valid_to < a.kb_version
+    LIMIT :batch_size
+    FOR UPDATE OF c SKIP LOCKED
+)
+"""
+
+# Before a messages partition is dropped: same bookkeeping as PURGE_MESSAGES_SQL
+RELEASE_MESSAGE_PARTITION_SQL = """
+UPDATE threads t
+SET message_count = GREATEST(t.message_count - c.n, 0),
+    summary = CASE WHEN t.summary_message_count <= c.n THEN NULL ELSE t.summary END,
+    summary_message_count = GREATEST(t.summary_message_count - c.n, 0)
+FROM (SELECT thread_id, COUNT(*) AS n FROM {partition} GROUP BY thread_id) c
+WHERE t.id = c.thread_id
+"""
+
+RELEASE_FEEDBACK_SQL = "DELETE FROM feedback WHERE message_id IN (SELECT id FROM {partition})"
+
+REPLICATION_LAG_SQL = """
+SELECT COALESCE(MAX(pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn)), 0)
+FROM pg_stat_replication
+"""
+
+
+class RetentionEngine:
+    """Enforces GatewayConfig.retention_days on chat history, audit logs and chunks
+
+    Partitions of time-partitioned tables that lie entirely before the
+    cutoff are dropped whole. Remaining rows are deleted in bounded batches,
+    each in its own short transaction with a lock timeout and SKIP LOCKED, so
+    live traffic is never blocked behind the purge. Between batches the
+    engine pauses, and waits while replicas lag behind. Progress is recorded
+    per batch in `retention_runs`; an interrupted run simply resumes with the
+    next one. A Postgres advisory lock keeps runs to one worker at a time.
+    Retired chunks and expired idempotency keys are purged regardless of
+    the retention setting.
+    """
+
+    def __init__(self):
+        self.enabled = getattr(settings, "RETENTION_ENABLED", True)
+        self.batch_size = getattr(settings, "RETENTION_BATCH_SIZE", 1000)
+        self.pause_seconds = getattr(settings, "RETENTION_PAUSE_SECONDS", 0.2)
+        self.interval_seconds = getattr(settings, "RETENTION_INTERVAL_SECONDS", 3600)
+        self.lock_timeout_ms = getattr(settings, "RETENTION_LOCK_TIMEOUT_MS", 2000)
+        self.max_replication_lag = getattr(
+            settings, "RETENTION_MAX_REPLICATION_LAG_BYTES", 64 * 1024 * 1024
+        )
+        # Audit logs may have to be kept longer (or shorter) than chat content
+        self.audit_retention_days = getattr(settings, "AUDIT_RETENTION_DAYS", None)
+        self._loop_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._has_feedback: Optional[bool] = None
+        self.last_run: Optional[Dict] = None
+
+    # -- scheduling --------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the periodic maintenance loop (no-op if already running)
+
+        Future partitions are created even when purging is disabled.
+        """
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        tasks = [task for task in [self._loop_task, *self._tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def schedule_run(self) -> None:
+        """Start a run in the background, e.g. from the admin endpoint"""
+        task = asyncio.create_task(self.run_once(trigger="manual"))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await partition_manager.ensure_partitions(db)
+                if self.enabled:
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    # -- runs --------------------------------------------------------------
+
+    async def run_once(self, trigger: str = "schedule") -> Optional[Dict]:
+        """Purge everything past retention; None if another worker holds the run lock"""
+        lock_key = {"key": "retention"}
+        async with engine.connect() as lock_conn:
+            locked = await lock_conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), lock_key
+            )
+            if not locked:
+                logger.info("Retention run skipped, another worker is running one")
+                return None
+            try:
+                return await self._run(trigger)
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), lock_key)
+
+    async def _run(self, trigger: str) -> Dict:
+        async with AsyncSessionLocal() as db:
+            retention_days = await db.scalar(select(GatewayConfig.retention_days).limit(1))
+            if self._has_feedback is None:
+                self._has_feedback = bool(
+                    await db.scalar(text("SELECT to_regclass('feedback') IS NOT NULL"))
+                )
+            now = datetime.now(timezone.utc)
+            # 0 or no config: keep forever
+            cutoff = now - timedelta(days=retention_days) if retention_days else None
+            audit_days = self.audit_retention_days or retention_days
+            audit_cutoff = now - timedelta(days=audit_days) if audit_days else None
+
+            run = RetentionRun(trigger=trigger, cutoff=cutoff, status="running", deleted={})
+            db.add(run)
+            await db.commit()
+            run_id = run.id
+
+        targets: List[Tuple[str, Callable[[AsyncSession], Awaitable[int]]]] = []
+        if cutoff is not None:
+            targets += [
+                ("messages", lambda db: self._purge_messages(db, cutoff)),
+                ("threads", lambda db: self._purge_threads(db, cutoff)),
+            ]
+        if audit_cutoff is not None:
+            targets.append(("audit_logs", lambda db: self._execute_count(db, PURGE_AUDIT_LOGS_SQL, audit_cutoff)))
+        targets.append(("document_chunks", lambda db: self._execute_count(db, PURGE_CHUNKS_SQL)))
+        idempotency_cutoff = idempotency_store.cutoff()
+        targets.append((
+            "idempotency_keys",
+            lambda db: self._execute_count(db, PURGE_IDEMPOTENCY_KEYS_SQL, idempotency_cutoff),
+        ))
+
+        deleted: Dict[str, int] = {"partitions": 0}
+        status, error = "completed", None
+        try:
+            for table, table_cutoff in (
+                ("messages", cutoff), ("message_search", cutoff), ("audit_logs", audit_cutoff),
+            ):
+                if table_cutoff is not None:
+                    deleted[table] = await self._drop_partitions(run_id, table, table_cutoff, deleted)
+            for name, purge in targets:
+                deleted.setdefault(name, 0)
+                await self._drain(run_id, name, purge, deleted)
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Retention run {run_id} failed: {e}")
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(RetentionRun)
+                .where(RetentionRun.id == run_id)
+                .values(status=status, error=error, deleted=deleted, finished_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+        self.last_run = {
+            "id": str(run_id),
+            "status": status,
+            "cutoff": cutoff.isoformat() if cutoff else None,
+            "deleted": deleted,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        logger.info(f"Retention run {run_id} {status}: {deleted}")
+        return self.last_run
+
+    async def _drain(self, run_id, name: str, purge, deleted: Dict[str, int]) -> None:
+        """Run `purge` batch by batch until a batch comes back short"""
+        retries = 0
+        while True:
+            await self._wait_for_replicas()
+            async with AsyncSessionLocal() as db:
+                try:
+                    await db.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+                    count = await purge(db)
+                    deleted[name] += count
+                    # Progress commits together with the batch
+                    await db.execute(
+                        update(RetentionRun).where(RetentionRun.id == run_id).values(deleted=dict(deleted))
+                    )
+                    await db.commit()
+                except DBAPIError as e:
+                    await db.rollback()
+                    retries += 1
+                    if retries > 3:
+                        raise
+                    logger.warning(f"Retention batch on {name} failed, retrying: {e}")
+                    await asyncio.sleep(self.pause_seconds * 10 * retries)
+                    continue
+            retries = 0
+            if count < self.batch_size:
+                return
+            await asyncio.sleep(self.pause_seconds)
+
+    async def _drop_partitions(self, run_id, table: str, cutoff: datetime, deleted: Dict[str, int]) -> int:
+        """Drop expired partitions of `table`; returns the rows they held"""
+        removed = 0
+        async with AsyncSessionLocal() as db:
+            expired = await partition_manager.expired(db, table, cutoff)
+        for partition in expired:
+            await self._wait_for_replicas()
+            async with AsyncSessionLocal() as db:
+                try:
+                    rows = await self._release_partition(db, table, partition)
+                    await partition_manager.drop(db, table, partition)
+                    deleted["partitions"] += 1
+                    await db.execute(
+                        update(RetentionRun).where(RetentionRun.id == run_id).values(deleted=dict(deleted))
+                    )
+                    await db.commit()
+                except DBAPIError as e:
+                    await db.rollback()
+                    # Rows are deleted in batches instead; the drop is retried next run
+                    logger.warning(f"Could not drop partition {partition.name}: {e}")
+                    continue
+            removed += rows
+            logger.info(f"Dropped partition {partition.name} ({rows} rows)")
+            await asyncio.sleep(self.pause_seconds)
+        return removed
+
+    async def _release_partition(self, db: AsyncSession, table: str, partition: Partition) -> int:
+        """Bookkeeping for rows about to disappear with `partition`"""
+        rows = await db.scalar(text(f"SELECT COUNT(*) FROM {partition.name}")) or 0
+        if table == "messages":
+            if self._has_feedback:
+                await db.execute(text(RELEASE_FEEDBACK_SQL.format(partition=partition.name)))
+            await db.execute(text(RELEASE_MESSAGE_PARTITION_SQL.format(partition=partition.name)))
+        return rows
+
+    async def _wait_for_replicas(self) -> None:
+        """Block while any replica replays more than the allowed lag"""
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    lag = await db.scalar(text(REPLICATION_LAG_SQL)) or 0
+            except DBAPIError:
+                return  # no permission to see replication state
+            if lag <= self.max_replication_lag:
+                return
+            logger.info(f"Retention paused, replication lag {int(lag)} bytes")
+            await asyncio.sleep(max(self.pause_seconds, 1.0))
+
+    # -- batches -----------------------------------------------------------
+
+    async def _execute_count(self, db: AsyncSession, sql: str, cutoff: Optional[datetime] = None) -> int:
+        params = {"batch_size": self.batch_size}
+        if cutoff is not None:
+            params["cutoff"] = cutoff
+        result = await db.execute(text(sql), params)
+        return result.rowcount
+
+    async def _purge_messages(self, db: AsyncSession, cutoff: datetime) -> int:
+        sql = PURGE_MESSAGES_SQL.format(feedback=PURGE_FEEDBACK_CTE if self._has_feedback else "")
+        return await db.scalar(text(sql), {"cutoff": cutoff, "batch_size": self.batch_size}) or 0
+
+    async def _purge_threads(self, db: AsyncSession, cutoff: datetime) -> int:
+        thread_ids = (await db.execute(
+            text(PURGE_THREADS_SQL), {"cutoff": cutoff, "batch_size": self.batch_size}
+        )).scalars().all()
+        for thread_id in thread_ids:
+            key_ring.forget(thread_id)
+        return len(thread_ids)
+
+    # -- reporting ---------------------------------------------------------
+
+    async def recent_runs(self, db: AsyncSession, limit: int = 20) -> List[RetentionRun]:
+        return (await db.execute(
+            select(RetentionRun).order_by(RetentionRun.started_at.desc()).limit(limit)
+        )).scalars().all()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "scheduled": self._loop_task is not None,
+            "last_run": self.last_run,
+        }
+
+
+# Create global instance
+retention_engine = RetentionEngine()
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.config import GatewayConfig
+from app.models.user import Department
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first; clients opt into batch with the header
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+PRIORITY_HEADER = "X-Request-Priority"
+
+# Requests without a user or department (background work) share these buckets
+SYSTEM = "system"
+
+
+class QueueTimeout(Exception):
+    """No provider slot became free within the maximum wait"""
+
+
+@dataclass
+class Ticket:
+    user: str
+    department: str
+    priority: str
+    enqueued_at: float
+    future: asyncio.Future
+
+
+@dataclass
+class _DepartmentQueue:
+    weight: float = 1.0
+    # Virtual finish time of the department's last dispatched request
+    finish: float = 0.0
+    queues: Dict[str, Deque[Ticket]] = field(
+        default_factory=lambda: {priority: deque() for priority in PRIORITIES}
+    )
+
+    def idle(self) -> bool:
+        return not any(self.queues.values())
+
+
+class WaitStats:
+    """Queue wait times of one priority class"""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def _percentile(self, ordered, fraction: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 1)
+
+    def stats(self) -> Dict:
+        ordered = sorted(self.recent)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else None,
+            "p50_ms": self._percentile(ordered, 0.5),
+            "p95_ms": self._percentile(ordered, 0.95),
+            "max_ms": round(self.max * 1000, 1),
+        }
+
+
+class FairScheduler:
+    """Admission control for provider calls
+
+    At most `capacity` calls run at once per worker. When they are all
+    taken, requests queue and are admitted in this order:
+
+    - priority class: interactive before batch; batch never holds more than
+      `batch_share` of the slots, so interactive requests find one quickly
+      even while batch work saturates the queue;
+    - department: weighted fair queuing on virtual time, weights from
+      GatewayConfig.department_weights (default 1). A department that was
+      idle starts at the current virtual time instead of cashing in
+      credit, so a busy department gets its share but never more while
+      others wait;
+    - user: FIFO within the department, skipping users that already run
+      `user_limit` calls.
+
+    Requests that wait longer than `max_wait_seconds` fail with
+    QueueTimeout. Everything runs on the event loop, so no locking.
+    """
+
+    def __init__(self):
+        self.capacity = getattr(settings, "PROVIDER_MAX_CONCURRENCY", 32)
+        self.user_limit = getattr(settings, "SCHEDULER_USER_CONCURRENCY", 2)
+        self.batch_share = getattr(settings, "SCHEDULER_BATCH_SHARE", 0.5)
+        self.max_wait_seconds = getattr(settings, "SCHEDULER_MAX_WAIT_SECONDS", 30.0)
+        self.weights_ttl = getattr(settings, "SCHEDULER_WEIGHTS_TTL", 60)
+        self.running = 0
+        self.running_by_priority: Dict[str, int] = defaultdict(int)
+        self.running_by_user: Dict[str, int] = defaultdict(int)
+        self.departments: Dict[str, _DepartmentQueue] = {}
+        self.virtual_time = 0.0
+        self.weights: Dict[str, float] = {}
+        self._weights_loaded_at: Optional[float] = None
+        self.wait_stats = {priority: WaitStats() for priority in PRIORITIES}
+        self.timeouts = 0
+
+    @property
+    def batch_limit(self) -> int:
+        return max(1, int(self.capacity * self.batch_share))
+
+    @staticmethod
+    def priority_of(value: Optional[str]) -> str:
+        """Priority class from a request header value; interactive unless it says batch"""
+        return BATCH if (value or "").strip().lower() == BATCH else INTERACTIVE
+
+    # -- weights -----------------------------------------------------------
+
+    async def refresh_weights(self) -> None:
+        """Reload department weights if they are older than `weights_ttl`"""
+        now = time.monotonic()
+        if self._weights_loaded_at is not None and now - self._weights_loaded_at < self.weights_ttl:
+            return
+        self._weights_loaded_at = now
+        weights: Dict[str, float] = {}
+        try:
+            async with AsyncSessionLocal() as db:
+                configured = await db.scalar(select(GatewayConfig.department_weights).limit(1)) or {}
+                if configured:
+                    # Weights may be keyed by department key ("IT") or id
+                    for dept_id, key in (await db.execute(select(Department.id, Department.key))).all():
+                        weight = configured.get(str(dept_id), configured.get(key))
+                        if weight:
+                            weights[str(dept_id)] = float(weight)
+        except Exception as e:
+            logger.warning(f"Could not load department weights, keeping the current ones: {e}")
+            return
+        self.weights = weights
+        for name, department in self.departments.items():
+            department.weight = weights.get(name, 1.0)
+
+    def invalidate_weights(self) -> None:
+        self._weights_loaded_at = None
+
+    # -- admission ---------------------------------------------------------
+
+    @asynccontextmanager
+    async def slot(self, user_id, department_id, priority: str = INTERACTIVE):
+        """Hold a provider slot for the duration of the block"""
+        ticket = await self.acquire(user_id, department_id, priority)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, user_id, department_id, priority: str = INTERACTIVE) -> Ticket:
+        """Wait for a slot; raises QueueTimeout after `max_wait_seconds`"""
+        loop = asyncio.get_running_loop()
+        ticket = Ticket(
+            user=str(user_id) if user_id else SYSTEM,
+            department=str(department_id) if department_id else SYSTEM,
+            priority=priority if priority in PRIORITIES else INTERACTIVE,
+            enqueued_at=loop.time(),
+            future=loop.create_future(),
+        )
+        department = self.departments.get(ticket.department)
+        if department is None:
+            department = self.departments[ticket.department] = _DepartmentQueue(
+                weight=self.weights.get(ticket.department, 1.0)
+            )
+        if department.idle():
+            department.finish = max(department.finish, self.virtual_time)
+        department.queues[ticket.priority].append(ticket)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done():
+                # Admitted at the last moment
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(ticket)
+                    raise
+            else:
+                department.queues[ticket.priority].remove(ticket)
+                ticket.future.cancel()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.timeouts += 1
+                raise QueueTimeout(
+                    f"No provider capacity within {self.max_wait_seconds:g}s, try again later"
+                ) from None
+        self.wait_stats[ticket.priority].record(loop.time() - ticket.enqueued_at)
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        self.running -= 1
+        self.running_by_priority[ticket.priority] -= 1
+        self.running_by_user[ticket.user] -= 1
+        if self.running_by_user[ticket.user] <= 0:
+            del self.running_by_user[ticket.user]  # keep the map to active users
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.capacity:
+            choice = self._next()
+            if choice is None:
+                return
+            department, ticket = choice
+            department.queues[ticket.priority].remove(ticket)
+            self.virtual_time = department.finish
+            department.finish += 1.0 / department.weight
+            self.running += 1
+            self.running_by_priority[ticket.priority] += 1
+            self.running_by_user[ticket.user] += 1
+            ticket.future.set_result(None)
+
+    def _next(self) -> Optional[Tuple[_DepartmentQueue, Ticket]]:
+        """Next ticket to admit: priority class, then least virtual time, then FIFO"""
+        for priority in PRIORITIES:
+            if priority == BATCH and self.running_by_priority[BATCH] >= self.batch_limit:
+                continue
+            best: Optional[Tuple[_DepartmentQueue, Ticket]] = None
+            for department in self.departments.values():
+                if best is not None and department.finish >= best[0].finish:
+                    continue
+                ticket = next(
+                    (
+                        waiting for waiting in department.queues[priority]
+                        if self.running_by_user.get(waiting.user, 0) < self.user_limit
+                    ),
+                    None,
+                )
+                if ticket is not None:
+                    best = (department, ticket)
+            if best is not None:
+                return best
+        return None
+
+    # -- reporting ---------------------------------------------------------
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "running": self.running,
+            "running_by_priority": {priority: self.running_by_priority[priority] for priority in PRIORITIES},
+            "queued": {
+                priority: sum(len(department.queues[priority]) for department in self.departments.values())
+                for priority in PRIORITIES
+            },
+            "queue_wait": {priority: self.wait_stats[priority].stats() for priority in PRIORITIES},
+            "timeouts": self.timeouts,
+            "departments": {
+                name: {
+                    "weight": department.weight,
+                    "queued": sum(len(queue) for queue in department.queues.values()),
+                }
+                for name, department in self.departments.items()
+            },
+        }
+
+
+# Create global instance
+fair_scheduler = FairScheduler()
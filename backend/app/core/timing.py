@@ -0,0 +1,58 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StageStats:
+    """Running per-stage latency totals, process-wide"""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, ms: float) -> None:
+        entry = self._stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+
+    def stats(self) -> Dict:
+        return {
+            stage: {
+                "count": int(entry["count"]),
+                "avg_ms": round(entry["total_ms"] / entry["count"], 2),
+                "max_ms": round(entry["max_ms"], 2),
+            }
+            for stage, entry in self._stages.items()
+        }
+
+
+class StageTimer:
+    """Wall-clock timings of the stages of one request
+
+    Stages may overlap (e.g. inside asyncio.gather); each is timed on its own.
+    """
+
+    def __init__(self, aggregate: Optional[StageStats] = None):
+        self.aggregate = aggregate
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.timings[name] = ms
+        if self.aggregate is not None:
+            self.aggregate.record(name, ms)
+
+    def server_timing(self) -> str:
+        """Value for a `Server-Timing` response header"""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.timings.items())
+
+
+# Create global instance
+chat_stage_stats = StageStats()
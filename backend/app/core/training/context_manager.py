@@ -1,25 +1,93 @@
 import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Dict
+import uuid
+import re
+import unicodedata
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-# import numpy as np  # TODO: Install numpy in requirements.txt
+from sqlalchemy import select, func, delete, update, text, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import numpy as np
 
+from app.core.assistant_registry import assistant_registry
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.models.training import TrainingDocument, DocumentChunk
+from app.core.database import AsyncSessionLocal, copy_records, engine
+from app.core.training.context_packer import ContextPacker
+from app.core.training.document_store import DocumentStore, StoredFile
+from app.core.training.embeddings import encode_embedding, decode_embeddings
+from app.core.training.reranker import CrossEncoderReranker
+from app.core.training.vector_index import VectorIndex
+from app.models.assistant import Assistant
+from app.models.training import (
+    TrainingDocument, DocumentChunk, EmbeddingCache, KnowledgeBaseVersion
+)
 from app.schemas.training import DocumentUpload
 
 logger = logging.getLogger(__name__)
 
+# Per-assistant overrides live in Assistant.retrieval_config
+DEFAULT_RETRIEVAL_CONFIG = {
+    "quantization": "none",  # none | int8 | binary
+    "rescore_factor": 4,  # quantized candidates rescored per returned chunk
+}
+
 
 class ContextManager:
     """Manages context injection for assistants without sending data to providers"""
     
     def __init__(self):
         self.chunk_size = 2000  # tokens
-        self.max_chunks = 10
+        self.max_chunks = 5  # chunks that reach the prompt
+        self.candidate_pool = 20  # ANN candidates considered for packing
+        # Cached embeddings are only reusable for the model that produced them
+        self.embedding_model = getattr(
+            settings, "EMBEDDING_MODEL", "paraphrase-multilingual-mpnet-base-v2"
+        )
+        self.embedding_cache_batch = 1000  # hashes per cache lookup
+        self.chunk_write_batch = 2000  # rows per COPY batch
+        self.gc_batch = 5000  # chunk rows deleted per GC statement
+        self._background_tasks = set()
+        # Uploads are streamed to content-addressed files, then queued for indexing
+        self.document_store = DocumentStore(
+            str(Path(settings.UPLOAD_DIR) / "training"),
+            max_bytes=getattr(settings, "MAX_UPLOAD_BYTES", 100 * 1024 * 1024),
+        )
+        self._ingestion_queue: Optional[asyncio.Queue] = None
+        self._ingestion_worker: Optional[asyncio.Task] = None
+        # Query embeddings (float32 arrays), repeated and retried queries skip the model
+        self.query_cache = TTLCache(
+            max_entries=getattr(settings, "QUERY_EMBEDDING_CACHE_SIZE", 10000),
+            ttl_seconds=getattr(settings, "QUERY_EMBEDDING_CACHE_TTL", 3600),
+            max_bytes=getattr(settings, "QUERY_EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            sizeof=lambda vector: vector.nbytes,
+        )
+        self._inflight_queries: Dict[tuple, asyncio.Future] = {}
+        # Per-assistant in-memory vector indexes, valid until the kb_version or
+        # quantization changes (then rebuilt in the background); no TTL, so
+        # a request never rebuilds a serving index. Bounded by LRU on bytes.
+        self.index_cache = TTLCache(
+            max_entries=getattr(settings, "VECTOR_INDEX_CACHE_SIZE", 64),
+            ttl_seconds=float("inf"),
+            max_bytes=getattr(settings, "VECTOR_INDEX_MAX_BYTES", 2 * 1024 ** 3),
+            sizeof=lambda index: index.memory_bytes(),
+        )
+        self._index_locks: Dict[str, asyncio.Lock] = {}
+        self._index_builds: Dict[str, asyncio.Task] = {}
+        self.packer = ContextPacker()
+        # Optional cross-encoder pass over a wider ANN candidate set
+        self.reranker = CrossEncoderReranker(
+            model_name=getattr(
+                settings, "RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+            ),
+            enabled=getattr(settings, "RERANK_ENABLED", False),
+            max_candidates=getattr(settings, "RERANK_CANDIDATES", 20),
+            budget_ms=getattr(settings, "RERANK_BUDGET_MS", 150),
+        )
         
     async def add_training_data(
         self,
@@ -33,100 +101,462 @@ class ContextManager:
         results = []
         for doc_data in documents:
             try:
-                # 1. Save document to filesystem
-                file_path = await self._save_document(doc_data)
-                
-                # 2. Create database record
-                db_doc = TrainingDocument(
-                    assistant_id=assistant_id,
-                    filename=doc_data.filename,
-                    content_type=doc_data.content_type,
-                    file_size=doc_data.file_size,
-                    file_path=file_path,
-                    status="uploaded",
-                    metadata_json=metadata or {}
-                )
-                db.add(db_doc)
-                await db.commit()
-                await db.refresh(db_doc)
-                
-                # 3. Process document asynchronously
-                asyncio.create_task(self._process_document(db, db_doc.id))
-                
-                results.append(db_doc)
-                
+                stored = await self.document_store.save_bytes(doc_data.content)
+                results.append(await self._register_document(
+                    db, assistant_id, stored, doc_data.filename, doc_data.content_type, metadata
+                ))
             except Exception as e:
                 logger.error(f"Failed to process document {doc_data.filename}: {e}")
                 continue
                 
         return results
     
-    async def _save_document(self, doc_data: DocumentUpload) -> str:
-        """Save uploaded document to filesystem"""
-        upload_dir = Path(settings.UPLOAD_DIR) / "training"
-        upload_dir.mkdir(parents=True, exist_ok=True)
+    async def add_document(
+        self,
+        db: AsyncSession,
+        assistant_id: str,
+        upload,
+        metadata: Dict = None
+    ) -> TrainingDocument:
+        """Stream an `UploadFile` to disk and queue it for indexing
+        
+        Re-uploading content the assistant already has returns the existing
+        document without re-indexing.
+        """
+        stored = await self.document_store.save_upload(upload)
+        return await self._register_document(
+            db, assistant_id, stored, upload.filename, upload.content_type, metadata
+        )
+    
+    async def _register_document(
+        self,
+        db: AsyncSession,
+        assistant_id: str,
+        stored: StoredFile,
+        filename: str,
+        content_type: Optional[str],
+        metadata: Dict = None
+    ) -> TrainingDocument:
+        existing = await db.scalar(
+            select(TrainingDocument).where(
+                TrainingDocument.assistant_id == assistant_id,
+                TrainingDocument.content_sha256 == stored.sha256,
+                TrainingDocument.status != "failed",
+            ).limit(1)
+        )
+        if existing is not None:
+            logger.info(f"Skipped duplicate upload {filename} (same content as {existing.filename})")
+            return existing
+        
+        # 1. Create database record for the stored file
+        db_doc = TrainingDocument(
+            assistant_id=assistant_id,
+            filename=filename,
+            content_type=content_type,
+            size=stored.size,
+            file_path=stored.path,
+            content_sha256=stored.sha256,
+            status="uploaded",
+            metadata_json=metadata or {}
+        )
+        db.add(db_doc)
+        await db.commit()
+        await db.refresh(db_doc)
+        
+        # 2. Queue for indexing into a new knowledge-base version
+        self.enqueue_ingestion(assistant_id, db_doc.id)
+        return db_doc
+    
+    def enqueue_ingestion(self, assistant_id: str, document_id) -> None:
+        if self._ingestion_queue is None:
+            self._ingestion_queue = asyncio.Queue()
+        if self._ingestion_worker is None or self._ingestion_worker.done():
+            self._ingestion_worker = asyncio.create_task(self._run_ingestion())
+        self._ingestion_queue.put_nowait((assistant_id, document_id))
+    
+    async def _run_ingestion(self) -> None:
+        """Index queued documents; a burst of uploads becomes one version per assistant"""
+        queue = self._ingestion_queue
+        while True:
+            batch: Dict[str, List] = {}
+            assistant_id, document_id = await queue.get()
+            batch.setdefault(str(assistant_id), []).append(document_id)
+            while not queue.empty():
+                assistant_id, document_id = queue.get_nowait()
+                batch.setdefault(str(assistant_id), []).append(document_id)
+            for assistant_id, document_ids in batch.items():
+                try:
+                    await self.reindex_assistant(assistant_id, document_ids)
+                except Exception as e:
+                    logger.error(f"Failed to index documents of assistant {assistant_id}: {e}")
+                finally:
+                    for _ in document_ids:
+                        queue.task_done()
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run a background task, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    def schedule_reindex(self, assistant_id: str, document_ids: List = None) -> asyncio.Task:
+        """Run `reindex_assistant` in the background"""
+        return self._spawn(self.reindex_assistant(assistant_id, document_ids))
+    
+    @staticmethod
+    def _visible_in(version: int):
+        """Chunks belonging to knowledge-base snapshot `version`"""
+        return (
+            (DocumentChunk.valid_from <= version)
+            & or_(DocumentChunk.valid_to.is_(None), DocumentChunk.valid_to > version)
+        )
+    
+    async def reindex_assistant(self, assistant_id: str, document_ids: List = None) -> int:
+        """Build and atomically activate a new knowledge-base version
+        
+        Chunks are versioned with [valid_from, valid_to) ranges: unchanged
+        chunks are carried over untouched, changed ones are retired at the
+        new version and replaced. Live retrieval keeps reading the active
+        version until the single-row switch on `assistants.kb_version`.
+        Returns the activated version, or the unchanged active one on failure.
+        """
+        # One build per assistant across workers. The lock is held on its own
+        # connection because the build session releases its connection on commit.
+        lock_key = {"key": f"kb:{assistant_id}"}
+        async with engine.connect() as lock_conn:
+            await lock_conn.execute(text("SELECT pg_advisory_lock(hashtext(:key))"), lock_key)
+            try:
+                async with AsyncSessionLocal() as db:
+                    return await self._build_version(db, assistant_id, document_ids)
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), lock_key)
+    
+    async def _build_version(self, db: AsyncSession, assistant_id: str, document_ids: List = None) -> int:
+        active = await db.scalar(
+            select(Assistant.kb_version).where(Assistant.id == assistant_id)
+        ) or 0
+        
+        # A build that died mid-way leaves invisible rows past `active`; clear them
+        await self._discard_version(db, assistant_id, active + 1)
+        
+        # Failed builds keep their number in the history
+        version = max(
+            active,
+            await db.scalar(
+                select(func.max(KnowledgeBaseVersion.version))
+                .where(KnowledgeBaseVersion.assistant_id == assistant_id)
+            ) or 0,
+        ) + 1
+        kb_version = KnowledgeBaseVersion(
+            assistant_id=assistant_id, version=version, status="building"
+        )
+        db.add(kb_version)
+        await db.commit()
         
-        file_path = upload_dir / f"{doc_data.filename}"
-        with open(file_path, "wb") as f:
-            f.write(doc_data.content)
+        query = select(TrainingDocument.id).where(TrainingDocument.assistant_id == assistant_id)
+        if document_ids:
+            query = query.where(TrainingDocument.id.in_(document_ids))
+        doc_ids = list((await db.execute(query)).scalars())
+        
+        try:
+            new_chunks = 0
+            for doc_id in doc_ids:
+                # Committed per document; rows stay invisible until activation
+                new_chunks += await self._process_document(db, doc_id, version, active)
             
-        return str(file_path)
+            # Atomic switch; the guard rejects a concurrent activation
+            switched = await db.execute(
+                update(Assistant)
+                .where(Assistant.id == assistant_id, Assistant.kb_version == active)
+                .values(kb_version=version)
+            )
+            if switched.rowcount != 1:
+                raise RuntimeError(f"kb_version of assistant {assistant_id} changed during build")
+            await db.execute(
+                update(KnowledgeBaseVersion)
+                .where(
+                    KnowledgeBaseVersion.assistant_id == assistant_id,
+                    KnowledgeBaseVersion.status == "active",
+                )
+                .values(status="retired")
+            )
+            kb_version.status = "active"
+            kb_version.activated_at = func.now()
+            kb_version.document_count = len(doc_ids)
+            kb_version.chunk_count = await db.scalar(
+                select(func.count(DocumentChunk.id)).join(TrainingDocument).where(
+                    TrainingDocument.assistant_id == assistant_id,
+                    self._visible_in(version),
+                )
+            )
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to build knowledge-base v{version} for assistant {assistant_id}: {e}")
+            await db.rollback()
+            await self._discard_version(db, assistant_id, version)
+            kb_version.status = "failed"
+            await db.commit()
+            return active
+        
+        logger.info(
+            f"Activated knowledge-base v{version} for assistant {assistant_id} "
+            f"({len(doc_ids)} documents, {new_chunks} new chunks)"
+        )
+        # Workers pick up the new kb_version with their next request
+        await assistant_registry.invalidate(db, assistant_id)
+        await self._collect_garbage(db, assistant_id, active)
+        return version
     
-    async def _process_document(self, db: AsyncSession, document_id: str):
-        """Process document: extract text, chunk, generate embeddings"""
+    async def _discard_version(self, db: AsyncSession, assistant_id: str, version: int):
+        """Undo unactivated builds from `version` on: drop their rows, un-retire what they retired"""
+        docs = select(TrainingDocument.id).where(TrainingDocument.assistant_id == assistant_id)
+        await db.execute(
+            delete(DocumentChunk).where(
+                DocumentChunk.document_id.in_(docs), DocumentChunk.valid_from >= version
+            )
+        )
+        await db.execute(
+            update(DocumentChunk)
+            .where(DocumentChunk.document_id.in_(docs), DocumentChunk.valid_to >= version)
+            .values(valid_to=None)
+        )
+        await db.execute(
+            update(KnowledgeBaseVersion)
+            .where(
+                KnowledgeBaseVersion.assistant_id == assistant_id,
+                KnowledgeBaseVersion.version >= version,
+                KnowledgeBaseVersion.status == "building",
+            )
+            .values(status="failed")
+        )
+        await db.commit()
+    
+    async def _collect_garbage(self, db: AsyncSession, assistant_id: str, previous: int):
+        """Delete chunks invisible in both the active and the `previous` version
+        
+        The previous version stays readable for indexes and requests that
+        started before the switch. Deletes run in bounded batches.
+        """
+        docs = select(TrainingDocument.id).where(TrainingDocument.assistant_id == assistant_id)
+        removed = 0
+        while True:
+            batch = (
+                select(DocumentChunk.id)
+                .where(DocumentChunk.document_id.in_(docs), DocumentChunk.valid_to <= previous)
+                .limit(self.gc_batch)
+            )
+            result = await db.execute(delete(DocumentChunk).where(DocumentChunk.id.in_(batch)))
+            await db.commit()
+            removed += result.rowcount
+            if result.rowcount < self.gc_batch:
+                break
+        await db.execute(
+            update(KnowledgeBaseVersion)
+            .where(
+                KnowledgeBaseVersion.assistant_id == assistant_id,
+                KnowledgeBaseVersion.version < previous,
+                KnowledgeBaseVersion.status == "retired",
+            )
+            .values(status="collected")
+        )
+        await db.commit()
+        if removed:
+            logger.info(f"Collected {removed} retired chunks of assistant {assistant_id}")
+    
+    async def _process_document(
+        self,
+        db: AsyncSession,
+        document_id: str,
+        version: int,
+        active_version: int,
+    ) -> int:
+        """Process document into knowledge-base `version`: extract text, chunk, embed
+        
+        Chunks unchanged since `active_version` (same content hash and position)
+        are carried over; only new content is embedded, through the shared
+        embedding cache. Returns the number of chunks written.
+        """
+        doc = await db.get(TrainingDocument, document_id)
+        if not doc:
+            return 0
         try:
-            # Get document
-            doc = await db.get(TrainingDocument, document_id)
-            if not doc:
-                return
-                
             # 1. Extract text
             content = await self._extract_text(doc.file_path, doc.content_type)
             
             # 2. Chunk text
             chunks = self._chunk_text(content, self.chunk_size)
+            hashes = [self._content_hash(chunk) for chunk in chunks]
             
-            # 3. Generate embeddings (simulated for now)
-            embeddings = await self._generate_embeddings(chunks)
+            # 3. Diff against the chunks of the active version
+            existing_rows = await db.execute(
+                select(
+                    DocumentChunk.id, DocumentChunk.content_hash, DocumentChunk.chunk_index
+                ).where(
+                    DocumentChunk.document_id == doc.id,
+                    self._visible_in(active_version),
+                )
+            )
+            existing = {(row.content_hash, row.chunk_index): row.id for row in existing_rows}
+            
+            new_positions = []
+            for i, content_hash in enumerate(hashes):
+                if existing.pop((content_hash, i), None) is None:
+                    new_positions.append(i)
             
-            # 4. Store chunks in database
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                db_chunk = DocumentChunk(
-                    document_id=doc.id,
-                    chunk_index=i,
-                    content=chunk,
-                    embedding=embedding.tolist() if hasattr(embedding, 'tolist') else embedding,
-                    metadata_json={"chunk_size": len(chunk)}
+            # Retire what the new version no longer contains
+            stale_ids = list(existing.values())
+            for start in range(0, len(stale_ids), self.gc_batch):
+                await db.execute(
+                    update(DocumentChunk)
+                    .where(DocumentChunk.id.in_(stale_ids[start:start + self.gc_batch]))
+                    .values(valid_to=version)
                 )
-                db.add(db_chunk)
+            
+            # 4. Embed new chunks (cache hits cost nothing)
+            embeddings = await self._get_embeddings_cached(
+                db,
+                [chunks[i] for i in new_positions],
+                [hashes[i] for i in new_positions],
+            )
+            
+            # 5. Store chunks in database (bulk COPY, no per-row ORM objects)
+            await copy_records(
+                db,
+                DocumentChunk.__table__,
+                self._chunk_columns,
+                (
+                    self._chunk_record(doc.id, i, chunks[i], hashes[i], embedding, version)
+                    for i, embedding in zip(new_positions, embeddings)
+                ),
+                batch_size=self.chunk_write_batch,
+            )
             
             # Update document status
             doc.status = "processed"
+            doc.processed = True
+            doc.chunk_count = len(chunks)
             doc.processed_at = func.now()
             await db.commit()
             
-            logger.info(f"Processed document {doc.filename}: {len(chunks)} chunks")
+            logger.info(
+                f"Processed document {doc.filename} into v{version}: {len(chunks)} chunks "
+                f"({len(chunks) - len(new_positions)} unchanged, "
+                f"{len(new_positions)} new, {len(stale_ids)} retired)"
+            )
+            return len(new_positions)
             
         except Exception as e:
             logger.error(f"Failed to process document {document_id}: {e}")
-            # Update status to failed
+            # Update status to failed; its chunks are discarded with the build
+            await db.rollback()
             doc.status = "failed"
             await db.commit()
+            raise
+    
+    _chunk_columns = (
+        "id", "document_id", "chunk_index", "content", "content_hash",
+        "embedding", "chunk_metadata", "valid_from",
+    )
+    
+    def _chunk_record(
+        self, document_id, index: int, content: str, content_hash: str, embedding, version: int
+    ) -> tuple:
+        """Row tuple in `_chunk_columns` order"""
+        return (
+            uuid.uuid4(),
+            document_id,
+            index,
+            content,
+            content_hash,
+            encode_embedding(embedding),
+            json.dumps({"chunk_size": len(content)}),
+            version,
+        )
+    
+    @staticmethod
+    def _normalize_chunk_text(text: str) -> str:
+        """Normalize chunk text so cosmetic differences hash identically"""
+        text = unicodedata.normalize("NFC", text)
+        return re.sub(r"\s+", " ", text).strip()
+    
+    def _content_hash(self, text: str) -> str:
+        """SHA-256 of the normalized chunk text"""
+        normalized = self._normalize_chunk_text(text)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    
+    async def _get_embeddings_cached(
+        self,
+        db: AsyncSession,
+        chunks: List[str],
+        hashes: List[str],
+    ) -> List[bytes]:
+        """Resolve embeddings (encoded float32) through the content-addressed cache
+        
+        Only hashes unknown for the current model are embedded; duplicates
+        within the batch are embedded once.
+        """
+        if not chunks:
+            return []
+        
+        unique_hashes = list(dict.fromkeys(hashes))
+        known: Dict[str, bytes] = {}
+        for start in range(0, len(unique_hashes), self.embedding_cache_batch):
+            batch = unique_hashes[start:start + self.embedding_cache_batch]
+            rows = await db.execute(
+                select(
+                    EmbeddingCache.content_hash,
+                    EmbeddingCache.embedding,
+                    EmbeddingCache.embedding_json,
+                ).where(
+                    EmbeddingCache.model == self.embedding_model,
+                    EmbeddingCache.content_hash.in_(batch)
+                )
+            )
+            known.update({
+                row.content_hash: row.embedding or encode_embedding(row.embedding_json)
+                for row in rows
+            })
+        
+        first_chunk = dict(zip(reversed(hashes), reversed(chunks)))
+        missing = [h for h in unique_hashes if h not in known]
+        if missing:
+            generated = await self._generate_embeddings([first_chunk[h] for h in missing])
+            fresh = [
+                {
+                    "content_hash": h,
+                    "model": self.embedding_model,
+                    "embedding": encode_embedding(embedding),
+                }
+                for h, embedding in zip(missing, generated)
+            ]
+            for start in range(0, len(fresh), self.embedding_cache_batch):
+                # Concurrent ingestions of the same content may race; first writer wins
+                await db.execute(
+                    pg_insert(EmbeddingCache)
+                    .values(fresh[start:start + self.embedding_cache_batch])
+                    .on_conflict_do_nothing(index_elements=["content_hash", "model"])
+                )
+            known.update({row["content_hash"]: row["embedding"] for row in fresh})
+        
+        logger.debug(
+            f"Embedding cache: {len(unique_hashes) - len(missing)} hits, "
+            f"{len(missing)} misses for {len(chunks)} chunks"
+        )
+        return [known[h] for h in hashes]
     
     async def _extract_text(self, file_path: str, content_type: str) -> str:
         """Extract text from various document formats"""
         try:
             if content_type == "text/plain":
-                with open(file_path, "r", encoding="utf-8") as f:
-                    return f.read()
+                return await asyncio.to_thread(Path(file_path).read_text, encoding="utf-8")
             elif content_type == "application/pdf":
                 return await self._extract_pdf_text(file_path)
             elif content_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword"]:
                 return await self._extract_docx_text(file_path)
             else:
                 # Fallback to text
-                with open(file_path, "r", encoding="utf-8") as f:
-                    return f.read()
+                return await asyncio.to_thread(Path(file_path).read_text, encoding="utf-8")
         except Exception as e:
             logger.error(f"Failed to extract text from {file_path}: {e}")
             return ""
@@ -178,20 +608,26 @@ class ContextManager:
         db: AsyncSession,
         assistant_id: str,
         query: str,
-        max_tokens: int = 4000
+        max_tokens: int = 1500
     ) -> str:
-        """Retrieve relevant context for a query"""
+        """Retrieve relevant context for a query, at most `max_tokens` prompt tokens"""
         
         try:
-            # 1. Generate query embedding
-            query_embedding = await self._generate_embedding(query)
+            # 1. Generate query embedding (cached)
+            query_embedding = await self._get_query_embedding(query)
             
             # 2. Vector similarity search in PostgreSQL
+            candidate_limit = max(self.candidate_pool, self.reranker.max_candidates)
             relevant_chunks = await self._search_similar_chunks(
-                db, assistant_id, query_embedding, limit=self.max_chunks
+                db, assistant_id, query_embedding, limit=candidate_limit
+            )
+            
+            # 3. Re-rank candidates (falls back to ANN order on budget overrun)
+            relevant_chunks = await self.reranker.rerank(
+                query, relevant_chunks, top_k=len(relevant_chunks)
             )
             
-            # 3. Build context within token limit
+            # 4. Pack the best non-redundant chunks into the token budget
             context = self._build_context(relevant_chunks, max_tokens)
             
             return context
@@ -200,48 +636,188 @@ class ContextManager:
             logger.error(f"Failed to get context for query: {e}")
             return ""
     
+    async def _get_query_embedding(self, query: str) -> np.ndarray:
+        """Query embedding through the LRU/TTL cache
+        
+        Concurrent misses for the same query share one embedding call.
+        """
+        key = (self.embedding_model, self._normalize_chunk_text(query))
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        inflight = self._inflight_queries.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_queries[key] = future
+        try:
+            vector = np.asarray(await self._generate_embedding(key[1]), dtype=np.float32)
+            vector.setflags(write=False)  # shared between callers
+            self.query_cache.set(key, vector)
+            future.set_result(vector)
+            return vector
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark retrieved so an unawaited future doesn't warn
+            future.exception()
+            raise
+        finally:
+            del self._inflight_queries[key]
+    
+    def metrics(self) -> Dict:
+        """Retrieval cache metrics"""
+        return {
+            "embedding_model": self.embedding_model,
+            "query_embedding_cache": self.query_cache.stats(),
+            "reranker": self.reranker.stats(),
+            "vector_indexes": self.index_cache.stats(),
+            "ingestion_queue": self._ingestion_queue.qsize() if self._ingestion_queue else 0,
+        }
+    
     async def _generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for a single text"""
         # TODO: Implement with sentence-transformers
         import random
         return [random.random() for _ in range(768)]
     
+    async def get_chunk_embeddings(
+        self,
+        db: AsyncSession,
+        assistant_id: str,
+        version: int,
+    ) -> Tuple[List, np.ndarray]:
+        """Chunk ids and embeddings of one knowledge-base version as an (n, dim) float32 matrix"""
+        result = await db.execute(
+            select(
+                DocumentChunk.id, DocumentChunk.embedding, DocumentChunk.embedding_json
+            ).join(TrainingDocument).where(
+                TrainingDocument.assistant_id == assistant_id,
+                self._visible_in(version),
+                (DocumentChunk.embedding.is_not(None)) | (DocumentChunk.embedding_json.is_not(None))
+            )
+        )
+        ids, vectors = [], []
+        for row in result:
+            ids.append(row.id)
+            # Rows not yet converted by backfill_embeddings are encoded on the fly
+            vectors.append(row.embedding or encode_embedding(row.embedding_json))
+        return ids, decode_embeddings(vectors)
+    
+    async def _fetch_embeddings(self, db: AsyncSession, chunk_ids: List) -> Tuple[List, np.ndarray]:
+        """Full-precision embeddings for the given chunk ids"""
+        result = await db.execute(
+            select(
+                DocumentChunk.id, DocumentChunk.embedding, DocumentChunk.embedding_json
+            ).where(DocumentChunk.id.in_(chunk_ids))
+        )
+        ids, vectors = [], []
+        for row in result:
+            ids.append(row.id)
+            vectors.append(row.embedding or encode_embedding(row.embedding_json))
+        return ids, decode_embeddings(vectors)
+    
+    async def get_retrieval_config(self, db: AsyncSession, assistant_id: str) -> Dict:
+        """Assistant retrieval settings merged over the defaults, plus active `kb_version`"""
+        assistant = await assistant_registry.get(db, assistant_id)
+        if assistant is None:
+            return {**DEFAULT_RETRIEVAL_CONFIG, "kb_version": 0}
+        return {**DEFAULT_RETRIEVAL_CONFIG, **assistant.retrieval_config, "kb_version": assistant.kb_version}
+    
+    async def _build_index(self, db: AsyncSession, assistant_id: str, config: Dict) -> VectorIndex:
+        ids, matrix = await self.get_chunk_embeddings(db, assistant_id, config["kb_version"])
+        index = await asyncio.to_thread(
+            VectorIndex,
+            ids,
+            matrix,
+            config["quantization"],
+        )
+        index.rescore_factor = max(1, int(config["rescore_factor"]))
+        index.version = config["kb_version"]
+        self.index_cache.set(str(assistant_id), index)
+        logger.info(
+            f"Built {index.quantization} vector index for assistant {assistant_id} "
+            f"v{index.version}: {len(index)} chunks, {index.memory_bytes()} bytes"
+        )
+        return index
+    
+    async def _rebuild_index_in_background(self, assistant_id: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                config = await self.get_retrieval_config(db, assistant_id)
+                await self._build_index(db, assistant_id, config)
+        except Exception as e:
+            logger.error(f"Failed to rebuild vector index for assistant {assistant_id}: {e}")
+    
+    async def _get_index(self, db: AsyncSession, assistant_id: str) -> VectorIndex:
+        """Vector index of the assistant's active knowledge-base version
+        
+        After a version switch or a quantization change the previous index
+        keeps serving (its chunks are retained) while the new one is built
+        in the background. Only a worker without any index for the
+        assistant builds one on the request path.
+        """
+        key = str(assistant_id)
+        config = await self.get_retrieval_config(db, assistant_id)
+        index = self.index_cache.get(key)
+        if index is not None:
+            index.rescore_factor = max(1, int(config["rescore_factor"]))
+            stale = index.version != config["kb_version"] or index.quantization != config["quantization"]
+            if stale and key not in self._index_builds:
+                task = self._spawn(self._rebuild_index_in_background(assistant_id))
+                self._index_builds[key] = task
+                task.add_done_callback(lambda _: self._index_builds.pop(key, None))
+            return index
+        
+        lock = self._index_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            index = self.index_cache.get(key)
+            if index is not None:
+                return index
+            return await self._build_index(db, assistant_id, config)
+    
+    def invalidate_index(self, assistant_id) -> None:
+        """Drop this worker's index so the next query rebuilds it synchronously
+        
+        For benchmarks and cleanup; version and settings changes are picked
+        up by `_get_index` without dropping the serving index.
+        """
+        self.index_cache.invalidate(str(assistant_id))
+    
     async def _search_similar_chunks(
         self, 
         db: AsyncSession, 
         assistant_id: str, 
-        query_embedding: List[float],
+        query_embedding: np.ndarray,
         limit: int = 10
     ) -> List[DocumentChunk]:
-        """Search for similar chunks using vector similarity"""
+        """Search for similar chunks using cosine similarity
         
-        # Get all chunks for the assistant
-        query = select(DocumentChunk).join(TrainingDocument).where(
-            TrainingDocument.assistant_id == assistant_id,
-            TrainingDocument.status == "processed"
-        ).limit(limit)
+        Quantized indexes return `limit * rescore_factor` candidates that
+        are rescored against full-precision vectors from the database.
+        """
+        
+        index = await self._get_index(db, assistant_id)
+        if not len(index):
+            return []
         
-        result = await db.execute(query)
-        chunks = result.scalars().all()
+        if index.exact:
+            top_ids, _ = index.candidates(query_embedding, limit)
+        else:
+            candidate_ids, _ = index.candidates(query_embedding, limit * index.rescore_factor)
+            ids, vectors = await self._fetch_embeddings(db, candidate_ids)
+            top_ids, _ = VectorIndex.rescore(query_embedding, ids, vectors, limit)
         
-        # TODO: Implement proper vector similarity search with pgvector
-        # For now, return chunks in order
-        return list(chunks)
+        result = await db.execute(
+            select(DocumentChunk).where(DocumentChunk.id.in_(top_ids))
+        )
+        by_id = {chunk.id: chunk for chunk in result.scalars()}
+        return [by_id[chunk_id] for chunk_id in top_ids if chunk_id in by_id]
     
     def _build_context(self, chunks: List[DocumentChunk], max_tokens: int) -> str:
         """Build context string from chunks within token limit"""
-        context_parts = []
-        current_length = 0
-        
-        for chunk in chunks:
-            chunk_length = len(chunk.content.split())
-            if current_length + chunk_length <= max_tokens // 4:  # Reserve space for query
-                context_parts.append(chunk.content)
-                current_length += chunk_length
-            else:
-                break
-                
-        return "\n\n".join(context_parts)
+        return self.packer.pack(chunks, max_tokens, max_chunks=self.max_chunks)
     
     async def get_training_stats(self, db: AsyncSession, assistant_id: str) -> Dict:
         """Get training statistics for an assistant"""
@@ -252,9 +828,13 @@ class ContextManager:
         )
         doc_count = await db.scalar(doc_query)
         
-        # Count chunks
+        # Count chunks of the active knowledge-base version
+        kb_version = await db.scalar(
+            select(Assistant.kb_version).where(Assistant.id == assistant_id)
+        ) or 0
         chunk_query = select(func.count(DocumentChunk.id)).join(TrainingDocument).where(
-            TrainingDocument.assistant_id == assistant_id
+            TrainingDocument.assistant_id == assistant_id,
+            self._visible_in(kb_version)
         )
         chunk_count = await db.scalar(chunk_query)
         
@@ -269,5 +849,10 @@ class ContextManager:
             "total_documents": doc_count or 0,
             "total_chunks": chunk_count or 0,
             "processed_documents": processed_count or 0,
+            "kb_version": kb_version,
             "processing_status": "active" if processed_count < doc_count else "complete"
         }
+
+
+# Create global instance (caches are shared across requests)
+context_manager = ContextManager()
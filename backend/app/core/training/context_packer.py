@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core.training.embeddings import decode_embedding
+from app.models.training import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+
+class ContextPacker:
+    """Packs retrieved chunks into an exact prompt token budget
+
+    Chunks arrive in relevance order (ANN or re-ranked). Selection is greedy
+    maximal-marginal-relevance: each step picks the chunk with the best
+    relevance minus similarity to the ones already picked, among those that
+    still fit the budget. Token cost only decides fit, so a short chunk never
+    displaces a more relevant long one. Near-duplicates and chunks whose
+    marginal relevance is no longer positive are dropped. Selected
+    neighbours from the same document are merged back into one passage.
+    """
+
+    def __init__(
+        self,
+        mmr_lambda: float = 0.7,
+        redundancy_threshold: float = 0.92,
+        separator: str = "\n\n",
+        encoding_name: str = "o200k_base",
+    ):
+        self.mmr_lambda = mmr_lambda
+        self.redundancy_threshold = redundancy_threshold
+        self.separator = separator
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._encoding_loaded = False
+
+    def _get_encoding(self):
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+        return self._encoding
+
+    async def load_encoding(self) -> None:
+        """Load the tokenizer off the event loop; its first load reads (or downloads) the BPE file"""
+        if not self._encoding_loaded:
+            await asyncio.to_thread(self._get_encoding)
+
+    def count_tokens(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return max(1, len(text) // 4)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    @staticmethod
+    def _chunk_vector(chunk: DocumentChunk) -> Optional[np.ndarray]:
+        if getattr(chunk, "embedding", None):
+            return decode_embedding(chunk.embedding)
+        if getattr(chunk, "embedding_json", None):
+            return np.asarray(chunk.embedding_json, dtype=np.float32)
+        return None
+
+    def _similarity_matrix(self, chunks: Sequence[DocumentChunk]) -> Optional[np.ndarray]:
+        vectors = [self._chunk_vector(chunk) for chunk in chunks]
+        dims = {len(v) for v in vectors if v is not None}
+        if len(dims) != 1:
+            return None
+        dim = dims.pop()
+        matrix = np.zeros((len(chunks), dim), dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[i] = vector
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return matrix @ matrix.T
+
+    def select(
+        self,
+        chunks: Sequence[DocumentChunk],
+        budget_tokens: int,
+        max_chunks: Optional[int] = None,
+    ) -> List[DocumentChunk]:
+        """Pick chunks by maximal marginal relevance, skipping those that do not fit"""
+        n = len(chunks)
+        if n == 0 or budget_tokens <= 0:
+            return []
+
+        separator_tokens = self.count_tokens(self.separator)
+        costs = [self.count_tokens(chunk.content) + separator_tokens for chunk in chunks]
+        relevance = [1.0 - i / n for i in range(n)]  # rank-derived, best first
+        similarity = self._similarity_matrix(chunks)
+
+        selected: List[int] = []
+        remaining = set(range(n))
+        budget_left = budget_tokens + separator_tokens  # no separator after the last part
+        while remaining and (max_chunks is None or len(selected) < max_chunks):
+            # Ties go to the better-ranked chunk; a score must be positive to count
+            best, best_score = None, 0.0
+            for i in sorted(remaining):
+                if costs[i] > budget_left:
+                    remaining.discard(i)  # the budget only shrinks
+                    continue
+                redundancy = 0.0
+                if similarity is not None and selected:
+                    redundancy = float(similarity[i, selected].max())
+                if redundancy >= self.redundancy_threshold:
+                    remaining.discard(i)
+                    continue
+                score = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+                if score > best_score:
+                    best, best_score = i, score
+            if best is None:
+                break
+            selected.append(best)
+            remaining.discard(best)
+            budget_left -= costs[best]
+
+        return [chunks[i] for i in selected]
+
+    def merge_adjacent(self, chunks: Sequence[DocumentChunk]) -> List[str]:
+        """Merge consecutive chunks of one document, keeping selection order"""
+        position = {id(chunk): i for i, chunk in enumerate(chunks)}
+        runs: List[List[DocumentChunk]] = []
+        for chunk in sorted(chunks, key=lambda c: (str(c.document_id), c.chunk_index)):
+            previous = runs[-1][-1] if runs else None
+            if (
+                previous is not None
+                and previous.document_id == chunk.document_id
+                and chunk.chunk_index == previous.chunk_index + 1
+            ):
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+        runs.sort(key=lambda run: min(position[id(c)] for c in run))
+        return [" ".join(c.content for c in run) for run in runs]
+
+    def pack(
+        self,
+        chunks: Sequence[DocumentChunk],
+        budget_tokens: int,
+        max_chunks: Optional[int] = None,
+    ) -> str:
+        parts = self.merge_adjacent(self.select(chunks, budget_tokens, max_chunks))
+        return self.separator.join(parts)
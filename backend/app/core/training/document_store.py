@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    path: str
+    sha256: str
+    size: int
+    deduplicated: bool  # identical content was already stored
+
+
+class DocumentStore:
+    """Content-addressed file store for training documents
+
+    Files are stored as `<root>/<sha256[:2]>/<sha256>`, so identical uploads
+    share one file and names never collide. Content is streamed in chunks to
+    a temporary file (disk writes run in a worker thread), hashed on the fly
+    and moved into place atomically; memory use does not depend on file size.
+    """
+
+    def __init__(self, root: str, chunk_size: int = 1024 * 1024, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    async def save_stream(self, chunks: AsyncIterator[bytes]) -> StoredFile:
+        """Store content from an async byte-chunk iterator"""
+        tmp_dir = self.root / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if self.max_bytes is not None and size > self.max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            return await asyncio.to_thread(self._commit, tmp_path, digest.hexdigest(), size)
+        except BaseException:
+            await asyncio.to_thread(self._discard, tmp_path)
+            raise
+
+    async def save_upload(self, upload) -> StoredFile:
+        """Store a FastAPI/Starlette `UploadFile` without reading it into memory"""
+        async def chunks():
+            while True:
+                chunk = await upload.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+        return await self.save_stream(chunks())
+
+    async def save_bytes(self, content: bytes) -> StoredFile:
+        async def chunks():
+            for start in range(0, len(content), self.chunk_size):
+                yield content[start:start + self.chunk_size]
+
+        return await self.save_stream(chunks())
+
+    def _commit(self, tmp_path: str, sha256: str, size: int) -> StoredFile:
+        target = self.path_for(sha256)
+        if target.exists():
+            os.unlink(tmp_path)
+            return StoredFile(str(target), sha256, size, deduplicated=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+        return StoredFile(str(target), sha256, size, deduplicated=False)
+
+    @staticmethod
+    def _discard(tmp_path: str) -> None:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import select, tuple_, update
+
+from app.core.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Little-endian float32, stored as raw BYTEA (4 bytes per dimension)
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(vector) -> bytes:
+    """Serialize an embedding to float32 bytes"""
+    if isinstance(vector, (bytes, bytearray, memoryview)):
+        return bytes(vector)
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """Zero-copy, read-only float32 view over stored bytes"""
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
+
+def decode_embeddings(rows: Iterable[bytes], dim: Optional[int] = None) -> np.ndarray:
+    """Stack stored embeddings into an (n, dim) float32 matrix with one copy"""
+    rows = list(rows)
+    if not rows:
+        return np.empty((0, dim or 0), dtype=EMBEDDING_DTYPE)
+    matrix = np.frombuffer(b"".join(rows), dtype=EMBEDDING_DTYPE)
+    return matrix.reshape(len(rows), -1)
+
+
+async def backfill_embeddings(
+    model,
+    batch_size: int = 500,
+    pause_seconds: float = 0.05,
+) -> int:
+    """Convert legacy JSONB embeddings of `model` rows to float32 BYTEA
+
+    Runs online: rows are walked in primary-key order in short transactions,
+    with a pause between batches to keep lock time and WAL bursts small.
+    Safe to interrupt and re-run; already converted rows are skipped.
+    """
+    pk = list(model.__mapper__.primary_key)
+    last_key = None
+    converted = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            query = (
+                select(*pk, model.embedding_json)
+                .where(model.embedding.is_(None), model.embedding_json.is_not(None))
+                .order_by(*pk)
+                .limit(batch_size)
+            )
+            if last_key is not None:
+                query = query.where(tuple_(*pk) > tuple_(*last_key))
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+
+            await db.execute(
+                update(model),
+                [
+                    {
+                        **{col.key: row[i] for i, col in enumerate(pk)},
+                        "embedding": encode_embedding(row.embedding_json),
+                        "embedding_json": None,
+                    }
+                    for row in rows
+                ],
+            )
+            await db.commit()
+
+        converted += len(rows)
+        last_key = tuple(rows[-1][:len(pk)])
+        logger.info(f"Backfilled {converted} {model.__tablename__} embeddings")
+        await asyncio.sleep(pause_seconds)
+    return converted
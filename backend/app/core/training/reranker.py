@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from app.models.training import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Re-ranks ANN candidates with a small cross-encoder on CPU
+
+    All (query, chunk) pairs are scored in one batched forward pass on a
+    dedicated worker thread. If scoring does not finish within the latency
+    budget, the ANN order is returned unchanged.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        enabled: bool = False,
+        max_candidates: int = 20,
+        budget_ms: float = 150.0,
+    ):
+        self.model_name = model_name
+        self.enabled = enabled
+        self.max_candidates = max_candidates
+        self.budget_ms = budget_ms
+        self._model = None
+        self._loading: Optional[asyncio.Future] = None
+        # One worker: a forward pass already uses all cores via torch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._busy = False
+        self._stats = {
+            "reranked": 0,
+            "timeouts": 0,
+            "skipped_busy": 0,
+            "skipped_loading": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+        }
+
+    def _load_model(self):
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(self.model_name, device="cpu", max_length=512)
+
+    def _ensure_loading(self) -> None:
+        """Load the model in the background; requests don't wait for it"""
+        if self._loading is not None:
+            return
+
+        def _done(future: asyncio.Future):
+            try:
+                self._model = future.result()
+                logger.info(f"Loaded cross-encoder {self.model_name}")
+            except Exception as e:
+                logger.error(f"Failed to load cross-encoder {self.model_name}, re-ranking disabled: {e}")
+                self.enabled = False
+
+        loop = asyncio.get_running_loop()
+        self._loading = loop.run_in_executor(self._executor, self._load_model)
+        self._loading.add_done_callback(_done)
+
+    def _score(self, query: str, passages: List[str]) -> List[float]:
+        pairs = [(query, passage) for passage in passages]
+        scores = self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    async def rerank(
+        self,
+        query: str,
+        chunks: Sequence[DocumentChunk],
+        top_k: int,
+    ) -> List[DocumentChunk]:
+        """Return the `top_k` best chunks, falling back to ANN order"""
+        candidates = list(chunks[:self.max_candidates])
+        if not self.enabled or len(candidates) <= 1:
+            return candidates[:top_k]
+
+        if self._model is None:
+            self._ensure_loading()
+            self._stats["skipped_loading"] += 1
+            return candidates[:top_k]
+
+        if self._busy:
+            # A timed-out pass is still running; queueing behind it would time out too
+            self._stats["skipped_busy"] += 1
+            return candidates[:top_k]
+
+        start = time.perf_counter()
+        self._busy = True
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, self._score, query, [chunk.content for chunk in candidates]
+        )
+        future.add_done_callback(lambda _: setattr(self, "_busy", False))
+        try:
+            scores = await asyncio.wait_for(asyncio.shield(future), timeout=self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            logger.debug(f"Re-ranking exceeded {self.budget_ms}ms budget, using ANN order")
+            return candidates[:top_k]
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Re-ranking failed, using ANN order: {e}")
+            return candidates[:top_k]
+
+        self._stats["reranked"] += 1
+        self._stats["total_ms"] += (time.perf_counter() - start) * 1000
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict:
+        reranked = self._stats["reranked"]
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "model_loaded": self._model is not None,
+            "budget_ms": self.budget_ms,
+            "max_candidates": self.max_candidates,
+            **{k: v for k, v in self._stats.items() if k != "total_ms"},
+            "avg_ms": round(self._stats["total_ms"] / reranked, 2) if reranked else None,
+        }
@@ -0,0 +1,108 @@
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Set bits per byte value, for Hamming distance over packed sign bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """In-memory similarity index over one assistant's chunk embeddings
+
+    With quantization "none" the normalized float32 vectors are kept and
+    searched exactly. "int8" keeps one signed byte per dimension plus a
+    per-vector scale (4x smaller); "binary" keeps only sign bits (32x
+    smaller) and ranks by Hamming distance. Quantized indexes are a first
+    pass only: callers rescore `candidates()` against full-precision vectors.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence,
+        matrix: np.ndarray,
+        quantization: str = "none",
+        block_rows: int = 65536,
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        self.ids = list(ids)
+        self.quantization = quantization
+        self.block_rows = block_rows  # bounds temporary memory per query
+        self.dim = matrix.shape[1] if matrix.ndim == 2 else 0
+
+        normalized = normalize_rows(matrix) if len(self.ids) else matrix
+        self.vectors = None
+        self.codes = None
+        self.scales = None
+        if quantization == "none":
+            self.vectors = normalized
+        elif quantization == "int8":
+            scales = np.abs(normalized).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.codes = np.round(normalized / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+        else:
+            self.codes = np.packbits(normalized > 0, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def exact(self) -> bool:
+        return self.quantization == "none"
+
+    def memory_bytes(self) -> int:
+        arrays = (self.vectors, self.codes, self.scales)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        query = normalize_rows(query)
+        if self.quantization == "none":
+            return self.vectors @ query
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        if self.quantization == "int8":
+            for start in range(0, len(self.ids), self.block_rows):
+                block = slice(start, start + self.block_rows)
+                scores[block] = (self.codes[block].astype(np.float32) @ query) * self.scales[block]
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(self.ids), self.block_rows):
+                block = slice(start, start + self.block_rows)
+                distance = _POPCOUNT[np.bitwise_xor(self.codes[block], query_bits)].sum(axis=1, dtype=np.int32)
+                scores[block] = -distance
+        return scores
+
+    def candidates(self, query: np.ndarray, n: int) -> Tuple[List, np.ndarray]:
+        """Top `n` ids by (approximate) similarity, best first"""
+        if not self.ids or n <= 0:
+            return [], np.empty(0, dtype=np.float32)
+        scores = self._scores(query)
+        n = min(n, len(self.ids))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.ids[i] for i in top], scores[top]
+
+    @staticmethod
+    def rescore(
+        query: np.ndarray,
+        ids: Sequence,
+        vectors: np.ndarray,
+        k: int,
+    ) -> Tuple[List, np.ndarray]:
+        """Exact cosine re-ranking of candidate ids against full-precision vectors"""
+        if not len(ids):
+            return [], np.empty(0, dtype=np.float32)
+        scores = normalize_rows(vectors) @ normalize_rows(query)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [ids[i] for i in order], scores[order]
@@ -0,0 +1,143 @@
+import json
+import logging
+from typing import List
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.idempotency import (
+    BUSY,
+    CLAIMED,
+    IDEMPOTENCY_HEADER,
+    MISMATCH,
+    REPLAYED_HEADER,
+    idempotency_store,
+)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"POST", "PATCH"}
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyMiddleware:
+    """Honours the Idempotency-Key header on POST and PATCH, see app.core.idempotency
+
+    A plain ASGI middleware: the request body is buffered once (it is part of
+    the fingerprint) and handed on unchanged, and the response is passed
+    through while a copy is kept for storage. Requests without the header
+    are not touched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key is longer than {MAX_KEY_LENGTH} characters"})
+            return
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > idempotency_store.max_body_bytes:
+            await self.app(scope, receive, send)  # uploads are not deduplicated
+            return
+
+        body = await _read_body(receive)
+        store_key = idempotency_store.scope_key(headers.get("authorization", ""), key)
+        fingerprint = idempotency_store.fingerprint(
+            scope["method"], scope["path"], scope.get("query_string", b""), body
+        )
+        outcome, stored = await idempotency_store.begin(store_key, fingerprint)
+        if outcome == MISMATCH:
+            await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
+            return
+        if outcome == BUSY:
+            await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is still being processed"})
+            return
+        if outcome != CLAIMED:
+            await send({
+                "type": "http.response.start",
+                "status": stored.status,
+                "headers": [
+                    (name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers
+                ] + [(REPLAYED_HEADER.encode(), b"true")],
+            })
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        await self._run(scope, body, receive, send, store_key, fingerprint)
+
+    async def _run(self, scope: Scope, body: bytes, receive: Receive, send: Send, store_key: str, fingerprint: str) -> None:
+        """Run the request, keeping a copy of the response for storage"""
+        replayed = False
+        status = 500
+        response_headers: List[List[str]] = []
+        chunks: List[bytes] = []
+        size = 0
+        complete = False
+
+        async def replay_receive() -> Message:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status, size, complete
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers[:] = [
+                    [name.decode("latin-1"), value.decode("latin-1")] for name, value in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= idempotency_store.max_body_bytes:
+                    chunks.append(chunk)
+                if not message.get("more_body", False):
+                    complete = True
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await idempotency_store.release(store_key)
+            raise
+        # Server errors and oversized or unfinished responses can be retried
+        if status >= 500 or not complete or size > idempotency_store.max_body_bytes:
+            await idempotency_store.release(store_key)
+            return
+        try:
+            await idempotency_store.finish(store_key, fingerprint, status, response_headers, b"".join(chunks))
+        except Exception as e:
+            logger.error(f"Could not store idempotent response: {e}")
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send: Send, status: int, payload: dict) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, String, DateTime, Text, Integer, CheckConstraint, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -21,6 +21,8 @@ class Assistant(Base):
     status = Column(String(20), nullable=False, default="active")
     dept_scope = Column(JSONB, nullable=False, default=list)
     tools = Column(JSONB, nullable=False, default=list)
+    retrieval_config = Column(JSONB, nullable=False, default=dict)  # vector index options
+    kb_version = Column(Integer, nullable=False, default=0)  # active knowledge-base version
     visibility = Column(
         String(20), 
         nullable=False, 
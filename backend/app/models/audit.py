@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Integer, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, BYTEA
 from sqlalchemy.sql import func
 import uuid
 
@@ -8,6 +8,8 @@ from app.core.database import Base
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Monthly partitions, see app.core.partitions
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("app_users.id"), nullable=True)
@@ -19,6 +21,33 @@ class AuditLog(Base):
     duration_ms = Column(Integer)
     request_bytes = Column(Integer)
     response_bytes = Column(Integer)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key, hence part of the primary key
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), index=True)
 
 
+class RetentionRun(Base):
+    """One pass of the retention engine, see app.core.retention"""
+    __tablename__ = "retention_runs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    trigger = Column(String(20), nullable=False)  # schedule | manual
+    cutoff = Column(DateTime(timezone=True))  # NULL: content kept forever
+    status = Column(String(20), nullable=False, default="running")  # running | completed | failed
+    deleted = Column(JSONB, nullable=False, default=dict)  # rows deleted per table, updated per batch
+    error = Column(Text)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+
+class IdempotencyKey(Base):
+    """Response to a request sent with an Idempotency-Key, see app.core.idempotency"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256 of caller and header value
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path and body
+    status = Column(String(20), nullable=False, default="in_progress")  # in_progress | completed
+    response_status = Column(Integer)
+    response_headers = Column(JSONB)  # [[name, value], ...]
+    response_body = Column(BYTEA)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    completed_at = Column(DateTime(timezone=True))
@@ -1,6 +1,6 @@
 from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
-from sqlalchemy import CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID, JSONB, BYTEA
+from sqlalchemy import CheckConstraint, Index, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, BYTEA, TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -21,8 +21,30 @@ class Thread(Base):
     )
     __table_args__ = (
         CheckConstraint("status in ('open','closed','archived')"),
+        # Keyset pagination of a user's threads; covers the listing (index-only scan)
+        Index(
+            "idx_threads_user_created_id",
+            "user_id", "created_at", "id",
+            postgresql_include=[
+                "assistant_id", "title", "message_count", "last_message_at",
+                "last_message_preview", "data_key",
+            ],
+        ),
+        # Retention: threads by last activity
+        Index("idx_threads_last_activity", text("COALESCE(last_message_at, created_at)")),
     )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Wrapped per-thread data key, see app.core.message_keys
+    data_key = Column(BYTEA)
+    
+    # Summary, maintained on every message insert
+    title = Column(String(255))
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_at = Column(DateTime(timezone=True))
+    last_message_preview = Column(BYTEA)  # encoded by app.core.message_codec
+    # Rolling summary of the first `summary_message_count` messages, see ConversationMemory
+    summary = Column(BYTEA)  # encoded by app.core.message_codec
+    summary_message_count = Column(Integer, nullable=False, default=0)
     
     # Relationships
     assistant = relationship("Assistant", back_populates="threads")
@@ -41,8 +63,13 @@ class Message(Base):
     role = Column(String(20))
     __table_args__ = (
         CheckConstraint("role in ('user','assistant','system')"),
+        # Keyset pagination of a thread's messages
+        Index("idx_messages_thread_created_id", "thread_id", "created_at", "id"),
+        Index("idx_messages_created_at", "created_at"),
+        # Monthly partitions, see app.core.partitions
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
-    content_ciphertext = Column(BYTEA, nullable=False)
+    content_ciphertext = Column(BYTEA, nullable=False)  # encoded by app.core.message_codec
     content_sha256 = Column(String(64), nullable=False)
     tokens_in = Column(Integer, default=0)
     tokens_out = Column(Integer, default=0)
@@ -50,10 +77,49 @@ class Message(Base):
     cost_out_cents = Column(Integer, default=0)
     latency_ms = Column(Integer)
     redaction_map = Column(JSONB, default=dict)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key, hence part of the primary key
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     
     # Relationships
     thread = relationship("Thread", back_populates="messages")
     
     def __repr__(self):
         return f"<Message(role='{self.role}', thread_id='{self.thread_id}')>"
+
+
+class MessageSearch(Base):
+    """Full-text index of message content; content itself is encrypted
+
+    Written in the same statement as the message, see app.core.chat_search.
+    """
+    __tablename__ = "message_search"
+    
+    message_id = Column(UUID(as_uuid=True), primary_key=True)
+    thread_id = Column(UUID(as_uuid=True), nullable=False)
+    user_id = Column(UUID(as_uuid=True))
+    # Same partitioning as messages, so retention drops both together
+    created_at = Column(DateTime(timezone=True), primary_key=True)
+    document = Column(TSVECTOR, nullable=False)
+    __table_args__ = (
+        # Needs btree_gin; searches are always scoped to one user
+        Index("idx_message_search_user_document", "user_id", "document", postgresql_using="gin"),
+        Index("idx_message_search_user_thread", "user_id", "thread_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    
+    def __repr__(self):
+        return f"<MessageSearch(message_id='{self.message_id}')>"
+
+
+class CompressionDictionary(Base):
+    """Immutable zstd dictionary for one assistant's message content"""
+    __tablename__ = "compression_dictionaries"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)  # referenced from content headers
+    assistant_id = Column(UUID(as_uuid=True), ForeignKey("assistants.id"), nullable=False, index=True)
+    dict_data = Column(BYTEA, nullable=False)
+    sample_count = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<CompressionDictionary(id={self.id}, assistant_id='{self.assistant_id}')>"
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, String, Integer, Boolean, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 import uuid
 
@@ -23,6 +23,10 @@ class GatewayConfig(Base):
     budget_monthly_cents = Column(Integer, nullable=False, default=0)
     cost_alert_threshold_cents = Column(Integer, nullable=False, default=0)
 
+    # Fair share of provider capacity per department key (or id), default 1,
+    # see app.core.scheduler
+    department_weights = Column(JSONB, nullable=False, default=dict)
+
     # Feature toggles
     feature_demo_mode = Column(Boolean, nullable=False, default=False)
     enable_analytics = Column(Boolean, nullable=False, default=True)
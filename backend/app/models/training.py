@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer, Float, ForeignKey, Boolean
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, DateTime, Text, Integer, Float, ForeignKey, Boolean, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import UUID, JSONB, BYTEA
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -9,14 +9,22 @@ from app.core.database import Base
 
 class TrainingDocument(Base):
     __tablename__ = "training_documents"
+    __table_args__ = (
+        Index("idx_training_documents_assistant_sha256", "assistant_id", "content_sha256"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     assistant_id = Column(UUID(as_uuid=True), ForeignKey("assistants.id"), nullable=False)
     filename = Column(String(255), nullable=False)
     content_type = Column(String(100))
     size = Column(Integer)  # in bytes
+    file_path = Column(String(500))  # content-addressed, see DocumentStore
+    content_sha256 = Column(String(64))
+    status = Column(String(20), nullable=False, default="uploaded")
     chunk_count = Column(Integer, default=0)
+    metadata_json = Column(JSONB, default=dict)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
     processed = Column(Boolean, default=False)
     
     # Relationships
@@ -33,10 +41,14 @@ class DocumentChunk(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     document_id = Column(UUID(as_uuid=True), ForeignKey("training_documents.id"), nullable=False)
     content = Column(Text, nullable=False)
-    # embedding = Column(Vector(384))  # Temporarily disabled - needs pgvector
-    embedding_json = Column(JSONB)  # Store embedding as JSON temporarily
+    content_hash = Column(String(64), index=True)  # sha256 of normalized content
+    embedding = Column(BYTEA)  # float32 little-endian, see app.core.training.embeddings
+    embedding_json = Column(JSONB(none_as_null=True))  # Legacy format, cleared by backfill_embeddings
     chunk_index = Column(Integer, nullable=False)
     chunk_metadata = Column(JSONB, default=dict)
+    # Knowledge-base versions [valid_from, valid_to) this chunk is visible in
+    valid_from = Column(Integer, nullable=False, default=0)
+    valid_to = Column(Integer)  # NULL while still current
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -46,6 +58,38 @@ class DocumentChunk(Base):
         return f"<DocumentChunk(document_id='{self.document_id}', index={self.chunk_index})>"
 
 
+class KnowledgeBaseVersion(Base):
+    """One build of an assistant's chunk set; `assistants.kb_version` points at the active one"""
+    __tablename__ = "knowledge_base_versions"
+    __table_args__ = (UniqueConstraint("assistant_id", "version"),)
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    assistant_id = Column(UUID(as_uuid=True), ForeignKey("assistants.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="building")  # building, active, retired, collected, failed
+    document_count = Column(Integer, default=0)
+    chunk_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    activated_at = Column(DateTime(timezone=True))
+    
+    def __repr__(self):
+        return f"<KnowledgeBaseVersion(assistant_id='{self.assistant_id}', version={self.version}, status='{self.status}')>"
+
+
+class EmbeddingCache(Base):
+    """Content-addressed embeddings, shared across assistants and documents"""
+    __tablename__ = "embedding_cache"
+    
+    content_hash = Column(String(64), primary_key=True)  # sha256 of normalized chunk text
+    model = Column(String(100), primary_key=True)
+    embedding = Column(BYTEA)  # float32 little-endian
+    embedding_json = Column(JSONB(none_as_null=True))  # Legacy format, cleared by backfill_embeddings
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<EmbeddingCache(model='{self.model}', hash='{self.content_hash[:12]}')>"
+
+
 class TrainingJob(Base):
     __tablename__ = "training_jobs"
     
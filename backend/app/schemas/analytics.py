@@ -64,7 +64,8 @@ class Usage(BaseModel):
     byAssistant: List[AssistantUsage]
 
 class Overview(BaseModel):
-    totalMessages: int
+    totalMessages: int  # all time
+    windowMessages: int = 0  # within the requested date range
     totalTokens: int
     totalCost: float
     avgLatency: int
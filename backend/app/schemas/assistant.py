@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -10,6 +10,14 @@ class AssistantStatus(str, Enum):
     MAINTENANCE = "maintenance"
 
 
+class RetrievalConfig(BaseModel):
+    quantization: Literal["none", "int8", "binary"] = "none"
+    rescore_factor: int = Field(default=4, ge=1, le=50)
+    # Conversation memory: recent messages verbatim, older ones summarized
+    history_messages: int = Field(default=12, ge=0, le=100)
+    history_tokens: int = Field(default=3000, ge=0, le=100000)
+
+
 class AssistantCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -28,6 +36,7 @@ class AssistantUpdate(BaseModel):
     system_prompt: Optional[str] = None
     model: Optional[str] = None
     status: Optional[AssistantStatus] = None
+    retrieval_config: Optional[RetrievalConfig] = None
 
 
 class AssistantResponse(BaseModel):
@@ -39,4 +48,5 @@ class AssistantResponse(BaseModel):
     status: AssistantStatus
     created_at: datetime
     updated_at: Optional[datetime] = None
+    retrieval_config: Optional[Dict[str, Any]] = None
     usage_stats: Dict[str, Any]
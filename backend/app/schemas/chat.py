@@ -21,6 +21,7 @@ class ThreadListResponse(BaseModel):
     created_at: str
     updated_at: str
     message_count: int
+    last_message_preview: Optional[str] = None
 
 class MessageCreate(BaseModel):
     content: str
@@ -34,6 +35,15 @@ class MessageResponse(BaseModel):
     assistant_id: Optional[str] = None
     thread_id: Optional[str] = None
 
+class SearchResultResponse(BaseModel):
+    message_id: str
+    thread_id: str
+    thread_title: str
+    role: str
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    rank: float
+    timestamp: str
+
 class ChatRequest(BaseModel):
     assistant_id: str
     message: str
@@ -120,3 +120,25 @@ class TrainingMetrics(BaseModel):
     average_accuracy: Optional[float] = None
     average_training_time: Optional[float] = None
     total_training_cost: Optional[float] = None
+
+
+class DocumentUpload(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    file_size: int
+    content: bytes
+
+
+class KnowledgeBaseVersionResponse(BaseModel):
+    id: UUID
+    assistant_id: UUID
+    version: int
+    status: str
+    document_count: Optional[int] = None
+    chunk_count: Optional[int] = None
+    created_at: datetime
+    activated_at: Optional[datetime] = None
+    is_active: bool = False
+
+    class Config:
+        from_attributes = True
@@ -1,13 +1,19 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import time
 import logging
 
 from app.core.config import settings
 from app.api.v1.api import api_router
 from app.middleware.audit import AuditMiddleware
+from app.middleware.idempotency import IdempotencyMiddleware
+from app.core.assistant_registry import assistant_registry
+from app.core.conversation_memory import conversation_memory
 from app.core.database import init_db, engine
+from app.core.retention import retention_engine
+from app.core.training.context_manager import context_manager
 from app.middleware.rate_limit import limiter, RateLimitExceeded, _rate_limit_exceeded_handler
 
 # Configure logging
@@ -29,10 +35,23 @@ async def lifespan(app_: FastAPI):
     except Exception as e:
         logger.error("Database initialization failed: %s", e)
 
+    # Tokenizers are loaded here so the first chat request does not block the loop
+    await asyncio.gather(
+        context_manager.packer.load_encoding(),
+        conversation_memory.packer.load_encoding(),
+    )
+
+    # Periodic purge of data past GatewayConfig.retention_days
+    retention_engine.start()
+    # Assistant cache invalidations from other workers
+    assistant_registry.start_listener()
+
     yield
 
     # Shutdown
     logger.info("Shutting down AI Gateway...")
+    await retention_engine.stop()
+    await assistant_registry.stop_listener()
     await engine.dispose()
 
 # Create FastAPI app
@@ -49,6 +68,9 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Idempotency-Key handling; innermost, so replays still get CORS headers and are audited
+app.add_middleware(IdempotencyMiddleware)
+
 # CORS Configuration - FIXED for localhost development
 app.add_middleware(
     CORSMiddleware,
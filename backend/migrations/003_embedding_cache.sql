@@ -0,0 +1,23 @@
+-- Migration: Content-addressed embedding cache and chunk deduplication
+
+-- Columns used by the document ingestion pipeline
+ALTER TABLE training_documents
+ADD COLUMN IF NOT EXISTS file_path VARCHAR(500),
+ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'uploaded',
+ADD COLUMN IF NOT EXISTS metadata_json JSONB DEFAULT '{}',
+ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE;
+
+-- sha256 of the normalized chunk text, used to skip unchanged chunks on re-ingest
+ALTER TABLE document_chunks
+ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS ix_document_chunks_content_hash ON document_chunks(content_hash);
+
+-- Embeddings keyed by content hash + model, shared across assistants
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash VARCHAR(64) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    embedding_json JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (content_hash, model)
+);
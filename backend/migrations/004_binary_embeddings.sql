@@ -0,0 +1,16 @@
+-- Migration: Store embeddings as float32 BYTEA instead of JSONB float arrays
+-- Existing rows are converted online by scripts/backfill_embeddings.py;
+-- the embedding_json columns can be dropped once it reports 0 remaining rows.
+
+ALTER TABLE document_chunks
+ADD COLUMN IF NOT EXISTS embedding BYTEA;
+
+ALTER TABLE embedding_cache
+ADD COLUMN IF NOT EXISTS embedding BYTEA;
+
+ALTER TABLE embedding_cache
+ALTER COLUMN embedding_json DROP NOT NULL;
+
+-- Vectors are incompressible; skip pglz attempts on every write
+ALTER TABLE document_chunks ALTER COLUMN embedding SET STORAGE EXTERNAL;
+ALTER TABLE embedding_cache ALTER COLUMN embedding SET STORAGE EXTERNAL;
@@ -0,0 +1,5 @@
+-- Migration: Per-assistant retrieval options (vector quantization, rescoring)
+-- Example: {"quantization": "int8", "rescore_factor": 4}
+
+ALTER TABLE assistants
+ADD COLUMN IF NOT EXISTS retrieval_config JSONB NOT NULL DEFAULT '{}';
@@ -0,0 +1,28 @@
+-- Migration: Versioned knowledge-base snapshots with atomic activation
+-- Chunks carry the version range [valid_from, valid_to) they are visible in;
+-- retrieval reads the version in assistants.kb_version.
+
+ALTER TABLE assistants
+ADD COLUMN IF NOT EXISTS kb_version INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE document_chunks
+ADD COLUMN IF NOT EXISTS valid_from INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS valid_to INTEGER;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_document_validity
+ON document_chunks(document_id, valid_from, valid_to);
+
+CREATE TABLE IF NOT EXISTS knowledge_base_versions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    assistant_id UUID NOT NULL REFERENCES assistants(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'building',
+    document_count INTEGER DEFAULT 0,
+    chunk_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    activated_at TIMESTAMP WITH TIME ZONE,
+    UNIQUE (assistant_id, version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_versions_assistant_id
+ON knowledge_base_versions(assistant_id);
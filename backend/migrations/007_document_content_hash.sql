@@ -0,0 +1,9 @@
+-- Migration: Content-addressed training document uploads
+-- Files live at <UPLOAD_DIR>/training/<sha256[:2]>/<sha256>; duplicate
+-- uploads to the same assistant are detected by hash.
+
+ALTER TABLE training_documents
+ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS idx_training_documents_assistant_sha256
+ON training_documents(assistant_id, content_sha256);
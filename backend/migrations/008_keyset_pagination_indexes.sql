@@ -0,0 +1,9 @@
+-- Migration: Composite indexes for keyset pagination on (created_at, id)
+-- Threads are listed per user newest first, messages per thread oldest first.
+-- CONCURRENTLY avoids blocking writes; run outside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_threads_user_created_id
+ON threads(user_id, created_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_thread_created_id
+ON messages(thread_id, created_at, id);
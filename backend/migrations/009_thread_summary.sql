@@ -0,0 +1,41 @@
+-- Migration: Denormalized thread summary maintained on message insert
+-- Listing threads reads only the covering index: no join, no aggregate.
+
+ALTER TABLE threads
+ADD COLUMN IF NOT EXISTS title VARCHAR(255),
+ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS last_message_preview VARCHAR(200);
+
+-- One-time backfill
+UPDATE threads t
+SET message_count = s.message_count,
+    last_message_at = s.last_message_at
+FROM (
+    SELECT thread_id, COUNT(*) AS message_count, MAX(created_at) AS last_message_at
+    FROM messages
+    GROUP BY thread_id
+) s
+WHERE s.thread_id = t.id;
+
+UPDATE threads t
+SET last_message_preview = LEFT(
+    regexp_replace(convert_from(m.content_ciphertext, 'UTF8'), '\s+', ' ', 'g'), 200
+)
+FROM (
+    SELECT DISTINCT ON (thread_id) thread_id, content_ciphertext
+    FROM messages
+    ORDER BY thread_id, created_at DESC, id DESC
+) m
+WHERE m.thread_id = t.id;
+
+UPDATE threads t
+SET title = 'Chat mit ' || a.name
+FROM assistants a
+WHERE a.id = t.assistant_id AND t.title IS NULL;
+
+-- Replace the pagination index from 008 with a covering one
+DROP INDEX IF EXISTS idx_threads_user_created_id;
+CREATE INDEX IF NOT EXISTS idx_threads_user_created_id
+ON threads(user_id, created_at, id)
+INCLUDE (assistant_id, title, message_count, last_message_at, last_message_preview);
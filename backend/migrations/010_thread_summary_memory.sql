@@ -0,0 +1,7 @@
+-- Migration: Rolling conversation summary on threads
+-- summary covers the thread's first summary_message_count messages;
+-- newer messages are sent verbatim.
+
+ALTER TABLE threads
+ADD COLUMN IF NOT EXISTS summary TEXT,
+ADD COLUMN IF NOT EXISTS summary_message_count INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,17 @@
+-- Migration: zstd-compressed message content with per-assistant dictionaries
+-- messages.content_ciphertext keeps legacy plain UTF-8 rows readable; encoded
+-- rows start with a format byte 0xF5-0xFF (see app/core/message_codec.py).
+
+CREATE TABLE IF NOT EXISTS compression_dictionaries (
+    id SERIAL PRIMARY KEY,
+    assistant_id UUID NOT NULL REFERENCES assistants(id) ON DELETE CASCADE,
+    dict_data BYTEA NOT NULL,
+    sample_count INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_compression_dictionaries_assistant_id
+ON compression_dictionaries(assistant_id);
+
+-- Content is compressed by the application; skip pglz on TOAST
+ALTER TABLE messages ALTER COLUMN content_ciphertext SET STORAGE EXTERNAL;
@@ -0,0 +1,17 @@
+-- Migration: Envelope encryption of message content
+-- Each thread gets a data key, wrapped by the master key (see app/core/message_keys.py).
+-- Sealed values start with format byte 0xFA; existing rows stay readable and
+-- are encrypted online by scripts/recompress_messages.py.
+
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS data_key BYTEA;
+
+-- Previews and summaries are encoded like message content from now on
+DROP INDEX IF EXISTS idx_threads_user_created_id;
+
+ALTER TABLE threads
+ALTER COLUMN last_message_preview TYPE BYTEA USING convert_to(last_message_preview, 'UTF8'),
+ALTER COLUMN summary TYPE BYTEA USING convert_to(summary, 'UTF8');
+
+CREATE INDEX IF NOT EXISTS idx_threads_user_created_id
+ON threads(user_id, created_at, id)
+INCLUDE (assistant_id, title, message_count, last_message_at, last_message_preview, data_key);
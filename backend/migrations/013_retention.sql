@@ -0,0 +1,20 @@
+-- Migration: Retention engine (see app/core/retention.py)
+-- Indexes let each purge batch find its oldest rows without scanning.
+-- CONCURRENTLY avoids blocking writes; run outside a transaction.
+
+CREATE TABLE IF NOT EXISTS retention_runs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    trigger VARCHAR(20) NOT NULL,
+    cutoff TIMESTAMP WITH TIME ZONE,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    deleted JSONB NOT NULL DEFAULT '{}',
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_audit_logs_created_at
+ON audit_logs(created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_threads_last_activity
+ON threads((COALESCE(last_message_at, created_at)));
@@ -0,0 +1,77 @@
+-- Migration: Monthly range partitioning of messages and audit_logs on created_at
+-- Time-window queries and retention only touch the partitions they need;
+-- expired months are dropped whole (see app/core/partitions.py, app/core/retention.py).
+-- Rewrites both tables in one transaction: run in a maintenance window.
+-- Partitions for coming months are created by the application on startup
+-- and then hourly; they are named <table>_pYYYYMM.
+
+BEGIN;
+
+-- Unique constraints on a partitioned table must include the partition key,
+-- so feedback can no longer reference messages(id) alone
+ALTER TABLE IF EXISTS feedback DROP CONSTRAINT IF EXISTS feedback_message_id_fkey;
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, prefix TEXT, first_month DATE, last_month DATE)
+RETURNS VOID AS $$
+DECLARE
+    month DATE := date_trunc('month', first_month);
+BEGIN
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            prefix || '_p' || to_char(month, 'YYYYMM'),
+            parent,
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month := month + INTERVAL '1 month';
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- messages
+UPDATE messages SET created_at = NOW() WHERE created_at IS NULL;
+
+CREATE TABLE messages_partitioned (
+    LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE
+) PARTITION BY RANGE (created_at);
+ALTER TABLE messages_partitioned ALTER COLUMN created_at SET NOT NULL;
+
+SELECT create_monthly_partitions(
+    'messages_partitioned', 'messages',
+    COALESCE((SELECT MIN(created_at) FROM messages), NOW())::date,
+    (NOW() + INTERVAL '3 months')::date
+);
+
+INSERT INTO messages_partitioned SELECT * FROM messages;
+DROP TABLE messages;
+ALTER TABLE messages_partitioned RENAME TO messages;
+
+ALTER TABLE messages ADD PRIMARY KEY (id, created_at);
+ALTER TABLE messages ADD CONSTRAINT messages_thread_id_fkey FOREIGN KEY (thread_id) REFERENCES threads(id);
+CREATE INDEX idx_messages_thread_created_id ON messages(thread_id, created_at, id);
+CREATE INDEX idx_messages_created_at ON messages(created_at);
+
+-- audit_logs
+UPDATE audit_logs SET created_at = NOW() WHERE created_at IS NULL;
+
+CREATE TABLE audit_logs_partitioned (
+    LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE
+) PARTITION BY RANGE (created_at);
+ALTER TABLE audit_logs_partitioned ALTER COLUMN created_at SET NOT NULL;
+
+SELECT create_monthly_partitions(
+    'audit_logs_partitioned', 'audit_logs',
+    COALESCE((SELECT MIN(created_at) FROM audit_logs), NOW())::date,
+    (NOW() + INTERVAL '3 months')::date
+);
+
+INSERT INTO audit_logs_partitioned SELECT * FROM audit_logs;
+DROP TABLE audit_logs;
+ALTER TABLE audit_logs_partitioned RENAME TO audit_logs;
+
+ALTER TABLE audit_logs ADD PRIMARY KEY (id, created_at);
+ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_user_id_fkey FOREIGN KEY (user_id) REFERENCES app_users(id);
+CREATE INDEX ix_audit_logs_created_at ON audit_logs(created_at);
+
+COMMIT;
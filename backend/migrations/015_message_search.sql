@@ -0,0 +1,33 @@
+-- Migration: Full-text search index of message content
+-- Content is encrypted, so each message's tsvector (german configuration) is
+-- kept in a side table, written in the same statement as the message
+-- (see app/core/chat_search.py). Partitioned like messages so retention
+-- drops both together. Index existing history afterwards with
+-- scripts/build_search_index.py. Searches are always scoped to one user,
+-- so the GIN index leads with user_id (btree_gin) instead of matching the
+-- query against every user's documents and filtering afterwards.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE TABLE IF NOT EXISTS message_search (
+    message_id UUID NOT NULL,
+    thread_id UUID NOT NULL,
+    user_id UUID,
+    created_at TIMESTAMPTZ NOT NULL,
+    document TSVECTOR NOT NULL,
+    PRIMARY KEY (message_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+SELECT create_monthly_partitions(
+    'message_search', 'message_search',
+    COALESCE((SELECT MIN(created_at) FROM messages), NOW())::date,
+    (NOW() + INTERVAL '3 months')::date
+);
+
+CREATE INDEX IF NOT EXISTS idx_message_search_user_document ON message_search USING GIN (user_id, document);
+-- Deleting a thread's search rows
+CREATE INDEX IF NOT EXISTS idx_message_search_user_thread ON message_search(user_id, thread_id);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Migration: Idempotency-Key support for POST/PATCH requests
+-- One row per (caller, key): claimed by the first request, then holds its
+-- final response for replay to retries (see app/core/idempotency.py).
+-- Rows older than IDEMPOTENCY_TTL_HOURS are purged by the retention engine.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(64) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+    response_status INTEGER,
+    response_headers JSONB,
+    response_body BYTEA,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    completed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys(created_at);
@@ -0,0 +1,5 @@
+-- Migration: Department weights for the fair-share provider scheduler
+-- {"<department key or id>": weight}; departments not listed weigh 1
+-- (see app/core/scheduler.py).
+
+ALTER TABLE gateway_config ADD COLUMN IF NOT EXISTS department_weights JSONB NOT NULL DEFAULT '{}'::jsonb;
@@ -0,0 +1,7 @@
+-- Migration: Clear legacy embeddings stored as JSON null
+-- scripts/backfill_embeddings.py wrote JSON 'null' instead of SQL NULL
+-- before the columns were declared with none_as_null; make those rows
+-- match "embedding_json IS NULL" like the rest.
+
+UPDATE document_chunks SET embedding_json = NULL WHERE embedding_json = 'null'::jsonb;
+UPDATE embedding_cache SET embedding_json = NULL WHERE embedding_json = 'null'::jsonb;
@@ -0,0 +1,14 @@
+import asyncio
+
+from app.core.training.embeddings import backfill_embeddings
+from app.models.training import DocumentChunk, EmbeddingCache
+
+
+async def main():
+    for model in (EmbeddingCache, DocumentChunk):
+        converted = await backfill_embeddings(model)
+        print(f"✅ {model.__tablename__}: {converted} embeddings converted to float32")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
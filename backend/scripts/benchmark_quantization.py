@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.core.training.vector_index import QUANTIZATION_MODES, VectorIndex
+
+
+def synthetic_corpus(chunks: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered vectors, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=chunks)
+    return centers[labels] + 0.6 * rng.standard_normal((chunks, dim)).astype(np.float32)
+
+
+def run(args) -> dict:
+    rng = np.random.default_rng(args.seed + 1)
+    matrix = synthetic_corpus(args.chunks, args.dim, args.clusters, args.seed)
+    ids = list(range(args.chunks))
+    targets = rng.integers(0, args.chunks, size=args.queries)
+    queries = matrix[targets] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    exact = VectorIndex(ids, matrix, "none")
+    truth = [set(exact.candidates(q, args.k)[0]) for q in queries]
+
+    results = []
+    for mode in QUANTIZATION_MODES:
+        start = time.perf_counter()
+        index = VectorIndex(ids, matrix, mode)
+        build_s = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for q, relevant in zip(queries, truth):
+            start = time.perf_counter()
+            if index.exact:
+                top, _ = index.candidates(q, args.k)
+            else:
+                candidates, _ = index.candidates(q, args.k * args.rescore_factor)
+                top, _ = VectorIndex.rescore(q, candidates, matrix[candidates], args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(relevant & set(top))
+
+        results.append({
+            "quantization": mode,
+            "rescore_factor": None if index.exact else args.rescore_factor,
+            "memory_bytes": index.memory_bytes(),
+            "bytes_per_vector": round(index.memory_bytes() / args.chunks, 2),
+            "build_seconds": round(build_s, 3),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+            f"recall@{args.k}": round(hits / (args.k * args.queries), 4),
+        })
+
+    return {
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "queries": args.queries,
+        "k": args.k,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory/recall trade-off of quantized vector indexes")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""End-to-end retrieval benchmark against the configured database
+
+Builds a throwaway assistant with a synthetic clustered corpus, ingests it
+through the bulk chunk writer, then runs ContextManager retrieval for a
+labeled query set (each query is a perturbed copy of one known chunk) per
+index type. Prints one JSON document for comparing runs.
+
+    python -m scripts.benchmark_retrieval --chunks 100000 --quantization none int8
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import delete, select, update
+
+from app.core.database import AsyncSessionLocal, copy_records
+from app.core.training.context_manager import context_manager
+from app.core.training.embeddings import encode_embedding
+from app.core.training.vector_index import QUANTIZATION_MODES
+from app.models.assistant import Assistant
+from app.models.training import TrainingDocument, DocumentChunk, KnowledgeBaseVersion
+
+# Chunk ids encode the corpus position: uuid(int=_ID_PREFIX << 64 | position)
+_ID_PREFIX = 0xBE7C_0000_0000_0000
+
+
+def chunk_id(position: int) -> uuid.UUID:
+    return uuid.UUID(int=(_ID_PREFIX << 64) | position)
+
+
+def chunk_position(chunk_uuid: uuid.UUID) -> int:
+    return chunk_uuid.int & ((1 << 64) - 1)
+
+
+class SyntheticCorpus:
+    """Clustered vectors generated block by block, so large corpora never sit in memory twice"""
+
+    def __init__(self, chunks: int, dim: int, clusters: int, seed: int, block: int = 50_000):
+        rng = np.random.default_rng(seed)
+        self.chunks = chunks
+        self.dim = dim
+        self.seed = seed
+        self.block = block
+        self.centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+        self.labels = rng.integers(0, clusters, size=chunks)
+
+    def blocks(self):
+        for start in range(0, self.chunks, self.block):
+            stop = min(start + self.block, self.chunks)
+            rng = np.random.default_rng((self.seed, start))
+            noise = 0.6 * rng.standard_normal((stop - start, self.dim)).astype(np.float32)
+            yield start, self.centers[self.labels[start:stop]] + noise
+
+    def queries(self, count: int, seed: int):
+        """Query vectors and the position of the chunk each one was derived from"""
+        rng = np.random.default_rng(seed)
+        targets = np.sort(rng.choice(self.chunks, size=min(count, self.chunks), replace=False))
+        vectors = np.empty((len(targets), self.dim), dtype=np.float32)
+        for start, block in self.blocks():
+            inside = (targets >= start) & (targets < start + len(block))
+            vectors[inside] = block[targets[inside] - start]
+        vectors += 0.3 * rng.standard_normal(vectors.shape).astype(np.float32)
+        order = rng.permutation(len(targets))
+        return vectors[order], targets[order]
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {}
+    return {
+        f"p{p}": round(float(np.percentile(samples, p)), 3)
+        for p in (50, 95, 99)
+    }
+
+
+async def create_assistant(corpus: SyntheticCorpus, chunks_per_document: int) -> dict:
+    """Assistant, documents and chunks (visible in knowledge-base version 1)"""
+    async with AsyncSessionLocal() as db:
+        assistant = Assistant(
+            name=f"retrieval-benchmark-{uuid.uuid4().hex[:8]}",
+            provider="openai",
+            model="gpt-4o-mini",
+            system_prompt="Benchmark",
+            status="inactive",
+            visibility="private",
+            kb_version=1,
+        )
+        db.add(assistant)
+        await db.flush()
+        assistant_id = assistant.id
+        documents = []
+        for start in range(0, corpus.chunks, chunks_per_document):
+            doc = TrainingDocument(
+                assistant_id=assistant.id,
+                filename=f"benchmark-{start // chunks_per_document}.txt",
+                content_type="text/plain",
+                status="processed",
+                processed=True,
+                chunk_count=min(chunks_per_document, corpus.chunks - start),
+            )
+            db.add(doc)
+            documents.append(doc)
+        await db.flush()
+        document_ids = [doc.id for doc in documents]
+        await db.commit()
+
+        start_time = time.perf_counter()
+        for start, block in corpus.blocks():
+            records = (
+                (
+                    chunk_id(position),
+                    document_ids[position // chunks_per_document],
+                    position % chunks_per_document,
+                    f"Benchmark chunk {position}",
+                    None,
+                    encode_embedding(vector),
+                    "{}",
+                    1,
+                )
+                for position, vector in enumerate(block, start)
+            )
+            await copy_records(
+                db,
+                DocumentChunk.__table__,
+                context_manager._chunk_columns,
+                records,
+                batch_size=context_manager.chunk_write_batch,
+            )
+        await db.commit()
+        seconds = time.perf_counter() - start_time
+
+    return {
+        "assistant_id": assistant_id,
+        "ingestion": {
+            "chunks": corpus.chunks,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(corpus.chunks / seconds, 1) if seconds else None,
+        },
+    }
+
+
+async def drop_assistant(assistant_id) -> None:
+    async with AsyncSessionLocal() as db:
+        doc_ids = select(TrainingDocument.id).where(TrainingDocument.assistant_id == assistant_id)
+        await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id.in_(doc_ids)))
+        await db.execute(delete(TrainingDocument).where(TrainingDocument.assistant_id == assistant_id))
+        await db.execute(delete(KnowledgeBaseVersion).where(KnowledgeBaseVersion.assistant_id == assistant_id))
+        await db.execute(delete(Assistant).where(Assistant.id == assistant_id))
+        await db.commit()
+
+
+async def run_mode(assistant_id, mode: str, queries, targets, args) -> dict:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Assistant)
+            .where(Assistant.id == assistant_id)
+            .values(retrieval_config={"quantization": mode, "rescore_factor": args.rescore_factor})
+        )
+        await db.commit()
+        context_manager.invalidate_index(assistant_id)
+
+        start = time.perf_counter()
+        index = await context_manager._get_index(db, assistant_id)
+        build_s = time.perf_counter() - start
+
+        latencies, hits, reciprocal_ranks = [], 0, []
+        for query, target in zip(queries, targets):
+            start = time.perf_counter()
+            chunks = await context_manager._search_similar_chunks(db, assistant_id, query, limit=args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            ranked = [chunk_position(chunk.id) for chunk in chunks]
+            if target in ranked:
+                hits += 1
+                reciprocal_ranks.append(1 / (ranked.index(target) + 1))
+            else:
+                reciprocal_ranks.append(0.0)
+
+        # Full pipeline (query embedding, search, re-ranking, packing); latency only
+        context_latencies = []
+        for i in range(args.context_queries):
+            start = time.perf_counter()
+            await context_manager.get_relevant_context(db, assistant_id, f"benchmark query {i}")
+            context_latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "quantization": mode,
+        "rescore_factor": None if mode == "none" else args.rescore_factor,
+        "index_build_seconds": round(build_s, 3),
+        "index_memory_bytes": index.memory_bytes(),
+        f"recall@{args.k}": round(hits / len(targets), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "search_latency_ms": percentiles(latencies),
+        "context_latency_ms": percentiles(context_latencies),
+    }
+
+
+async def main(args) -> dict:
+    corpus = SyntheticCorpus(args.chunks, args.dim, args.clusters, args.seed)
+    queries, targets = corpus.queries(args.queries, args.seed + 1)
+
+    created = await create_assistant(corpus, args.chunks_per_document)
+    assistant_id = created["assistant_id"]
+    try:
+        results = [
+            await run_mode(assistant_id, mode, queries, targets, args)
+            for mode in args.quantization
+        ]
+    finally:
+        context_manager.invalidate_index(assistant_id)
+        if not args.keep:
+            await drop_assistant(assistant_id)
+
+    return {
+        "corpus": {
+            "chunks": args.chunks,
+            "dim": args.dim,
+            "clusters": args.clusters,
+            "chunks_per_document": args.chunks_per_document,
+            "seed": args.seed,
+        },
+        "queries": len(targets),
+        "k": args.k,
+        "ingestion": created["ingestion"],
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark")
+    parser.add_argument("--chunks", type=int, default=10_000, help="corpus size (10k to 5M)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--chunks-per-document", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--context-queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATION_MODES, default=list(QUANTIZATION_MODES))
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark assistant and its chunks")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"✅ Wrote {args.output}")
+    else:
+        print(report)
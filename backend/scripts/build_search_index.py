@@ -0,0 +1,16 @@
+import argparse
+import asyncio
+
+from app.core.chat_search import chat_search
+
+
+async def main(args):
+    indexed = await chat_search.backfill(batch_size=args.batch_size, pause_seconds=args.pause)
+    print(f"✅ {indexed} messages indexed for search")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index stored messages that have no search entry yet")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between batches")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,25 @@
+import argparse
+import asyncio
+
+from app.core.message_codec import message_codec
+
+
+async def main(args):
+    totals = await message_codec.recompress_messages(
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        retrain=args.retrain,
+    )
+    ratio = totals["bytes_before"] / totals["bytes_after"] if totals["bytes_after"] else 1.0
+    print(
+        f"✅ {totals['rows']} messages and {totals['threads']} threads sealed, "
+        f"{totals['bytes_before']} -> {totals['bytes_after']} bytes ({ratio:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress and encrypt stored message content in place")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between batches")
+    parser.add_argument("--retrain", action="store_true", help="train new dictionaries first")
+    asyncio.run(main(parser.parse_args()))
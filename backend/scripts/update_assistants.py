@@ -4,6 +4,7 @@ import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 
+from app.core.assistant_registry import assistant_registry
 from app.core.database import AsyncSessionLocal
 from app.models.assistant import Assistant
 
@@ -56,6 +57,8 @@ OLD_NAMES = {"General Assistant", "IT Support", "HR Assistant", "Sales Helper"}
 
 async def main():
     async with AsyncSessionLocal() as db:  # type: AsyncSession
+        before = set((await db.execute(select(Assistant.id))).scalars().all())
+
         # Delete known old assistants by name
         for name in OLD_NAMES:
             await db.execute(delete(Assistant).where(Assistant.name == name))
@@ -87,6 +90,11 @@ async def main():
                 db.add(asst)
 
         await db.commit()
+
+        # Running gateway workers cache assistant definitions
+        after = set((await db.execute(select(Assistant.id))).scalars().all())
+        for assistant_id in before | after:
+            await assistant_registry.invalidate(db, assistant_id)
         print("✅ Assistants set updated")
 
 